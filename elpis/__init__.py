@@ -60,18 +60,22 @@ def create_app(test_config=None):
     # the app.config, however, this would need to change for multi-user.
     # Each user would require a unique Interface. One Interface
     # stores all the artifacts that user has generated.
+    # STATE_STORE ("json" or "sqlite") chooses where object configs are kept
+    # when a new interface is made, see Interface.
+    load_dotenv()
+    state_store = os.environ.get('STATE_STORE')
+    app.config['STATE_STORE'] = state_store
     interface_path = Path(os.path.join(elpis_path, '/state'))
     if not interface_path.exists():
-        app.config['INTERFACE'] = Interface(interface_path)
+        app.config['INTERFACE'] = Interface(interface_path, state_store=state_store)
     else:
-        app.config['INTERFACE'] = Interface(interface_path, use_existing=True)
+        app.config['INTERFACE'] = Interface(interface_path, use_existing=True, state_store=state_store)
     # app.config['CURRENT_DATASET'] = None # not okay for multi-user
     # app.config['CURRENT_PRON_DICT'] = None # not okay for multi-user & need to remove later because it is Kaldi-specific.
     # app.config['CURRENT_MODEL'] = None # not okay for multi-user
     # app.config['CURRENT_TRANSCRIPTION'] = None  # not okay for multi-user
 
     # Developer-friendly mode has convenient interface widgets for setting engine etc
-    load_dotenv()
     app.config['DEV_MODE'] = os.environ.get('DEV_MODE')
 
     # add the endpoints routes
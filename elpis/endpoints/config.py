@@ -11,7 +11,8 @@ bp = Blueprint("config", __name__, url_prefix="/config")
 @bp.route("/reset", methods=['GET', 'POST'])
 def reset():
     current_interface_path = app.config['INTERFACE'].path
-    app.config['INTERFACE'] = Interface(current_interface_path)
+    # Keep the state store the app was started with (see create_app)
+    app.config['INTERFACE'] = Interface(current_interface_path, state_store=app.config.get('STATE_STORE'))
     data = {
         "message": "reset ok"
     }
@@ -133,6 +133,41 @@ def settings(dataset: Dataset):
     })
 
 
+@bp.route("/audio-format", methods=['GET', 'POST'])
+@require_dataset
+def audio_format(dataset: Dataset):
+    # Only edit if POST
+    if request.method == 'POST':
+        try:
+            dataset.set_audio_format(rate=request.json.get('rate'), bits=request.json.get('bits'))
+        except ValueError as e:
+            return jsonify({
+                "status": 400,
+                "error": f'{e}'
+            })
+    data = {
+        'audio_format': dataset.audio_format
+    }
+    return jsonify({
+        "status": 200,
+        "data": data
+    })
+
+
+@bp.route("/stats", methods=['GET'])
+@require_dataset
+def stats(dataset: Dataset):
+    if not dataset.has_been_processed:
+        return jsonify({
+            "status": 400,
+            "error": "Dataset has not been prepared"
+        })
+    return jsonify({
+        "status": 200,
+        "data": dataset.stats
+    })
+
+
 @bp.route("/import/ui", methods=['GET', 'POST'])
 @require_dataset
 def settings_ui(dataset: Dataset):
@@ -5,3 +5,13 @@ class InterfaceError(Exception):
             self.human_message = message
         else:
             self.human_message = human_message
+
+
+class ResampleError(Exception):
+    """
+    Raised when sox fails to resample (or times out on) one or more files.
+    """
+    def __init__(self, message, failures=None):
+        super().__init__(message)
+        # audio path -> reason
+        self.failures = failures or {}
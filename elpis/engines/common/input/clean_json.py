@@ -16,15 +16,131 @@ Contributors:
 """
 
 import os
-import re
 import sys
 import nltk
 from argparse import ArgumentParser
+from functools import lru_cache
 from langid.langid import LanguageIdentifier, model
 from nltk.corpus import words
-from typing import Dict, List, Set
+from typing import Container, Dict, Iterable, List, Optional, Set
+from .english_lexicon import ENGLISH_LEXICON_PATH, Lexicon, build_lexicon
 from ..utilities import load_json_file, write_data_to_json_file
 
+# Where English words come from: the lexicon bundled with Elpis ("lexicon",
+# see english_lexicon), or the nltk words corpus ("nltk", downloaded if not
+# available, which needs internet). Can be set with the ELPIS_ENGLISH_WORDS
+# environment variable.
+ENGLISH_WORDS_SOURCE = os.environ.get('ELPIS_ENGLISH_WORDS', 'lexicon')
+
+
+class Cleaner(object):
+    """
+    Cleans utterances like clean_json_utterance, with everything that only
+    depends on the settings done once: a translate table for the punctuation,
+    frozen sets for the special cases and translation tags, and the English
+    word list and language identifier if English is removed.
+    """
+    def __init__(self,
+                 punctuation_to_collapse_by: str = '',
+                 punctuation_to_explode_by: str = '',
+                 special_cases: Iterable[str] = frozenset(),
+                 translation_tags: Iterable[str] = frozenset(),
+                 remove_english: bool = False,
+                 use_langid: bool = False,
+                 english_words_source: Optional[str] = None):
+        """
+        :param punctuation_to_collapse_by: punctuation marks to strip.
+        :param punctuation_to_explode_by: punctuation marks to replace with spaces.
+        :param special_cases: words to always remove from the output.
+        :param translation_tags: tags that exclude the utterances they are in.
+        :param remove_english: whether or not to remove English from the utterances.
+        :param use_langid: whether or not to use the langid library to identify English to remove.
+        :param english_words_source: where English words come from, see get_english_words.
+        """
+        self.punctuation_table = punctuation_table(punctuation_to_collapse_by, punctuation_to_explode_by)
+        self.special_cases = frozenset(special_cases)
+        self.translation_tags = frozenset(translation_tags)
+        self.remove_english = remove_english
+        self.use_langid = use_langid
+        self.english_words = get_english_words(english_words_source) if remove_english else frozenset()
+        # Words repeat a lot, remember the recent lexicon lookups
+        self._is_english_word = lru_cache(maxsize=1 << 16)(self.english_words.__contains__)
+        self.langid_identifier = get_langid_identifier() if remove_english and use_langid else None
+
+    @classmethod
+    def from_settings(cls, settings: Dict, remove_english: bool = False, use_langid: bool = False) -> 'Cleaner':
+        """
+        Make a cleaner from importer settings, where the special cases and
+        translation tags are one per line.
+        """
+        return cls(punctuation_to_collapse_by=settings['punctuation_to_collapse_by'],
+                   punctuation_to_explode_by=settings['punctuation_to_explode_by'],
+                   special_cases=settings['special_cases'].splitlines(),
+                   translation_tags=settings['translation_tags'].splitlines(),
+                   remove_english=remove_english,
+                   use_langid=use_langid)
+
+    def clean_transcript(self, transcript: str) -> str:
+        """
+        :return: the cleaned transcript, empty if the utterance should be left out.
+        """
+        cleaned_transcript = self._clean_words(transcript)
+        if cleaned_transcript and self.langid_identifier is not None:
+            if is_english(cleaned_transcript, self.langid_identifier):
+                return ''
+        return cleaned_transcript
+
+    def _clean_words(self, transcript: str) -> str:
+        """
+        Clean the words of the transcript, and leave it out for special cases,
+        translation tags or English words, but not (yet) if langid finds it
+        is English.
+        """
+        clean_words = []
+        english_word_count = 0
+        for word in transcript.lower().split():
+            if word in self.special_cases:
+                continue
+            if self.remove_english and len(word) > 3 and self._is_english_word(word):
+                english_word_count += 1
+                continue
+            if word in self.translation_tags:
+                return ''
+            # Word is ok to use, now clean it
+            clean_words.append(word.translate(self.punctuation_table))
+        if are_words_valid(clean_words, english_word_count, self.remove_english, use_langid=False):
+            return " ".join(clean_words).strip()
+        return ''
+
+    def clean(self, utterance: Dict[str, str]) -> Dict[str, str]:
+        """
+        Clean the transcript of the utterance, in place.
+
+        :return: the utterance.
+        """
+        utterance['transcript'] = self.clean_transcript(utterance.get('transcript'))
+        return utterance
+
+    def clean_many(self, utterances: Iterable[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Clean the transcripts of the utterances, in place.
+
+        :return: the utterances.
+        """
+        clean_words = self._clean_words
+        cleaned = []
+        for utterance in utterances:
+            utterance['transcript'] = clean_words(utterance.get('transcript'))
+            cleaned.append(utterance)
+        if self.langid_identifier is not None:
+            # Then leave out what langid finds is English, as a stage over all of them
+            remaining = [utterance for utterance in cleaned if utterance['transcript']]
+            for utterance, english in zip(remaining, are_english([utterance['transcript'] for utterance in remaining],
+                                                                 self.langid_identifier)):
+                if english:
+                    utterance['transcript'] = ''
+        return cleaned
+
 
 def clean_utterance(utterance: Dict[str, str],
                     punctuation_to_collapse_by: str = '',
@@ -47,6 +163,8 @@ def clean_utterance(utterance: Dict[str, str],
     # TODO add interface setting to include user specific tags
     # translation_tags = {"@eng@", "<ind:", "<eng:"}
     # TODO add interface setting to skip this as caps are significant in some languages
+    if remove_english and english_words is None:
+        english_words = get_english_words()
     utterance_string = utterance.get("transcript").lower()
     dirty_words = utterance_string.split()
     clean_words = []
@@ -67,26 +185,86 @@ def clean_utterance(utterance: Dict[str, str],
     return clean_words, english_word_count
 
 
-def get_english_words() -> Set[str]:
+def get_nltk_english_words() -> Set[str]:
     """
-    Gets a list of English words from the nltk corpora (~235k words).
-    N.B: will download the word list if not already available (~740kB), requires internet.
-    :return: a set containing the English words
+    The nltk words corpus (N.B: will download the word list if not already
+    available (~740kB), requires internet).
     """
     nltk.download("words")  # Will only download if not locally available.
-    return set(words.words())
+    return frozenset(words.words())
+
+
+@lru_cache(maxsize=None)
+def get_english_words(source: Optional[str] = None) -> Container[str]:
+    """
+    Gets the English words (~235k words), from the bundled lexicon by default,
+    looked up in place. Opened once per process, on first use.
+
+    Installs that do not have the lexicon (it is built from the nltk words
+    corpus, see english_lexicon) fall back to the nltk words corpus, and
+    build the lexicon from it for next time if the package directory is
+    writable.
+    :param source: "lexicon" for the bundled lexicon, or "nltk" for the nltk
+        words corpus as a set (see get_nltk_english_words).
+        ENGLISH_WORDS_SOURCE if None.
+    :return: the English words, supporting `in`
+    """
+    source = source or ENGLISH_WORDS_SOURCE
+    if source == 'nltk':
+        return get_nltk_english_words()
+    if source != 'lexicon':
+        raise ValueError(f'unknown English words source "{source}", use "lexicon" or "nltk"')
+    try:
+        return Lexicon(ENGLISH_LEXICON_PATH)
+    except FileNotFoundError:
+        pass
+    print(f'WARNING: English lexicon {ENGLISH_LEXICON_PATH} not found, using the nltk words corpus. '
+          f'Build it with python -m elpis.engines.common.input.english_lexicon', file=sys.stderr)
+    english_words = get_nltk_english_words()
+    try:
+        build_lexicon(english_words, ENGLISH_LEXICON_PATH)
+    except OSError as error:
+        print(f'WARNING: could not build the English lexicon: {error}', file=sys.stderr)
+    return english_words
+
+
+@lru_cache(maxsize=None)
+def get_langid_identifier() -> LanguageIdentifier:
+    """
+    The langid language identifier, deserialised from its model once per
+    process, on first use.
+    """
+    return LanguageIdentifier.from_modelstring(model, norm_probs=True)
+
+
+def is_english(transcript: str, langid_identifier: Optional[LanguageIdentifier] = None) -> bool:
+    """
+    Whether langid finds the transcript is English (with a probability over 0.5).
+    """
+    lang, prob = (langid_identifier or get_langid_identifier()).classify(transcript)
+    return lang == "en" and prob > 0.5
+
+
+def are_english(transcripts: Iterable[str], langid_identifier: Optional[LanguageIdentifier] = None) -> List[bool]:
+    """
+    is_english for many transcripts, with the identifier looked up once.
+    """
+    langid_identifier = langid_identifier or get_langid_identifier()
+    return [is_english(transcript, langid_identifier) for transcript in transcripts]
 
 
 def are_words_valid(clean_words: List[str],
                     english_word_count: int,
                     remove_english: bool,
-                    use_langid: bool) -> bool:
+                    use_langid: bool,
+                    langid_identifier: LanguageIdentifier = None) -> bool:
     """
     Determines whether a list of words is valid based on the provided parameters.
     :param clean_words: a list of clean word strings.
     :param english_word_count: the number of english words removed from the string during cleaning.
     :param remove_english: whether or not to remove english words.
     :param use_langid: whether or not to use the langid library to determine if a word is English.
+    :param langid_identifier: the langid identifier to use, get_langid_identifier() if None.
     :return: True if utterance is valid, False otherwise.
     """
     # Exclude utterance if empty after cleaning
@@ -100,11 +278,8 @@ def are_words_valid(clean_words: List[str],
         return False
 
     # Exclude utterance if langid thinks its english
-    if remove_english and use_langid:
-        langid_identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
-        lang, prob = langid_identifier.classify(cleaned_transcription)
-        if lang == "en" and prob > 0.5:
-            return False
+    if remove_english and use_langid and is_english(cleaned_transcription, langid_identifier):
+        return False
     return True
 
 
@@ -129,35 +304,13 @@ def clean_json_utterance(utterance: Dict[str, str],
 
     # TODO make this an interface setting
     # special_cases = ["<silence>"]  # Any words you want to ignore
-
-    if remove_english:
-        english_words = get_english_words()  # pre-load English corpus
-    else:
-        english_words = set()
-
-    # Clean the text in the dict, returns a list of cleaned words
-    clean_words, english_word_count = \
-        clean_utterance(utterance=utterance,
-                        punctuation_to_collapse_by=punctuation_to_collapse_by,
-                        punctuation_to_explode_by=punctuation_to_explode_by,
-                        special_cases=special_cases,
-                        translation_tags=translation_tags,
-                        remove_english=remove_english,
-                        english_words=english_words
-                        )
-
-    # Check that the cleaned words are valid (ie, not null, not English etc)
-    if are_words_valid(clean_words,
-                       english_word_count,
-                       remove_english,
-                       use_langid):
-        cleaned_transcript = " ".join(clean_words).strip()
-    else:
-        # TODO is it best to return an empty str here or raise an error?
-        cleaned_transcript = ""
-
-    utterance['transcript'] = cleaned_transcript
-    return utterance
+    cleaner = Cleaner(punctuation_to_collapse_by=punctuation_to_collapse_by,
+                      punctuation_to_explode_by=punctuation_to_explode_by,
+                      special_cases=special_cases,
+                      translation_tags=translation_tags,
+                      remove_english=remove_english,
+                      use_langid=use_langid)
+    return cleaner.clean(utterance)
 
 
 def clean_json_data(json_data: List[Dict[str, str]],
@@ -179,30 +332,29 @@ def clean_json_data(json_data: List[Dict[str, str]],
     :param use_langid: whether or not to use the langid library to identify English to remove.
     :return: list of cleaned utterances (dictionaries).
     """
-    json_data_cleaned = []
-    for utterance in json_data:
-        utterance_cleaned = clean_json_utterance(utterance,
-                                                 punctuation_to_collapse_by=punctuation_to_collapse_by,
-                                                 punctuation_to_explode_by=punctuation_to_explode_by,
-                                                 special_cases=special_cases,
-                                                 translation_tags=translation_tags,
-                                                 remove_english=remove_english,
-                                                 use_langid=use_langid)
-        json_data_cleaned.append(utterance_cleaned)
-    return json_data_cleaned
+    cleaner = Cleaner(punctuation_to_collapse_by=punctuation_to_collapse_by,
+                      punctuation_to_explode_by=punctuation_to_explode_by,
+                      special_cases=special_cases,
+                      translation_tags=translation_tags,
+                      remove_english=remove_english,
+                      use_langid=use_langid)
+    return cleaner.clean_many(json_data)
 
 
 def extract_additional_corpora(additional_corpus: str = '',
                                corpus_txt: str = '',
                                punctuation_to_collapse_by: str = '',
-                               punctuation_to_explode_by: str = '') -> None:
+                               punctuation_to_explode_by: str = '') -> Set[str]:
     """
     Takes a text file, extracts all sentences and writes them to the main corpus file.
     :param additional_corpus: the path to a plaintext file to extract additional sentences/lines from
     :param corpus_txt: the path to the compiled corpus.txt file
     :param punctuation_to_collapse_by: punctuation marks to strip
     :param punctuation_to_explode_by: punctuation marks to replace with spaces
+    :return: the words of the sentences written
     """
+    words_written = set()
+    table = punctuation_table(punctuation_to_collapse_by, punctuation_to_explode_by)
     print("corpus_txt", corpus_txt)
     if os.path.exists(corpus_txt):
         write_mode = 'a'  # append if already exists
@@ -214,16 +366,15 @@ def extract_additional_corpora(additional_corpus: str = '',
             with open(additional_corpus, "r", encoding="utf-8", ) as file_:
                 for line in file_.readlines():
                     # clean the text along the way
-                    line = \
-                        deal_with_punctuation(text=line,
-                                              punctuation_to_collapse_by=punctuation_to_collapse_by,
-                                              punctuation_to_explode_by=punctuation_to_explode_by)
+                    line = line.translate(table)
                     if not line.endswith('\n'):
                         line = line + '\n'
                     corpus_txt_file.writelines(line)
+                    words_written.update(line.split())
         else:
             print(f"Provided additional text additional_corpus file path invalid: "
                   f"{additional_corpus}")
+    return words_written
 
 
 def deal_with_punctuation(text: str = '',
@@ -236,16 +387,22 @@ def deal_with_punctuation(text: str = '',
     :param punctuation_to_explode_by: punctuation marks to replace with spaces
     :return: cleaned text
     """
-    new_text: str = text
-    # Prioritise exploding first, these are punctuation marks that the user sets
-    if punctuation_to_explode_by:
-        pattern_to_explode_by = re.escape(punctuation_to_explode_by)
-        new_text = re.sub(rf"[{pattern_to_explode_by}]", " ", new_text)
-    # Then strip the rest
-    if punctuation_to_collapse_by:
-        pattern_to_collapse_by = re.escape(punctuation_to_collapse_by)
-        new_text = re.sub(rf"[{pattern_to_collapse_by}]", "", new_text)
-    return new_text
+    return text.translate(punctuation_table(punctuation_to_collapse_by, punctuation_to_explode_by))
+
+
+@lru_cache(maxsize=32)
+def punctuation_table(punctuation_to_collapse_by: str = '',
+                      punctuation_to_explode_by: str = '') -> Dict[int, str]:
+    """
+    Translate table (for str.translate) that replaces the punctuation marks
+    to explode by with spaces and strips the punctuation marks to collapse by,
+    exploding first like deal_with_punctuation always did: a mark in both is
+    replaced by a space, unless spaces are collapsed too.
+    """
+    table = {ord(mark): None for mark in punctuation_to_collapse_by}
+    space = None if ' ' in punctuation_to_collapse_by else ' '
+    table.update({ord(mark): space for mark in punctuation_to_explode_by})
+    return table
 
 
 def main() -> None:
@@ -0,0 +1,140 @@
+"""
+Everything Dataset.process derives from the annotations, gathered in a single
+pass over them, including the stats index served by /dataset/stats.
+"""
+
+import contextlib
+import json
+import wave
+from bisect import bisect_right
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+# Lower edges of the segment length histogram bins, the last bin is open.
+SEGMENT_DURATION_BINS_MS = [0, 1000, 2000, 5000, 10000, 20000, 30000]
+SEGMENT_TOKEN_BINS = [0, 1, 2, 5, 10, 20, 50]
+
+
+class AnnotationSummary(object):
+    """
+    Word counts and per speaker and per audio file statistics of annotations,
+    added one at a time.
+    """
+    def __init__(self):
+        self.word_counts: Counter = Counter()
+        # speaker id / audio file name -> utterances, tokens and duration_ms
+        self.speakers: Dict[str, Dict[str, int]] = {}
+        self.files: Dict[str, Dict[str, int]] = {}
+        self.duration_histogram: List[int] = [0] * len(SEGMENT_DURATION_BINS_MS)
+        self.token_histogram: List[int] = [0] * len(SEGMENT_TOKEN_BINS)
+
+    def add(self, annotation: Dict) -> None:
+        words = annotation['transcript'].split()
+        self.word_counts.update(words)
+        duration = max(0, int(annotation.get('stop_ms', 0)) - int(annotation.get('start_ms', 0)))
+        self.duration_histogram[bisect_right(SEGMENT_DURATION_BINS_MS, duration) - 1] += 1
+        self.token_histogram[bisect_right(SEGMENT_TOKEN_BINS, len(words)) - 1] += 1
+        for key, table in ((annotation.get('speaker_id', ''), self.speakers),
+                           (annotation.get('audio_file_name', ''), self.files)):
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = {'utterances': 0, 'tokens': 0, 'duration_ms': 0}
+            stats['utterances'] += 1
+            stats['tokens'] += len(words)
+            stats['duration_ms'] += duration
+
+    def add_all(self, annotations: Iterable[Dict]) -> 'AnnotationSummary':
+        for annotation in annotations:
+            self.add(annotation)
+        return self
+
+    def write_word_list(self, file_path: Path, additional_words: Set[str] = frozenset()) -> None:
+        """
+        Write the words of the annotations and the additional words, sorted,
+        one per line.
+        """
+        word_list = sorted(additional_words.union(self.word_counts))
+        with open(file_path, 'w', encoding='utf-8') as fout:
+            fout.writelines(f'{word}\n' for word in word_list)
+
+    def write_word_counts(self, file_path: Path) -> None:
+        with open(file_path, 'w') as fout:
+            json.dump(self.word_counts, fout)
+
+    def stats(self, audio_directory: Optional[Path] = None,
+              vocabulary: Optional[Set[str]] = None) -> Dict:
+        """
+        The stats index of the annotations.
+
+        :param audio_directory: directory of the (resampled) audio files, to
+            add the length of each file to its stats.
+        :param vocabulary: words the language model knows besides the
+            transcriptions (additional word list and corpora), to give the
+            rate of tokens out of it. None if there are none.
+        """
+        utterances = sum(stats['utterances'] for stats in self.files.values())
+        tokens = sum(self.word_counts.values())
+        duration_ms = sum(stats['duration_ms'] for stats in self.files.values())
+        files = {}
+        for name, stats in self.files.items():
+            files[name] = dict(stats)
+            if audio_directory is not None:
+                files[name]['audio_ms'] = audio_length_ms(Path(audio_directory).joinpath(name))
+        oov_rate = None
+        if vocabulary and tokens:
+            oov_tokens = sum(count for word, count in self.word_counts.items() if word not in vocabulary)
+            oov_rate = oov_tokens / tokens
+        return {
+            'totals': {
+                'files': len(self.files),
+                'speakers': len(self.speakers),
+                'utterances': utterances,
+                'tokens': tokens,
+                'types': len(self.word_counts),
+                'duration_ms': duration_ms,
+                'audio_ms': sum(stats.get('audio_ms') or 0 for stats in files.values()),
+                'mean_segment_ms': duration_ms / utterances if utterances else 0,
+                'oov_rate': oov_rate
+            },
+            'speakers': self.speakers,
+            'files': files,
+            'segment_duration_ms': {
+                'bins': SEGMENT_DURATION_BINS_MS,
+                'counts': self.duration_histogram
+            },
+            'segment_tokens': {
+                'bins': SEGMENT_TOKEN_BINS,
+                'counts': self.token_histogram
+            }
+        }
+
+    def write_stats(self, file_path: Path, audio_directory: Optional[Path] = None,
+                    vocabulary: Optional[Set[str]] = None) -> None:
+        with open(file_path, 'w') as fout:
+            json.dump(self.stats(audio_directory, vocabulary), fout)
+
+
+def audio_length_ms(file_path: Path) -> Optional[int]:
+    """
+    The length of a WAV file, read from its header, or None if it is not
+    a readable WAV file.
+    """
+    try:
+        with contextlib.closing(wave.open(f'{file_path}', 'rb')) as fin:
+            return fin.getnframes() * 1000 // fin.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+def read_words(file_path: Path) -> Set[str]:
+    """
+    The words in a text file (such as an additional word list), or none if
+    the file does not exist.
+    """
+    words = set()
+    if Path(file_path).is_file():
+        with open(file_path, 'r', encoding='utf-8') as fin:
+            for line in fin:
+                words.update(line.split())
+    return words
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+"""
+A compact, read-only word list for English filtering (see
+clean_json.get_english_words), looked up in place through mmap instead of
+being loaded into a Python set.
+
+The lexicon file is:
+    8 bytes      magic (LEXICON_MAGIC)
+    uint32       number of words (n)
+    uint32[n+1]  offsets of the words in the words block, and its length
+    bytes        the words, UTF-8 encoded, sorted (as bytes) and unique
+all integers little-endian. Lookups binary search the offsets, so only the
+pages they touch are read, and opening the file takes no time.
+
+The English lexicon bundled with Elpis (ENGLISH_LEXICON_PATH) is built from
+the nltk words corpus (or another word list, one word per line) with:
+
+python -m elpis.engines.common.input.english_lexicon [--words FILE] [--output PATH]
+
+The Docker image builds it when it is made. Other installs build it the first
+time English words are needed (see clean_json.get_english_words).
+"""
+
+import mmap
+import os
+import struct
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Iterable, Union
+
+LEXICON_MAGIC = b'ELPISLEX'
+ENGLISH_LEXICON_PATH = Path(__file__).parent.joinpath('english_words.lexicon')
+
+_COUNT = struct.Struct('<I')
+_HEADER_SIZE = len(LEXICON_MAGIC) + _COUNT.size
+
+
+def build_lexicon(words: Iterable[str], file_path: Union[str, Path]) -> int:
+    """
+    Write a lexicon of the words to file_path.
+
+    :return: the number of (unique) words written.
+    """
+    encoded = sorted({word.encode('utf-8') for word in words})
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    file_path = Path(file_path)
+    temporary_path = file_path.with_name(f'.{file_path.name}.tmp')
+    with temporary_path.open(mode='wb') as fout:
+        fout.write(LEXICON_MAGIC)
+        fout.write(_COUNT.pack(len(encoded)))
+        fout.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        for word in encoded:
+            fout.write(word)
+    os.replace(temporary_path, file_path)
+    return len(encoded)
+
+
+class Lexicon(object):
+    """
+    A lexicon file (see build_lexicon) opened for lookups, supporting `in`
+    and len() like the set of its words.
+    """
+    def __init__(self, file_path: Union[str, Path]):
+        """
+        :raises:
+            FileNotFoundError: if there is no file at file_path.
+            ValueError: if the file is not a lexicon.
+        """
+        self.path = Path(file_path)
+        with self.path.open(mode='rb') as fin:
+            self._map = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(LEXICON_MAGIC)] != LEXICON_MAGIC:
+            self._map.close()
+            raise ValueError(f'{self.path} is not a lexicon file')
+        self._count = _COUNT.unpack_from(self._map, len(LEXICON_MAGIC))[0]
+        self._words_start = _HEADER_SIZE + (self._count + 1) * _COUNT.size
+        if sys.byteorder == 'little':
+            # Read the offsets in place, much faster than unpacking them
+            self._offsets = memoryview(self._map)[_HEADER_SIZE:self._words_start].cast('I')
+        else:
+            self._offsets = struct.unpack_from(f'<{self._count + 1}I', self._map, _HEADER_SIZE)
+        self._words = memoryview(self._map)[self._words_start:]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _word(self, index: int) -> bytes:
+        return bytes(self._words[self._offsets[index]:self._offsets[index + 1]])
+
+    def __contains__(self, word: str) -> bool:
+        key = word.encode('utf-8')
+        offsets, words = self._offsets, self._words
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_word = words[offsets[middle]:offsets[middle + 1]]
+            if middle_word == key:
+                return True
+            if bytes(middle_word) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._word(index).decode('utf-8')
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._words.release()
+        self._map.close()
+
+
+def main():
+    parser = ArgumentParser(description='Build the English lexicon used to filter out English words.')
+    parser.add_argument('-w', '--words',
+                        type=str,
+                        help='Word list (one word per line) to build the lexicon from, '
+                             'the nltk words corpus by default (downloaded if needed).')
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        default=f'{ENGLISH_LEXICON_PATH}',
+                        help='Where to write the lexicon.')
+    arguments = parser.parse_args()
+    if arguments.words:
+        with open(arguments.words, encoding='utf-8') as fin:
+            words = [line.strip() for line in fin if line.strip()]
+    else:
+        import nltk
+        nltk.download('words')
+        from nltk.corpus import words as nltk_words
+        words = nltk_words.words()
+    count = build_lexicon(words, arguments.output)
+    print(f'Wrote {count} words to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -14,8 +14,8 @@ Contributors:
 import argparse
 import os
 import sys
-from typing import List, Dict
-from ..utilities import load_json_file
+from typing import Dict, Iterable, List
+from ..utilities import iter_annotations
 
 
 def save_word_list(word_list: List[str], file_name: str) -> None:
@@ -30,18 +30,16 @@ def save_word_list(word_list: List[str], file_name: str) -> None:
         print(f"Wrote word list to {file_name}")
 
 
-def extract_word_list(json_data: List[Dict[str, str]]) -> List[str]:
+def extract_word_list(json_data: Iterable[Dict[str, str]]) -> List[str]:
     """
-    Unpack a dictionary constructed from a json_file - containing the key
+    Unpack dictionaries constructed from a json_file - containing the key
     "transcript" - into a (Python) list of words.
-    :param json_data: Python list of dictionaries read from a JSON file.
+    :param json_data: Python dictionaries read from a JSON file, one at a time.
     :return: list of unique words from data, sorted alphabetically.
     """
-    result: List[str] = []
+    result = set()
     for utterance in json_data:
-        words = utterance.get("transcript").split()
-        result.extend(words)
-    result = list(set(result))
+        result.update(utterance.get("transcript").split())
     return sorted(result)
 
 
@@ -78,7 +76,7 @@ def generate_word_list(transcription_file: str,
     :param additional_corpus_txt: file path to the additional corpus text
     :return:
     """
-    json_data: List[Dict[str, str]] = load_json_file(transcription_file)
+    json_data: Iterable[Dict[str, str]] = iter_annotations(transcription_file)
 
     print("Extracting word list(s)...", flush=True, file=sys.stderr)
 
@@ -97,8 +95,6 @@ def generate_word_list(transcription_file: str,
     # Remove duplicates
     word_list = list(set(word_list))
 
-    print(sorted(word_list))
-
     print(f"Writing wordlist to file...", flush=True, file=sys.stderr)
     save_word_list(word_list, output_file)
 
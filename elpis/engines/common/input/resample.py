@@ -1,11 +1,235 @@
+"""
+Resampling of audio to the format models are trained on.
+
+Audio is resampled in process (decoded with soundfile and resampled with
+polyphase filtering, a block at a time) when it can be, which avoids starting
+a sox process per file, and by sox otherwise, e.g. for formats soundfile
+cannot decode. The backend can be chosen with the ELPIS_RESAMPLER environment
+variable.
+"""
+
+import os
 import subprocess
-from ..utilities.globals import SOX_PATH
+import threading
+from math import ceil, gcd
 from pathlib import Path
+from typing import Callable, Dict, List
+
+from ..errors import ResampleError
+from ..utilities.globals import SOX_PATH
+
+try:
+    import numpy
+    import soundfile
+    from scipy.signal import resample_poly
+except ImportError:
+    soundfile = None
+
+
+# Format audio is resampled to, as sox options: bits per sample, channels and
+# sample rate.
+RESAMPLE_FORMAT = {'bits': 16, 'channels': 1, 'rate': 44100}
+
+# Bit depths audio can be resampled to, with their soundfile WAV subtypes.
+WAV_SUBTYPES = {8: 'PCM_U8', 16: 'PCM_16', 24: 'PCM_24', 32: 'PCM_32'}
+
+# Seconds sox may take to resample one file. Can be set with the
+# ELPIS_SOX_TIMEOUT environment variable.
+SOX_TIMEOUT = float(os.environ.get('ELPIS_SOX_TIMEOUT', 600))
+
+# Frames of audio resampled in process at a time, so that memory use does
+# not depend on the length of the recordings. Can be set with the
+# ELPIS_RESAMPLE_BLOCK_FRAMES environment variable.
+RESAMPLE_BLOCK_FRAMES = int(os.environ.get('ELPIS_RESAMPLE_BLOCK_FRAMES', 2 ** 20))
+
+# Memory (in bytes) all the files resampled in process at the same time may
+# use together. Files wait for memory to be free before being resampled. Can
+# be set with the ELPIS_IN_PROCESS_MEMORY environment variable.
+IN_PROCESS_MEMORY = int(os.environ.get('ELPIS_IN_PROCESS_MEMORY', 1024 ** 3))
+
+
+class UnsupportedAudio(Exception):
+    """
+    Raised by a resampler backend for audio it cannot resample.
+    """
+
+
+def make_audio_format(rate: int = None, bits: int = None, channels: int = None) -> Dict[str, int]:
+    """
+    Audio format to resample to, the parts not given are from RESAMPLE_FORMAT.
+
+    :raises:
+        ValueError: if the rate, bit depth or number of channels is not valid.
+    """
+    audio_format = {
+        'bits': int(bits or RESAMPLE_FORMAT['bits']),
+        'channels': int(channels or RESAMPLE_FORMAT['channels']),
+        'rate': int(rate or RESAMPLE_FORMAT['rate'])
+    }
+    if audio_format['bits'] not in WAV_SUBTYPES:
+        raise ValueError(f"bit depth must be one of {list(WAV_SUBTYPES)}, not {audio_format['bits']}")
+    if not 8000 <= audio_format['rate'] <= 192000:
+        raise ValueError(f"sample rate must be between 8000 and 192000 Hz, not {audio_format['rate']}")
+    if audio_format['channels'] < 1:
+        raise ValueError(f"there must be at least one channel, not {audio_format['channels']}")
+    return audio_format
+
+
+def sox_format_arguments(audio_format: Dict[str, int]) -> List[str]:
+    return ["-b", str(audio_format['bits']), "-c", str(audio_format['channels']),
+            "-r", str(audio_format['rate']), "-t", "wav"]
+
+
+def run_sox(sox_arguments: List[str], output_path: str, timeout: float = None) -> None:
+    """
+    Run sox, removing its (partial) output if it fails or takes longer than
+    timeout seconds (SOX_TIMEOUT by default).
+
+    :raises:
+        ResampleError: if sox fails or times out.
+    """
+    try:
+        result = subprocess.run(sox_arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                timeout=timeout or SOX_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as error:
+        reason = f'{error}'
+    else:
+        if result.returncode == 0:
+            return
+        reason = f'sox exited with {result.returncode}: {result.stderr.decode(errors="replace").strip()}'
+    if os.path.exists(output_path):
+        os.unlink(output_path)
+    raise ResampleError(reason)
+
+
+def resample_with_sox(src_path: Path, dst_path: Path, audio_format: Dict[str, int]):
+    run_sox([SOX_PATH, f'{src_path}', *sox_format_arguments(audio_format), f'{dst_path}'], f'{dst_path}')
+
+
+class MemoryBudget(object):
+    """
+    Bytes of memory shared between threads: acquire(...) waits until enough
+    of the budget is free. A request for more than the whole budget waits
+    for all of it, so it runs alone rather than never.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self._free = size
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        """
+        :return: the size acquired, to release(...) when done.
+        """
+        size = min(size, self.size)
+        with self._condition:
+            self._condition.wait_for(lambda: self._free >= size)
+            self._free -= size
+        return size
+
+    def release(self, size: int):
+        with self._condition:
+            self._free += size
+            self._condition.notify_all()
+
+
+in_process_memory = MemoryBudget(IN_PROCESS_MEMORY)
+
+
+def resample_in_process(src_path: Path, dst_path: Path, audio_format: Dict[str, int],
+                        block_frames: int = None):
+    """
+    Decode, downmix, resample (with a polyphase filter) and write the audio
+    without starting a process.
+
+    The audio is resampled block_frames (RESAMPLE_BLOCK_FRAMES by default)
+    input frames at a time. Each block is read with enough of the audio
+    around it for the filter, and only the output of the block itself is
+    kept, so the result is the same as resampling the whole recording at
+    once. The memory the blocks need is taken from in_process_memory.
+
+    :raises:
+        UnsupportedAudio: if the audio cannot be decoded or has to be upmixed.
+    """
+    if soundfile is None:
+        raise UnsupportedAudio('soundfile, numpy or scipy is not installed')
+    try:
+        fin = soundfile.SoundFile(f'{src_path}')
+    except RuntimeError as error:
+        raise UnsupportedAudio(f'{error}')
+    with fin:
+        if fin.channels < audio_format['channels']:
+            raise UnsupportedAudio(f'{src_path} has fewer channels than {audio_format["channels"]}')
+        if not fin.seekable():
+            raise UnsupportedAudio(f'{src_path} cannot be read in blocks')
+        divisor = gcd(fin.samplerate, audio_format['rate'])
+        up, down = audio_format['rate'] // divisor, fin.samplerate // divisor
+        # Blocks and the audio around them start on multiples of down, so
+        # that each one starts on an output frame. resample_poly's filter
+        # reaches 10 * max(up, down) upsampled frames each side.
+        block_frames = max(down, (block_frames or RESAMPLE_BLOCK_FRAMES) // down * down)
+        context_frames = 0 if up == down else ceil((10 * max(up, down) / up + 2) / down) * down
+        chunk_frames = block_frames + 2 * context_frames
+        # The block as read, downmixed and resampled (in float64)
+        memory = in_process_memory.acquire(
+            ceil(chunk_frames * (4 * fin.channels + 8 * audio_format['channels'] * (1 + 2 * up / down))))
+        try:
+            _resample_blocks(fin, dst_path, audio_format, up, down, block_frames, context_frames)
+        finally:
+            in_process_memory.release(memory)
+
+
+def _resample_blocks(fin, dst_path: Path, audio_format: Dict[str, int], up: int, down: int,
+                     block_frames: int, context_frames: int):
+    total_frames = fin.frames
+    try:
+        with soundfile.SoundFile(f'{dst_path}', mode='w', samplerate=audio_format['rate'],
+                                 channels=audio_format['channels'],
+                                 subtype=WAV_SUBTYPES[audio_format['bits']], format='WAV') as fout:
+            for start in range(0, total_frames, block_frames):
+                end = min(start + block_frames, total_frames)
+                chunk_start = max(0, start - context_frames)
+                fin.seek(chunk_start)
+                data = fin.read(min(total_frames, end + context_frames) - chunk_start,
+                                dtype='float32', always_2d=True)
+                if audio_format['channels'] == 1:
+                    data = data.mean(axis=1, keepdims=True)
+                else:
+                    data = data[:, :audio_format['channels']]
+                if up != down:
+                    data = resample_poly(data, up, down, axis=0)
+                    offset = (start - chunk_start) * up // down
+                    data = data[offset:offset + ceil(end * up / down) - start * up // down]
+                numpy.clip(data, -1.0, 1.0, out=data)
+                fout.write(data)
+    except BaseException:
+        if os.path.exists(dst_path):
+            os.unlink(dst_path)
+        raise
+
+
+ResamplerType = Callable[[Path, Path, Dict[str, int]], None]
+
+RESAMPLERS: Dict[str, ResamplerType] = {
+    'numpy': resample_in_process,
+    'sox': resample_with_sox
+}
+
+# Backend tried first, sox is used for audio it does not support.
+RESAMPLER = os.environ.get('ELPIS_RESAMPLER', 'numpy')
+
 
+def resample(src_path: Path, dst_path: Path, audio_format: Dict[str, int] = None, backend: str = None):
+    """
+    Resample the audio at src_path to a WAV file at dst_path.
 
-def resample(src_path: Path, dst_path: Path):
-    src_path = Path(src_path)
-    dst_path = Path(dst_path)
-    sox_arguments = [SOX_PATH, f'{src_path}', "-b", "16", "-c", "1", "-r", "44.1k", "-t", "wav",
-                     f'{dst_path}']
-    subprocess.call(sox_arguments)
+    :param audio_format: bits, channels and rate to resample to, RESAMPLE_FORMAT by default.
+    :param backend: name of the resampler (see RESAMPLERS) to try first, RESAMPLER by default.
+    :raises:
+        ResampleError: if the audio could not be resampled.
+    """
+    audio_format = audio_format or RESAMPLE_FORMAT
+    try:
+        RESAMPLERS[backend or RESAMPLER](Path(src_path), Path(dst_path), audio_format)
+    except UnsupportedAudio:
+        resample_with_sox(Path(src_path), Path(dst_path), audio_format)
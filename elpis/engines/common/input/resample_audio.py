@@ -12,12 +12,16 @@ Contributors:
 import argparse
 import glob
 import os
-import subprocess
 import threading
 from multiprocessing.dummy import Pool
 from shutil import move
-from typing import Set, Tuple
-from ..utilities.globals import SOX_PATH
+from typing import Dict, Set, Tuple
+from .resample import resample
+
+
+# Number of files resampled at the same time, the number of available CPUs
+# if 0. Can be set with the ELPIS_RESAMPLE_WORKERS environment variable.
+RESAMPLE_WORKERS = int(os.environ.get('ELPIS_RESAMPLE_WORKERS', 0))
 
 
 def join_norm(p1, p2) -> str:
@@ -25,7 +29,8 @@ def join_norm(p1, p2) -> str:
     return os.path.normpath(tmp)
 
 
-def process_item(sox_arguments: Tuple[int, str, threading.Lock, Set[str], str]) -> str:
+def process_item(sox_arguments: Tuple[int, str, threading.Lock, Set[str], str],
+                 audio_format: Dict[str, int] = None) -> str:
     index, input_audio, lock, temporary_directories, parent_temporary_directory = sox_arguments
 
     input_name = os.path.normpath(input_audio)
@@ -42,9 +47,7 @@ def process_item(sox_arguments: Tuple[int, str, threading.Lock, Set[str], str])
     temporary_file_name = join_norm(output_directory, "%s.%s" % (base_directory, "wav"))
 
     if not os.path.exists(temporary_file_name):
-        sox_arguments = [SOX_PATH, input_name, "-b", "16", "-c", "1", "-r", "44.1k", "-t", "wav",
-                         temporary_file_name]
-        subprocess.call(sox_arguments)
+        resample(input_name, temporary_file_name, audio_format)
     return temporary_file_name
 
 
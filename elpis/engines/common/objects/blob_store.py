@@ -0,0 +1,127 @@
+import os
+import threading
+from io import BufferedIOBase
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from elpis.engines.common.objects.config_store import _DirectoryLock
+from elpis.engines.common.utilities import CopyResult, copy_stream, link_or_copy
+
+
+class BlobStore(object):
+    """
+    Content-addressed store for the original files of datasets, so that a
+    recording added to several datasets is only stored once.
+
+    Files are stored under the SHA-256 digest of their content and hard
+    linked (or copied, where hard links are not possible) into the dataset
+    directories. Files in dataset directories are never written in place:
+    adding a file again replaces the link, which leaves the stored blob and
+    the other datasets untouched.
+
+    Blobs are deleted once no dataset links to them: release(...) checks a
+    single blob (datasets call it when they drop a file) and
+    garbage_collect() checks them all (for example after dataset directories
+    were removed by hand). Adding and linking a blob hold a shared lock on the
+    store and deleting blobs an exclusive one, so a blob is never deleted
+    between being stored and being linked.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.path.joinpath(digest[:2], digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return self.blob_path(digest).is_file()
+
+    def _lock(self, shared: bool = False):
+        return _DirectoryLock(f'{self.path}', shared=shared)
+
+    def _temporary_path(self) -> Path:
+        return self.path.joinpath(f'.incoming.{os.getpid()}.{threading.get_ident()}.tmp')
+
+    def _store(self, temporary_path: Path, digest: str):
+        blob_path = self.blob_path(digest)
+        if blob_path.is_file():
+            temporary_path.unlink()
+        else:
+            blob_path.parent.mkdir(exist_ok=True)
+            os.replace(temporary_path, blob_path)
+
+    def add_fp(self, fp: Union[BufferedIOBase, BinaryIO],
+               destination: Optional[Union[str, Path]] = None) -> CopyResult:
+        """
+        Store the rest of the content of fp, hashing it while it is written.
+        The content is written to a temporary file in the store and renamed
+        to its digest, or dropped if the store already has it.
+
+        :param destination: if given, where to link the blob to (see link).
+        :return: the result of the copy, with the digest of the content.
+        """
+        temporary_path = self._temporary_path()
+        with self._lock(shared=True):
+            try:
+                with temporary_path.open(mode='wb') as fout:
+                    copied = copy_stream(fp, fout)
+                self._store(temporary_path, copied.digest)
+            except BaseException:
+                if temporary_path.exists():
+                    temporary_path.unlink()
+                raise
+            if destination is not None:
+                self.link(copied.digest, destination)
+        return copied
+
+    def add_file(self, file_path: Union[str, Path],
+                 destination: Optional[Union[str, Path]] = None) -> str:
+        """
+        Store the file at file_path, reading it once (see add_fp).
+
+        :param destination: if given, where to link the blob to (see link).
+        :return: the digest of the content.
+        """
+        with open(file_path, mode='rb') as fin:
+            return self.add_fp(fin, destination).digest
+
+    def link(self, digest: str, destination: Union[str, Path]):
+        """
+        Make destination a hard link to the stored blob, or a copy of it if
+        the two are on different file systems. An existing file at
+        destination is replaced.
+        """
+        with self._lock(shared=True):
+            link_or_copy(self.blob_path(digest), destination)
+
+    @staticmethod
+    def _delete_if_unused(blob_path: Path) -> int:
+        try:
+            stat = blob_path.stat()
+        except FileNotFoundError:
+            return 0
+        if stat.st_nlink != 1:
+            return 0
+        blob_path.unlink()
+        return stat.st_size
+
+    def release(self, digest: str) -> int:
+        """
+        Delete the blob of digest if no dataset links to it any more. Blobs
+        that were copied into datasets (rather than linked) are deleted too,
+        which is safe as the datasets have their own copy.
+
+        :return: the number of bytes freed.
+        """
+        with self._lock():
+            return self._delete_if_unused(self.blob_path(digest))
+
+    def garbage_collect(self) -> int:
+        """
+        Delete all the blobs no dataset links to any more (see release).
+
+        :return: the number of bytes freed.
+        """
+        with self._lock():
+            return sum(self._delete_if_unused(blob_path) for blob_path in self.path.glob('*/*'))
+
@@ -0,0 +1,416 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Hashable, List, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (not available on Windows)
+    fcntl = None
+
+
+# Config stores
+# =============
+# A config store is where FSObjects keep their configuration (the dict behind
+# ``obj.config``). Only the configuration goes through the store, every other
+# artifact (audio, Kaldi data directories, models, ...) stays in the object
+# directory on the file system, which is what Kaldi needs.
+#
+# Two stores are available:
+#   * JSONFileStore keeps one JSON file per object in the object directory.
+#     This is the default and what all existing state directories use.
+#   * SQLiteStore keeps the configs of all the objects of an interface in a
+#     single SQLite database (in WAL mode), with the name, hash and status of
+#     each object in indexed columns. Listing or polling objects is then one
+#     query instead of opening one file per object.
+#
+# A store is chosen for a directory tree with register_store(), objects in that
+# tree (at any depth) then use it. store_for() returns the store registered for
+# the closest enclosing directory, or the JSON file store.
+
+# Columns of the SQLite store that list_configs() can filter on.
+INDEXED_KEYS = ('name', 'hash', 'status')
+
+
+class ConfigStore(ABC):
+    """
+    Persistence of FSObject configurations. Objects are identified by their
+    directory (``path``) and the name of their config file (``file_name``).
+    """
+
+    @abstractmethod
+    def exists(self, path: str, file_name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def stamp(self, path: str, file_name: str) -> Hashable:
+        """
+        Value that changes whenever the stored config changes. Used to decide
+        when a cached copy must be read again.
+
+        :raises FileNotFoundError: if there is no such config.
+        """
+        pass
+
+    @abstractmethod
+    def read(self, path: str, file_name: str) -> dict:
+        """
+        :raises FileNotFoundError: if there is no such config.
+        """
+        pass
+
+    @abstractmethod
+    def write(self, path: str, file_name: str, conf: dict) -> Hashable:
+        """
+        Replace the stored config, atomically.
+
+        :return: the stamp of the new config.
+        """
+        pass
+
+    @abstractmethod
+    def lock(self, path: str, shared: bool = False):
+        """
+        Context manager excluding writers in other threads and processes.
+        Exclusive locks are held around read-modify-write sequences, shared
+        locks while reading.
+        """
+        pass
+
+    @abstractmethod
+    def list_configs(self, parent_path: str, file_name: str, **match) -> List[dict]:
+        """
+        Configs of the objects whose directories are in parent_path.
+
+        :param match: only return configs with these values, the keys must be
+            in INDEXED_KEYS.
+        """
+        pass
+
+
+class _HeldDirectoryLock(object):
+    def __init__(self, fd: int, shared: bool):
+        self.fd = fd
+        self.shared = shared
+        self.depth = 1
+
+
+_held_directory_locks = threading.local()
+
+
+def _held_locks() -> Dict[str, _HeldDirectoryLock]:
+    # Directory locks held by the current thread. flock locks belong to open
+    # file descriptors, so a thread that opened the directory again to lock
+    # it a second time would wait for itself. Locks inherited through a fork
+    # are shared with the parent and must not be reused.
+    if getattr(_held_directory_locks, 'pid', None) != os.getpid():
+        _held_directory_locks.pid = os.getpid()
+        _held_directory_locks.locks = {}
+    return _held_directory_locks.locks
+
+
+class _DirectoryLock(object):
+    """
+    Advisory lock on a directory shared between processes. Does nothing when
+    fcntl is not available.
+
+    Re-entrant within a thread: nested locks on a directory the thread has
+    already locked reuse the lock taken by the outermost one. A shared lock
+    can be nested in an exclusive one but not the other way around, as
+    upgrading a flock is not atomic.
+    """
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._key = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        held = _held_locks()
+        key = os.path.realpath(self.path)
+        lock = held.get(key)
+        if lock is not None:
+            if lock.shared and not self.shared:
+                raise RuntimeError(f'Cannot lock {self.path} exclusively while holding a shared lock on it')
+            lock.depth += 1
+        else:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            held[key] = _HeldDirectoryLock(fd, self.shared)
+        self._key = key
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._key is None:
+            return
+        held = _held_locks()
+        key, self._key = self._key, None
+        lock = held[key]
+        lock.depth -= 1
+        if lock.depth == 0:
+            del held[key]
+            try:
+                fcntl.flock(lock.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(lock.fd)
+
+
+def _file_stamp(file_path: str):
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _atomic_write_json(file_path: str, obj):
+    """
+    Replace the file at file_path with the JSON serialisation of obj, in a way
+    that other readers never see a partially written file.
+    """
+    directory, file_name = os.path.split(file_path)
+    temporary_file_path = os.path.join(directory, f'.{file_name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(temporary_file_path, 'w') as fout:
+            json.dump(obj, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(temporary_file_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_file_path):
+            os.unlink(temporary_file_path)
+        raise
+    # Persist the rename itself.
+    directory_fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+def _matches(conf: dict, match: dict) -> bool:
+    return all(conf.get(key) == value for key, value in match.items())
+
+
+def _check_match(match: dict):
+    for key in match:
+        if key not in INDEXED_KEYS:
+            raise ValueError(f'Can only filter configs on {INDEXED_KEYS}, not "{key}"')
+
+
+class JSONFileStore(ConfigStore):
+    """
+    One JSON file per object, in the object directory.
+
+    Files are never modified in place. A new version is written to a temporary
+    file in the same directory, fsync'd and then renamed over the old one, so
+    a reader (or a crash) can only ever see a complete file. Locks are fcntl
+    (flock) locks on the object directory rather than on the config file,
+    because atomic writes replace the file (and so its inode).
+    """
+
+    def exists(self, path: str, file_name: str) -> bool:
+        return os.path.exists(os.path.join(path, file_name))
+
+    def stamp(self, path: str, file_name: str):
+        return _file_stamp(os.path.join(path, file_name))
+
+    def read(self, path: str, file_name: str) -> dict:
+        with open(os.path.join(path, file_name), 'r') as fin:
+            return json.load(fin)
+
+    def write(self, path: str, file_name: str, conf: dict):
+        file_path = os.path.join(path, file_name)
+        _atomic_write_json(file_path, conf)
+        return _file_stamp(file_path)
+
+    def lock(self, path: str, shared: bool = False):
+        return _DirectoryLock(f'{path}', shared=shared)
+
+    def list_configs(self, parent_path: str, file_name: str, **match) -> List[dict]:
+        _check_match(match)
+        if not os.path.isdir(parent_path):
+            return []
+        configs = []
+        for dir_name in sorted(os.listdir(parent_path)):
+            if dir_name.startswith('.'):
+                continue
+            try:
+                conf = self.read(os.path.join(parent_path, dir_name), file_name)
+            except FileNotFoundError:
+                continue
+            if _matches(conf, match):
+                configs.append(conf)
+        return configs
+
+
+class _TransactionLock(object):
+    """
+    Exclusive lock of a SQLiteStore: an IMMEDIATE transaction on the
+    connection of the current thread. Nested locks join the outermost
+    transaction.
+    """
+    def __init__(self, store: 'SQLiteStore'):
+        self.store = store
+
+    def __enter__(self):
+        local = self.store._local_state()
+        if local.depth == 0:
+            local.connection.execute('BEGIN IMMEDIATE')
+        local.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        local = self.store._local_state()
+        local.depth -= 1
+        if local.depth == 0:
+            local.connection.execute('ROLLBACK' if exc_type is not None else 'COMMIT')
+
+
+class _NoLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class SQLiteStore(ConfigStore):
+    """
+    The configs of many objects in one SQLite database.
+
+    Objects are keyed by their directory relative to ``root`` (so the state
+    directory can be moved) and by config file name. The database is in WAL
+    mode: readers never wait for writers and see the last committed version
+    of every config. Exclusive locks are IMMEDIATE transactions, so they
+    serialise writers across the whole database (not per object) in this and
+    in other processes; keep batches short.
+    """
+    timeout = 30  # seconds to wait for another writer before giving up
+
+    def __init__(self, db_path: Union[str, Path], root: Union[str, Path] = None):
+        self.db_path = Path(db_path).absolute()
+        self.root = Path(root).absolute() if root is not None else self.db_path.parent
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        connection = self._local_state().connection
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS configs (
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                parent TEXT NOT NULL,
+                name TEXT,
+                hash TEXT,
+                status TEXT,
+                version TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (path, kind)
+            )""")
+        connection.execute('CREATE INDEX IF NOT EXISTS configs_parent ON configs (parent, kind)')
+        connection.execute('CREATE INDEX IF NOT EXISTS configs_name ON configs (parent, kind, name)')
+        connection.execute('CREATE INDEX IF NOT EXISTS configs_hash ON configs (hash)')
+        connection.execute('CREATE INDEX IF NOT EXISTS configs_status ON configs (parent, kind, status)')
+
+    def _local_state(self):
+        # sqlite3 connections may not be shared between threads, nor survive
+        # a fork, so each thread of each process opens its own.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(f'{self.db_path}',
+                                               timeout=self.timeout,
+                                               isolation_level=None)
+            local.connection.execute('PRAGMA synchronous=FULL')
+            local.pid = os.getpid()
+            local.depth = 0
+        return local
+
+    def _key(self, path: str) -> str:
+        path = Path(path).absolute()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _row(self, path: str, file_name: str, columns: str):
+        connection = self._local_state().connection
+        row = connection.execute(f'SELECT {columns} FROM configs WHERE path = ? AND kind = ?',
+                                 (self._key(path), file_name)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'No {file_name} config for {path} in {self.db_path}')
+        return row
+
+    def exists(self, path: str, file_name: str) -> bool:
+        try:
+            self._row(path, file_name, 'version')
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stamp(self, path: str, file_name: str):
+        return self._row(path, file_name, 'version')[0]
+
+    def read(self, path: str, file_name: str) -> dict:
+        return json.loads(self._row(path, file_name, 'data')[0])
+
+    def write(self, path: str, file_name: str, conf: dict):
+        version = uuid.uuid4().hex
+        indexed = [conf.get(key) for key in INDEXED_KEYS]
+        # Only strings are indexed; anything else is still in data.
+        indexed = [value if isinstance(value, str) else None for value in indexed]
+        self._local_state().connection.execute(
+            'INSERT OR REPLACE INTO configs (path, kind, parent, name, hash, status, version, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (self._key(path), file_name, self._key(Path(path).absolute().parent), *indexed,
+             version, json.dumps(conf))
+        )
+        return version
+
+    def lock(self, path: str, shared: bool = False):
+        if shared:
+            # Reads see a consistent snapshot without locking in WAL mode.
+            return _NoLock()
+        return _TransactionLock(self)
+
+    def list_configs(self, parent_path: str, file_name: str, **match) -> List[dict]:
+        _check_match(match)
+        query = 'SELECT data FROM configs WHERE parent = ? AND kind = ?'
+        parameters = [self._key(parent_path), file_name]
+        for key, value in match.items():
+            query += f' AND {key} = ?'
+            parameters.append(value)
+        connection = self._local_state().connection
+        return [json.loads(data) for data, in connection.execute(query + ' ORDER BY path', parameters)]
+
+
+_default_store = JSONFileStore()
+_stores: Dict[str, ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+
+def register_store(path: Union[str, Path], store: ConfigStore):
+    """
+    Use store for the configs of all objects under path.
+    """
+    with _stores_lock:
+        _stores[os.path.abspath(f'{path}')] = store
+
+
+def store_for(path: Union[str, Path]) -> ConfigStore:
+    """
+    The store registered for the closest directory enclosing path (or path
+    itself), defaulting to a JSONFileStore.
+    """
+    path = os.path.abspath(f'{path}')
+    best_root, best_store = '', _default_store
+    with _stores_lock:
+        for root, store in _stores.items():
+            if len(root) > len(best_root) and (path == root or path.startswith(root.rstrip(os.sep) + os.sep)):
+                best_root, best_store = root, store
+    return best_store
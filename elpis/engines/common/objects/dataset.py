@@ -2,17 +2,23 @@ import json
 import glob
 import os
 import string
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from pathlib import Path
-from typing import Dict, List, Union, BinaryIO, Optional
+from typing import Dict, Iterable, Iterator, List, Union, BinaryIO, Optional, Tuple
 from io import BufferedIOBase
 
-from ..utilities import load_json_file
+from ..utilities import copy_stream, iter_annotations
 from elpis.transformer import make_importer, DataTransformer, DataTransformerAbstractFactory
+from elpis.engines.common.objects.blob_store import BlobStore
+from elpis.engines.common.objects.resample_cache import ResampleCache
 from elpis.engines.common.objects.fsobject import FSObject
 from elpis.engines.common.objects.path_structure import existing_attributes, ensure_paths_exist
 from elpis.engines.common.input.clean_json import extract_additional_corpora
-from elpis.engines.common.input.make_wordlist import generate_word_list
+from elpis.engines.common.input.resample import RESAMPLE_FORMAT, make_audio_format
+from elpis.engines.common.input.dataset_summary import AnnotationSummary, read_words
 
 
 class DSPaths(object):
@@ -30,13 +36,24 @@ class DSPaths(object):
         ensure_paths_exist(self, attrs)
 
         # files
+        # \/ annotations as JSON Lines, see utilities.annotation_utilities
+        self.annotations_jsonl: Path = self.basepath.joinpath('annotations.jsonl')
+        # \/ annotations as a JSON list, from older versions
         self.annotation_json: Path = self.basepath.joinpath('annotations.json')
+        # \/ fingerprints of the imported files, see DataTransformerAbstractFactory.build_importer,
+        #    with their annotations in import_state_annotations/
+        self.import_state_json: Path = self.basepath.joinpath('import_state.json')
+        # \/ what the importer read from the files to update its ui, e.g. the tiers of each eaf
+        self.importer_ui_cache_json: Path = self.basepath.joinpath('importer_ui_cache.json')
         self.word_count_json: Path = self.basepath.joinpath('word_count.json')
+        self.stats_json: Path = self.basepath.joinpath('stats.json')
         self.word_list_txt: Path = self.basepath.joinpath('word_list.txt')
         # \/ user uploaded addional words
         self.additional_word_list_txt = self.original.joinpath('additional_word_list.txt')
         # \/ compile the uploaded corpora into this single file
         self.corpus_txt = self.cleaned.joinpath('corpus.txt')
+        # \/ files copied by an add_files(...) call that has not finished
+        self.ingest_manifest = self.basepath.joinpath('ingest_manifest.jsonl')
 
 
 
@@ -49,33 +66,35 @@ class Dataset(FSObject):
 
     # The configuration settings stored in the file below.
     _config_file = 'dataset.json'
+    # Where original files are stored, set by the Interface. Datasets without
+    # one keep a private copy of each file.
+    blob_store: Optional[BlobStore] = None
+    # Resampled audio shared between datasets, set by the Interface.
+    resample_cache: Optional[ResampleCache] = None
+    # Number of files add_files(...) copies at the same time.
+    ingest_workers = 8
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.__files: List[Path] = []
         self.pathto = DSPaths(self.path)
         self._importer = None
 
         # config
-        self.config['has_been_processed'] = False
-        self.config['files'] = []
-        self.config['processed_labels'] = []
-        self.config['importer'] = None
+        with self.config.batch():
+            self.config['has_been_processed'] = False
+            self.config['files'] = []
+            self.config['file_digests'] = {}  # file name: SHA-256 of its content
+            self.config['processed_labels'] = []
+            self.config['importer'] = None
+            self.config['audio_format'] = dict(RESAMPLE_FORMAT)  # what the audio is resampled to
 
     @classmethod
     def load(cls, base_path: Path):
         self = super().load(base_path)
         self.pathto = DSPaths(self.path)
-        self.__files = [ self.pathto.original.joinpath(path) for path in self.config['files']]
-        # at this point config has the previous state
-        self._importer = self.config['importer']
-        temp_state = self._importer
-        # rebuild the importer, this resets importer ui
-        if self._importer is not None:
-            importer_name = self._importer['name']
-            self.select_importer(importer_name)
-        # importer has been reset, copy the old state back
-        self.config['importer'] = temp_state
+        # The importer saved in the config is only rebuilt when it is used,
+        # see the importer property.
+        self._importer = None
         return self
 
     def select_importer(self, name: str):
@@ -109,7 +128,7 @@ class Dataset(FSObject):
 
         temporary_directory_path = f'/tmp/{self.hash}/working'
         Path(temporary_directory_path).mkdir(parents=True, exist_ok=True) # TODO: what if two importers are used on this directory?
-        transcription_json_file_path = f'{self.pathto.annotation_json}'
+        transcription_json_file_path = f'{self.pathto.annotations_jsonl}'
         self._importer = make_importer(
             name,
             str(self.pathto.original),
@@ -118,10 +137,35 @@ class Dataset(FSObject):
             transcription_json_file_path,
             get_config_callback,
             set_config_callback,
-            settings_change_callback=settings_change_callback
+            settings_change_callback=settings_change_callback,
+            state_file_path=f'{self.pathto.import_state_json}',
+            resample_cache=self.resample_cache,
+            progress_callback=self._report_resample_progress,
+            audio_format=self.audio_format,
+            ui_cache_path=f'{self.pathto.importer_ui_cache_json}'
         )
         return
     
+    # Least number of seconds between two writes of the resampling progress.
+    progress_interval = 1.0
+    _progress_written = 0.0
+
+    def _report_resample_progress(self, done: int, total: int, failures: Dict[str, str]):
+        """
+        Save the progress of resampling in config['resample_progress'], for
+        the GUI to show. Not saved more than once per progress_interval,
+        except for the first and last files.
+        """
+        now = time.monotonic()
+        if 0 < done < total and now - self._progress_written < self.progress_interval:
+            return
+        self._progress_written = now
+        self.config['resample_progress'] = {
+            'done': done,
+            'total': total,
+            'failed': {Path(path).name: reason for path, reason in failures.items()}
+        }
+
     def auto_select_importer(self):
         if self.importer is not None:
             return # Already have importer selected
@@ -163,6 +207,54 @@ class Dataset(FSObject):
         """
         return self.config['has_been_processed']
     
+    @property
+    def audio_format(self) -> Dict[str, int]:
+        """
+        Bits per sample, channels and sample rate the audio of this dataset
+        is resampled to. Change it with set_audio_format(...).
+
+        :return: a dictionary with the 'bits', 'channels' and 'rate' keys.
+        """
+        if 'audio_format' in self.config:
+            return self.config['audio_format']
+        # datasets made before the format could be chosen
+        return dict(RESAMPLE_FORMAT)
+
+    @property
+    def processed_audio_format(self) -> Dict[str, int]:
+        """
+        The audio format of the resampled audio from the last process().
+        """
+        if 'processed_audio_format' in self.config:
+            return self.config['processed_audio_format']
+        return dict(RESAMPLE_FORMAT)
+
+    def set_audio_format(self, rate: int = None, bits: int = None):
+        """
+        Choose the sample rate and bit depth to resample the audio to. 16 kHz
+        is enough for speech, and makes resampled audio and features much
+        smaller than the 44.1 kHz default.
+
+        If the format changes, the dataset is marked as unprocessed
+        (has_been_processed == False).
+
+        :param rate: sample rate in Hz, unchanged if not given.
+        :param bits: bits per sample, unchanged if not given.
+        :raises:
+            ValueError: if the rate or bit depth is not valid.
+        """
+        audio_format = make_audio_format(rate=rate or self.audio_format['rate'],
+                                         bits=bits or self.audio_format['bits'],
+                                         channels=self.audio_format['channels'])
+        if audio_format == self.audio_format:
+            return
+        with self.config.batch():
+            self.config['audio_format'] = audio_format
+            self.config['has_been_processed'] = False
+            self.config['processed_labels'] = []
+        # rebuilt with the new format when next used
+        self._importer = None
+
     @property
     def processed_labels(self) -> List[str]:
         """
@@ -186,56 +278,144 @@ class Dataset(FSObject):
 
         As a property, this attribute is read-only, however, can be operated on.
 
+        A loaded dataset rebuilds the importer saved in its config on first
+        access, so loading a dataset only to read its config is cheap.
+
         :return: A DataTransformer if one has been assigned using the select_importer(...) method, otherwise None.
         """
+        if self._importer is None:
+            # at this point config has the previous state
+            temp_state = self.config['importer']
+            if temp_state is not None:
+                # rebuild the importer, this resets importer ui
+                self.select_importer(temp_state['name'])
+                # importer has been reset, copy the old state back
+                self.config['importer'] = temp_state
         return self._importer
     
     @property
-    def annotations(self) -> dict:
+    def annotations_path(self) -> Path:
+        """
+        The file where the data transformer puts processed annotations, see
+        iter_annotations(...) to read it.
+        """
+        if not self.pathto.annotations_jsonl.exists() and self.pathto.annotation_json.exists():
+            # processed by an older version
+            return self.pathto.annotation_json
+        return self.pathto.annotations_jsonl
+
+    @property
+    def annotations(self) -> List[Dict]:
         """
-        Returns the contents of the annotaions.json object. This is the file
-        where the data transformer puts processed annotations.
+        Returns all the processed annotations. Prefer iter_annotations() for
+        large datasets, which reads them one at a time.
 
         As a property, this attribute is read-only.
 
-        :return: the annotations json object.
+        :return: the list of annotations.
         :raises:
             RuntimeError: if there is an attempt to get the annotation object before process().
         """
+        return list(self.iter_annotations())
+
+    def iter_annotations(self) -> Iterator[Dict]:
+        """
+        Read the processed annotations one at a time.
+
+        :raises:
+            RuntimeError: if there is an attempt to get the annotations before process().
+        """
         if self.config['has_been_processed'] == False:
             raise RuntimeError('cannot get annotations wihtout runnint .process()')
-        with self.pathto.annotation_json.open(mode='r') as fin:
-            return json.loads(fin.read())
+        return iter_annotations(self.annotations_path)
     
 
+    @property
+    def stats(self) -> Dict:
+        """
+        The stats index written by process(): totals, per file and per
+        speaker counts and durations, and segment length histograms. Read
+        from the index, the annotations are not read again.
+
+        :raises:
+            RuntimeError: if there is an attempt to get the stats before process().
+        """
+        if self.config['has_been_processed'] == False:
+            raise RuntimeError('cannot get stats without running .process()')
+        if not self.pathto.stats_json.exists():
+            # processed by an older version
+            summary = AnnotationSummary().add_all(self.iter_annotations())
+            summary.write_stats(self.pathto.stats_json, audio_directory=self.pathto.resampled)
+        with self.pathto.stats_json.open() as fin:
+            return json.load(fin)
+
     def add_fp(self, fp: Union[BufferedIOBase, BinaryIO], fname: str,
                destination: str = 'original'):
         """
         Saves a copy of the file pointer contents in the internal datastructure
         at `self.pathto.original`. This method enforces a copy to be made and
-        ensures the original files remain untouched. All file adding methods
-        such as add_file and add_directory use this to add individual files.
+        ensures the original files remain untouched.
+
+        When the dataset has a blob store, the content is stored there (once,
+        whichever datasets add it) and linked into the dataset.
+
+        The content is copied in bounded chunks (see
+        utilities.COPY_BUFFER_SIZE), so memory use does not depend on the size
+        of the file, and hashed on the way.
 
         :param fp: Python file BufferedIOBase object usually from open().
         :param fname: name of the file.
         """
 
+        path = self._destination(fname)
+        if self.blob_store is not None:
+            copied = self.blob_store.add_fp(fp, path)
+        else:
+            if path.exists():
+                # May be linked to a blob, never write through it.
+                path.unlink()
+            with path.open(mode='wb') as fout:
+                copied = copy_stream(fp, fout)
+        print(f'added {fname}: {copied}')
+        self._record_file(path, copied.digest)
+
+    def _destination(self, fname: str) -> Path:
         # TODO
         # change this after adding a seperate file upload widget in gui for additional corpora files
         # then we can determine where to write the files by destination value instead of by name
         if "corpus" in fname:
-            path: Path = self.pathto.text_corpora.joinpath(fname)
-        else:
-            path: Path = self.pathto.original.joinpath(fname)
-        with path.open(mode='wb') as fout:
-            fout.write(fp.read())
-        
-        if fname not in self.config['files']:
-            self.__files.append(path)
-            self.config['files'] = [f'{f.name}' for f in self.__files]
-        else:
-            # already existed but has been overriden, name is already in the config
-            pass
+            return self.pathto.text_corpora.joinpath(fname)
+        return self.pathto.original.joinpath(fname)
+
+    def _file_paths(self) -> List[Path]:
+        # Always from the config: files may have been added or removed by
+        # another Interface (or worker) sharing this dataset.
+        return [self._destination(name) for name in self.config['files']]
+
+    def _record_file(self, path: Path, digest: str):
+        self._record_files([(path, digest)])
+
+    def _record_files(self, added: Iterable[Tuple[Path, str]]):
+        replaced = []
+        with self.config.batch():
+            files = self.config['files']
+            file_digests = self.config['file_digests'] if 'file_digests' in self.config else {}
+            for path, digest in added:
+                if path.name not in files:
+                    files.append(path.name)
+                # else already existed but has been overriden, name is already in the config
+                elif file_digests.get(path.name, digest) != digest:
+                    replaced.append(file_digests[path.name])
+                file_digests[path.name] = digest
+            self.config['files'] = files
+            self.config['file_digests'] = file_digests
+        self._release_blobs(replaced)
+
+    def _release_blobs(self, digests: Iterable[str]):
+        # Delete the stored originals no dataset uses any more.
+        if self.blob_store is not None:
+            for digest in digests:
+                self.blob_store.release(digest)
     
     def add_file(self, file_path: str):
         """
@@ -251,10 +431,111 @@ class Dataset(FSObject):
         file_path = Path(file_path)
         if not file_path.is_file():
             raise ValueError(f'"{file_path}" is not a valid path to file"')
-        with file_path.open(mode='rb') as fin:
-            self.add_fp(fin, file_path.name)
-        self.config['has_been_processed'] = False
-        self.config['processed_labels'] = []
+        with self.config.batch():
+            self._record_file(*self._copy_in(file_path))
+            self.config['has_been_processed'] = False
+            self.config['processed_labels'] = []
+
+    def _copy_in(self, file_path: Path) -> Tuple[Path, str]:
+        """
+        Copy the file at file_path into the dataset, without recording it.
+
+        :return: the path of the copy and the digest of its content.
+        """
+        path = self._destination(file_path.name)
+        if self.blob_store is not None:
+            # Content already in the store is not stored twice.
+            return path, self.blob_store.add_file(file_path, path)
+        if path.exists():
+            # May be linked to a blob, never write through it.
+            path.unlink()
+        with file_path.open(mode='rb') as fin, path.open(mode='wb') as fout:
+            return path, copy_stream(fin, fout).digest
+
+    def add_files(self, file_paths: Iterable[Union[str, Path]]):
+        """
+        Copy many files into the internal data structure, several at a time
+        (see ``ingest_workers``), and record them all at once.
+
+        Files are listed in a manifest as they are copied, so if the import
+        is interrupted, adding the same files again only copies the ones
+        that were not copied yet (or have changed since).
+
+        When this action happens, the internal file state is changed and the
+        dataset is marked as unprocessed (has_been_processed == False).
+
+        :param file_paths: paths of the files to add. Of several files with
+            the same name, the last one is added.
+        :raises:
+            - ValueError: if a path is not a file.
+        """
+        by_name: Dict[str, Path] = {}
+        for file_path in map(Path, file_paths):
+            if not file_path.is_file():
+                raise ValueError(f'"{file_path}" is not a valid path to file"')
+            by_name[file_path.name] = file_path.absolute()
+
+        start = time.perf_counter()
+        manifest = self._read_ingest_manifest()
+        added: List[Tuple[Path, str]] = []
+        to_copy = []
+        for file_path in by_name.values():
+            stat = file_path.stat()
+            entry = manifest.get(f'{file_path}')
+            destination = self._destination(file_path.name)
+            if (entry is not None and destination.exists()
+                    and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns):
+                added.append((destination, entry['digest']))
+            else:
+                to_copy.append((file_path, stat))
+
+        with self.pathto.ingest_manifest.open(mode='a') as manifest_file, \
+                ThreadPoolExecutor(max_workers=self.ingest_workers) as executor:
+            futures = {executor.submit(self._copy_in, file_path): (file_path, stat)
+                       for file_path, stat in to_copy}
+            error = None
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    # Stop copying, but keep the copies already running in
+                    # the manifest so that they are not made again.
+                    if error is None:
+                        error = future.exception()
+                        for pending in futures:
+                            pending.cancel()
+                    continue
+                path, digest = future.result()
+                file_path, stat = futures[future]
+                manifest_file.write(json.dumps({
+                    'source': f'{file_path}',
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'digest': digest
+                }) + '\n')
+                manifest_file.flush()
+                added.append((path, digest))
+            if error is not None:
+                raise error
+
+        with self.config.batch():
+            self._record_files(added)
+            self.config['has_been_processed'] = False
+            self.config['processed_labels'] = []
+        self.pathto.ingest_manifest.unlink()
+        print(f'added {len(added)} files ({len(to_copy)} copied) in {time.perf_counter() - start:.2f}s')
+
+    def _read_ingest_manifest(self) -> Dict[str, dict]:
+        manifest = {}
+        if self.pathto.ingest_manifest.is_file():
+            with self.pathto.ingest_manifest.open() as fin:
+                for line in fin:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # last line of an interrupted import
+                    manifest[entry['source']] = entry
+        return manifest
 
     def add_directory(self, path, extensions: Optional[List[str]] = None):
         """
@@ -271,14 +552,15 @@ class Dataset(FSObject):
         """
         extensions = extensions or list()
         path: Path = Path(path)
+        file_paths = []
         for filepath in path.iterdir():
+            if not filepath.is_file():
+                continue
             if len(extensions) != 0:
                 if filepath.name.split('.')[-1] not in extensions:
                     continue
-            file_pointer = filepath.open(mode='rb')
-            self.add_fp(file_pointer, filepath.name)
-        self.config['has_been_processed'] = False
-        self.config['processed_labels'] = []
+            file_paths.append(filepath)
+        self.add_files(file_paths)
 
     def remove_file(self, file_name: str):
         """
@@ -292,19 +574,24 @@ class Dataset(FSObject):
         :raises:
             - ValueError: if the file name is not in the internal set.
         """
-        # Search for file then delete it.
-        file_path: Optional[Path] = None
-        for path in self.__files:
-            if path.name == file_name:
-                file_path = path
-                break
-        if file_path is None:
-            raise ValueError(f'file named "{file_name}" is not the internal set')
-        self.__files.remove(file_path)
-        file_path.unlink() # Deletes the file.
-        self.config['files'] = [f'{f.name}' for f in self.__files]
-        self.config['has_been_processed'] = False
-        self.config['processed_labels'] = []
+        # Search for file then delete it, holding the config lock so the
+        # file list is read and written back in one go.
+        with self.config.batch():
+            files = self.config['files']
+            if file_name not in files:
+                raise ValueError(f'file named "{file_name}" is not the internal set')
+            files.remove(file_name)
+            self._destination(file_name).unlink() # Deletes the file.
+            self.config['files'] = files
+            digest = None
+            if 'file_digests' in self.config:
+                file_digests = self.config['file_digests']
+                digest = file_digests.pop(file_name, None)
+                self.config['file_digests'] = file_digests
+            self.config['has_been_processed'] = False
+            self.config['processed_labels'] = []
+        if digest is not None:
+            self._release_blobs([digest])
 
     @property
     def state(self):
@@ -317,18 +604,18 @@ class Dataset(FSObject):
         """
         _config = self.config._load()
         return {
-            'name': self.config['name'],
-            'hash': self.config['hash'],
-            'date': self.config['date'],
-            'has_been_processed': self.config['has_been_processed'],
-            'files': self.config['files'],
-            'processed_labels': self.config['processed_labels'],
-            'importer': self.config['importer']
+            'name': _config['name'],
+            'hash': _config['hash'],
+            'date': _config['date'],
+            'has_been_processed': _config['has_been_processed'],
+            'files': _config['files'],
+            'processed_labels': _config['processed_labels'],
+            'importer': _config['importer']
         }
 
     def validate(self):
         extention_to_path = {}
-        for path in self.__files:
+        for path in self._file_paths():
             extention = f'{path}'.split('.')[-1]
             if extention not in extention_to_path.keys():
                 extention_to_path[extention] = [path]
@@ -338,10 +625,10 @@ class Dataset(FSObject):
             self.importer.validate_files(extention, paths)
     
     def refresh_ui(self):
-        self.importer.refresh_ui(self.__files)
+        self.importer.refresh_ui(self._file_paths())
 
     def process(self):
-        transformer = self._importer
+        transformer = self.importer
         if transformer == None:
             raise RuntimeError('must select importer before processing')
         transformer.process()
@@ -355,39 +642,30 @@ class Dataset(FSObject):
             if extension == ".txt":
                 corpus_files.append(file_)
         print(f"corpus_files {corpus_files}")
-        # Compile and clean the additional corpora content into a single file
+        # Compile and clean the additional corpora content into a single file,
+        # keeping their words for the word list.
         # Reset first to prevent files being added multiple times
         if os.path.exists(self.pathto.corpus_txt):
             self.pathto.corpus_txt.unlink()
-        for additional_corpus in corpus_files:
-            extract_additional_corpora(additional_corpus=additional_corpus,
-                                       corpus_txt=f'{self.pathto.corpus_txt}',
-                                       punctuation_to_collapse_by=
-                                       settings['punctuation_to_collapse_by'],
-                                       punctuation_to_explode_by=
-                                       settings['punctuation_to_explode_by'])
-        # task make-wordlist
-        generate_word_list(transcription_file=f'{self.pathto.annotation_json}',
-                           output_file=f'{self.pathto.word_list_txt}',
-                           additional_word_list_file=f'{self.pathto.additional_word_list_txt}',
-                           additional_corpus_txt=f'{self.pathto.corpus_txt}'
-                           )
-        # make word count
-        annotations: List[Dict[str, str]] = load_json_file(f'{self.pathto.annotation_json}')
-        with self.pathto.word_count_json.open(mode='w') as f_word_count:
-            wordlist = {}
-            for transcription in annotations:
-                words = transcription['transcript'].split()
-                for word in words:
-                    if word in wordlist:
-                        wordlist[word] += 1
-                    else:
-                        wordlist[word] = 1
-            json.dump(wordlist, f_word_count)
-
-        self.config['has_been_processed'] = True
-
-        annotation_labels_set = set(self._importer._annotation_store.keys())
-        audio_labels_set = set(self._importer._audio_store.keys())
+        additional_words = read_words(self.pathto.additional_word_list_txt)
+        for additional_corpus in sorted(corpus_files):
+            additional_words |= extract_additional_corpora(
+                additional_corpus=additional_corpus,
+                corpus_txt=f'{self.pathto.corpus_txt}',
+                punctuation_to_collapse_by=settings['punctuation_to_collapse_by'],
+                punctuation_to_explode_by=settings['punctuation_to_explode_by'])
+        # task make-wordlist, word count and stats, in one pass over the annotations
+        summary = AnnotationSummary().add_all(iter_annotations(self.annotations_path))
+        summary.write_word_list(self.pathto.word_list_txt, additional_words)
+        summary.write_word_counts(self.pathto.word_count_json)
+        summary.write_stats(self.pathto.stats_json, audio_directory=self.pathto.resampled,
+                            vocabulary=additional_words)
+
+        with self.config.batch():
+            self.config['has_been_processed'] = True
+            self.config['processed_audio_format'] = self.audio_format
+
+        annotation_labels_set = set(transformer.get_annotation_ids())
+        audio_labels_set = set(transformer._audio_store.keys())
         processed_labels = annotation_labels_set.intersection(audio_labels_set)
         self.config['processed_labels'] = list(processed_labels)
@@ -1,23 +1,116 @@
-import json
+import copy
+import os
+import threading
 import time
 from abc import ABC, abstractclassmethod, abstractmethod
 from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Tuple
 from elpis.engines.common.utilities import hasher
+from elpis.engines.common.objects.config_store import ConfigStore, store_for
+from elpis.engines.common.objects.registry import Registry, registry_for
 
 # Design constraint
 # Since there are four classes that must have their states saved to the
 # operating system, this single class was made to provide some common
-# functionality and a standard of operation for these classes. The alternative
-# to using this method of storing everything on disk (using the file system
-# directly) is to implement a database, however, kaldi requires access to
-# files and a specific file structure. This was the constrain that lead to the
-# FSObject.
+# functionality and a standard of operation for these classes. Kaldi requires
+# access to files and a specific file structure, so every object has its own
+# directory. This was the constrain that lead to the FSObject. The object
+# configurations themselves do not need to be files, they are kept by a
+# config store (see config_store.py), which is either a JSON file in the
+# object directory or a row in a SQLite database shared by all objects.
 
 
 # The classes that use FSObject as a base are: Dataset, Model, Transcription
 # and KaldiInterface.
 
 
+# Config cache
+# ============
+# Every FSObject proxy of the same directory shares one in-memory copy of the
+# parsed config (keyed by the absolute config file path), so reading a key
+# does not ask the store for it again. The config is only re-read when the
+# stamp of the stored config (modification time, size and inode of a JSON
+# file, version of a SQLite row) no longer matches the one recorded when it
+# was last read or written, which is how changes made by other processes are
+# picked up.
+#
+# Locking
+# =======
+# Training and transcription run in background threads that update the same
+# config as the request handlers, possibly from other worker processes. Each
+# cache entry has an RLock that serialises access within this process, and
+# every batch additionally holds the exclusive lock of the store (an flock on
+# the object directory, or a SQLite write transaction), which other processes
+# respect. Re-reading a changed config takes a shared lock. A batch reloads
+# the config once it holds the locks, so read-modify-write sequences inside a
+# batch cannot lose updates made by other threads or processes.
+
+class _ConfigCacheEntry(object):
+    def __init__(self):
+        self.data: Optional[dict] = None
+        self.stamp: Optional[Hashable] = None
+        self.dirty = False  # data holds writes that are not in the store yet
+        # (data, dirty) as they were when each open batch started
+        self.snapshots: List[Tuple[dict, bool]] = []
+        self.lock = threading.RLock()
+        self.store_lock = None  # held by the outermost batch
+
+
+_config_cache: Dict[str, _ConfigCacheEntry] = {}
+_config_cache_lock = threading.Lock()
+
+
+def _config_cache_entry(file_path: str) -> _ConfigCacheEntry:
+    with _config_cache_lock:
+        entry = _config_cache.get(file_path)
+        if entry is None:
+            entry = _config_cache[file_path] = _ConfigCacheEntry()
+        return entry
+
+
+def _copy(value):
+    # Callers expect a fresh object on every read (as they did when every read
+    # parsed the file), so never hand out references to the cached containers.
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+class LinkedObject(object):
+    """
+    Descriptor for an attribute holding another FSObject this object is
+    linked to, such as ``model.dataset``. The config stores the name of the
+    linked object under ``name_key``; the object itself is only loaded on
+    first access of the attribute, through the ``_link_resolver`` the
+    Interface gives the objects it hands out (``resolver(kind, name)``), and
+    then kept on this proxy. Assigning an object sets the link of this proxy
+    (the config is updated by the link methods), assigning None forgets it.
+    """
+    def __init__(self, name_key: str, kind: str):
+        self.name_key = name_key
+        self.kind = kind
+        self.attribute = None
+
+    def __set_name__(self, owner, name):
+        self.attribute = f'_{name}_link'
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        linked = obj.__dict__.get(self.attribute)
+        if linked is None and obj._link_resolver is not None:
+            name = obj.config[self.name_key] if self.name_key in obj.config else None
+            if name is not None:
+                linked = obj.__dict__[self.attribute] = obj._link_resolver(self.kind, name)
+        return linked
+
+    def __set__(self, obj, value):
+        if value is None:
+            obj.__dict__.pop(self.attribute, None)
+        else:
+            obj.__dict__[self.attribute] = value
+
+
 class FSObject(ABC):
 
     """
@@ -32,6 +125,11 @@ class FSObject(ABC):
     ``dir_name`` directory.
     """
     _links = {}  # Used for child classes to dynamically link to other objects if applicable.
+    # Config keys copied to the interface registry (see registry.py) whenever
+    # the config is saved, so objects can be listed without loading them.
+    _summary_keys = ('name', 'hash', 'date')
+    # Loads the objects this one links to, see LinkedObject.
+    _link_resolver = None
 
     # _config_file = '___________.json'
     # Do not uncomment line above, this is an example of how to implement the
@@ -67,15 +165,15 @@ class FSObject(ABC):
         self.__path = Path(parent_path).joinpath(dir_name)
         self.path.mkdir(parents=True, exist_ok=True)
         #  if no config, then create it
-        config_file_path = Path(f'{self.__path}/{self._config_file}')
-        if not config_file_path.exists():
-            self.ConfigurationInterface(self)._save({})
-        if 'name' not in self.config._load() or name is not None:
-            self.config['name'] = name
-        if 'hash' not in self.config._load():
-            self.config['hash'] = h
-        if 'date' not in self.config._load():
-            self.config['date'] = str(time.time())
+        if not self.config._exists():
+            self.config._save({})
+        with self.config.batch():
+            if 'name' not in self.config or name is not None:
+                self.config['name'] = name
+            if 'hash' not in self.config:
+                self.config['hash'] = h
+            if 'date' not in self.config:
+                self.config['date'] = str(time.time())
 
     def _initial_config(self, config):
         self.ConfigurationInterface(self)._save(config)
@@ -126,7 +224,12 @@ class FSObject(ABC):
 
     @property
     def config(self):
-        return self.ConfigurationInterface(self)
+        # Created lazily because load() bypasses __init__.
+        try:
+            return self.__config
+        except AttributeError:
+            self.__config = self.ConfigurationInterface(self)
+            return self.__config
 
     # def link(self, *link_objects):
     #     # NOTE It should be easier to use **links (keyword arguments), but it forces the edition of related endpoint file, so wait for now.
@@ -138,34 +241,247 @@ class FSObject(ABC):
 
     class ConfigurationInterface(object):
         """
-        Continuously save changes to disk and only read properties from disk
-        (in the JSON file storing the objects configuration).
+        Save changes to disk and read properties from the JSON file storing
+        the objects configuration.
 
         This class is more syntax sugar. Particularly so we can treat the
         'config' attribute/property in the FSObject class like a JSON
         (or dict), since it is interfacing directly with one.
+
+        The configuration is kept by the config store registered for the
+        object directory (a JSON file by default, see config_store.py). The
+        parsed config is cached in memory (see "Config cache" above) so reads
+        only go to the store when the config has been changed by someone else.
+        Writes are saved immediately (and atomically), unless they are
+        made inside a batch, in which case they are kept in memory and written
+        once when the outermost batch ends (or when ``flush()`` is called)::
+
+            with dataset.config.batch():
+                dataset.config['files'] = files
+                dataset.config['has_been_processed'] = False
+
+        If a batch is left because of an exception, the changes made inside it
+        are discarded. ``with obj.config:`` is shorthand for
+        ``with obj.config.batch():``.
+
+        Batches are also the unit of locking: for the duration of the batch no
+        other thread or process can change the config, so read-modify-write
+        sequences should always be wrapped in one::
+
+            with model.config.batch():
+                stage_status = model.config['stage_status']
+                stage_status[stage]['status'] = 'complete'
+                model.config['stage_status'] = stage_status
+
+        Set ``use_cache`` to False to read and write the store on every access
+        (batches then write through, cannot be rolled back and do not lock).
         """
+        use_cache = True
+
         def __init__(self, fsobj):
             self.fsobj = fsobj
 
         def _file_name(self):
             return getattr(self.fsobj, '_config_file', 'config.json')
 
+        @property
+        def store(self) -> ConfigStore:
+            # Looked up once, stores are registered before objects are made.
+            try:
+                return self._store
+            except AttributeError:
+                self._store = store_for(self.fsobj.path)
+                return self._store
+
+        @property
+        def registry(self) -> Optional[Tuple[Registry, str]]:
+            try:
+                return self._registry
+            except AttributeError:
+                self._registry = registry_for(self.fsobj.path)
+                return self._registry
+
+        def _file_path(self) -> str:
+            # Absolute, so that proxies made from relative and absolute paths
+            # share a cache entry (and its lock).
+            return os.path.join(os.path.abspath(f'{self.fsobj.path}'), self._file_name())
+
+        def _entry(self) -> _ConfigCacheEntry:
+            return _config_cache_entry(self._file_path())
+
+        def _exists(self) -> bool:
+            return self.store.exists(f'{self.fsobj.path}', self._file_name())
+
+        def _stamp(self) -> Hashable:
+            return self.store.stamp(f'{self.fsobj.path}', self._file_name())
+
+        def _read(self) -> dict:
+            return self.store.read(f'{self.fsobj.path}', self._file_name())
+
+        def _write(self, conf: dict) -> Hashable:
+            stamp = self.store.write(f'{self.fsobj.path}', self._file_name(), conf)
+            self._record(conf)
+            return stamp
+
+        def _record(self, conf: dict):
+            """
+            Update the summary of the object in its registry, if it has one.
+            """
+            if self.registry is None or conf.get('hash') is None:
+                return
+            registry, kind = self.registry
+            registry.record(kind, {key: conf.get(key) for key in self.fsobj._summary_keys})
+
+        def _lock(self, shared: bool = False):
+            return self.store.lock(f'{self.fsobj.path}', shared=shared)
+
+        def _cached(self) -> dict:
+            """
+            The shared, cached config dict. Must not be handed out to callers.
+            """
+            entry = self._entry()
+            with entry.lock:
+                if entry.dirty:
+                    # Pending writes are newer than whatever is stored.
+                    return entry.data
+                stamp = self._stamp()
+                if entry.data is None or stamp != entry.stamp:
+                    if entry.store_lock is None:
+                        with self._lock(shared=True):
+                            stamp = self._stamp()
+                            entry.data = self._read()
+                    else:
+                        # Already holding the exclusive lock.
+                        entry.data = self._read()
+                    entry.stamp = stamp
+                return entry.data
+
+        def _write_entry(self, entry: _ConfigCacheEntry):
+            try:
+                stamp = self.store.write(f'{self.fsobj.path}', self._file_name(), entry.data)
+            except BaseException:
+                # Forget what could not be saved, the store is the truth.
+                entry.data = None
+                entry.stamp = None
+                entry.dirty = False
+                raise
+            entry.stamp = stamp
+            entry.dirty = False
+            self._record(entry.data)
+
         def _load(self):
-            with open(f'{self.fsobj.path}/{self._file_name()}', 'r') as fin:
-                return json.load(fin)
+            if not self.use_cache:
+                return self._read()
+            return copy.deepcopy(self._cached())
 
         def _save(self, conf):
-            with open(f'{self.fsobj.path}/{self._file_name()}', 'w') as fout:
-                return json.dump(conf, fout)
+            if not self.use_cache:
+                self._write(conf)
+                return
+            entry = self._entry()
+            with entry.lock:
+                entry.data = conf
+                if entry.snapshots:
+                    entry.dirty = True
+                else:
+                    with self._lock():
+                        self._write_entry(entry)
+
+        def flush(self):
+            """
+            Write any changes held in memory to the store.
+            """
+            if not self.use_cache:
+                return
+            entry = self._entry()
+            with entry.lock:
+                if entry.dirty:
+                    self._write_entry(entry)
+
+        def batch(self):
+            """
+            Group several changes into a single write. Use as a context
+            manager; see the class documentation.
+            """
+            return self
+
+        def __enter__(self):
+            if self.use_cache:
+                self._begin(self._entry(), snapshot=True)
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            if self.use_cache:
+                self._end(self._entry(), failed=exc_type is not None)
+
+        def _begin(self, entry: _ConfigCacheEntry, snapshot: bool):
+            """
+            Start a batch: take the locks and remember the state to roll back
+            to (unless snapshot is False, for single writes).
+            """
+            entry.lock.acquire()
+            try:
+                if not entry.snapshots:
+                    store_lock = self._lock()
+                    store_lock.__enter__()
+                    entry.store_lock = store_lock
+                data = self._cached()
+                entry.snapshots.append((copy.deepcopy(data) if snapshot else None, entry.dirty))
+            except BaseException:
+                self._release(entry)
+                raise
+
+        def _end(self, entry: _ConfigCacheEntry, failed: bool):
+            try:
+                snapshot, dirty = entry.snapshots.pop()
+                if failed:
+                    if snapshot is not None:
+                        # roll back everything done inside this batch
+                        entry.data = snapshot
+                        entry.dirty = dirty
+                    elif not entry.snapshots:
+                        entry.data = None
+                        entry.stamp = None
+                        entry.dirty = False
+                if not entry.snapshots:
+                    self.flush()
+            finally:
+                self._release(entry)
+
+        def _release(self, entry: _ConfigCacheEntry):
+            try:
+                if not entry.snapshots and entry.store_lock is not None:
+                    store_lock, entry.store_lock = entry.store_lock, None
+                    store_lock.__exit__(None, None, None)
+            finally:
+                entry.lock.release()
 
         def __getitem__(self, key: str):
-            return self._load()[key]
+            if not self.use_cache:
+                return self._read()[key]
+            return _copy(self._cached()[key])
 
         def __setitem__(self, key, value):
-            config = self._load()
-            config[key] = value
-            self._save(config)
+            if not self.use_cache:
+                config = self._read()
+                config[key] = value
+                self._write(config)
+                return
+            entry = self._entry()
+            self._begin(entry, snapshot=False)
+            try:
+                config = self._cached()
+                config[key] = _copy(value)
+                self._save(config)
+            except BaseException:
+                self._end(entry, failed=True)
+                raise
+            self._end(entry, failed=False)
+
+        def __contains__(self, key) -> bool:
+            if not self.use_cache:
+                return key in self._read()
+            return key in self._cached()
 
         def __repr__(self):
             return self._load().__repr__()
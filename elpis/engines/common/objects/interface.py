@@ -1,27 +1,47 @@
-import json
 import os
 from pathlib import Path
 import shutil
+import threading
+from typing import Dict
 
 from appdirs import user_data_dir
+from elpis.engines.common.objects.blob_store import BlobStore
+from elpis.engines.common.objects.config_store import JSONFileStore, SQLiteStore, register_store, store_for
 from elpis.engines.common.objects.fsobject import FSObject
+from elpis.engines.common.objects.registry import Registry, register_registry
+from elpis.engines.common.objects.resample_cache import ResampleCache
 from elpis.engines.common.utilities import hasher
 from elpis.engines.common.utilities.logger import Logger
 from elpis.engines.common.errors import InterfaceError
 from elpis.engines.common.objects.dataset import Dataset
 from elpis.engines.common.objects.pron_dict import PronDict
+from elpis.engines.common.objects.model import Model
+from elpis.engines.common.objects.transcription import Transcription
 
 
 class Interface(FSObject):
     _config_file = 'interface.json'
+    state_stores = {
+        'json': lambda path: JSONFileStore(),
+        'sqlite': lambda path: SQLiteStore(path.joinpath('state.sqlite3'), root=path),
+    }
 
-    def __init__(self, path: Path = None, use_existing=False):
+    def __init__(self, path: Path = None, use_existing=False, state_store: str = None):
         """
         :param Boolean use_existing: If this flag is enabled and an interface
             already exists at the specified ``path``, then load the interface
             at the ``path``. When ``path`` is not specified or if the
             interface is not at the ``path``, then a new interface is created.
+        :param state_store: where the configs of the datasets, pron dicts,
+            models and transcriptions are kept, one of ``state_stores``:
+            'json' (default) for a JSON file in each object directory or
+            'sqlite' for a single database in the interface directory. It is
+            only used for new interfaces, an existing interface keeps the
+            store it was created with. The interface config itself is always
+            a JSON file.
         """
+        if state_store is not None and state_store not in self.state_stores:
+            raise InterfaceError(f'Unknown state store "{state_store}", expected one of {list(self.state_stores)}')
         path_was_none = False
         if path is None:
             path_was_none = True
@@ -76,11 +96,13 @@ class Interface(FSObject):
                 pre_allocated_hash=(path.name if path_was_none else None),
                 name=(path.name if path_was_none else None)
             )
-            self.config['loggers'] = []
-            self.config['datasets'] = {}
-            self.config['pron_dicts'] = {}
-            self.config['models'] = {}
-            self.config['transcriptions'] = {}
+            with self.config.batch():
+                self.config['state_store'] = state_store or 'json'
+                self.config['loggers'] = []
+                self.config['datasets'] = {}
+                self.config['pron_dicts'] = {}
+                self.config['models'] = {}
+                self.config['transcriptions'] = {}
 
         # === Use existing interface object ==============================
         else:
@@ -90,6 +112,8 @@ class Interface(FSObject):
                 parent_path=path.parent,
                 dir_name=path.name
             )
+            if state_store is not None and state_store != self.state_store:
+                print(f'Interface at {self.path} uses the "{self.state_store}" state store, ignoring "{state_store}"')
 
         # ensure object directories exist
         self.datasets_path = self.path.joinpath('datasets')
@@ -101,12 +125,20 @@ class Interface(FSObject):
         self.loggers_path = self.path.joinpath('loggers')
         self.loggers_path.mkdir(parents=True, exist_ok=True)
         self.transcriptions_path = self.path.joinpath('transcriptions')
+        self._register_stores()
+        # original files of all the datasets
+        self.blob_store = BlobStore(self.path.joinpath('blobs'))
+        # resampled audio of all the datasets
+        self.resample_cache = ResampleCache(self.path.joinpath('resample_cache'))
         # config objects
         self.loggers = []
-        self.datasets = {}
-        self.pron_dicts = {}
-        self.models = {}
-        self.transcriptions = {}
+        # Loaded objects by hash, so each object has a single proxy (see
+        # _loaded_object).
+        self.datasets: Dict[str, Dataset] = {}
+        self.pron_dicts: Dict[str, PronDict] = {}
+        self.models: Dict[str, Model] = {}
+        self.transcriptions: Dict[str, Transcription] = {}
+        self._loaded_lock = threading.RLock()
         # make a default logger
         self.new_logger(default=True)
         # set during runtime
@@ -124,17 +156,90 @@ class Interface(FSObject):
         self.loggers_path = self.path.joinpath('loggers')
         self.loggers_path.mkdir(parents=True, exist_ok=True)
         self.transcriptions_path = self.path.joinpath('transcriptions')
+        self._register_stores()
+        # original files of all the datasets
+        self.blob_store = BlobStore(self.path.joinpath('blobs'))
+        # resampled audio of all the datasets
+        self.resample_cache = ResampleCache(self.path.joinpath('resample_cache'))
         # config objects
         self.loggers = []
-        self.datasets = {}
-        self.pron_dicts = {}
-        self.models = {}
-        self.transcriptions = {}
+        # Loaded objects by hash, so each object has a single proxy (see
+        # _loaded_object).
+        self.datasets: Dict[str, Dataset] = {}
+        self.pron_dicts: Dict[str, PronDict] = {}
+        self.models: Dict[str, Model] = {}
+        self.transcriptions: Dict[str, Transcription] = {}
+        self._loaded_lock = threading.RLock()
         return self
 
+    @property
+    def state_store(self) -> str:
+        # Interfaces made before state stores were configurable use JSON files.
+        return self.config['state_store'] if 'state_store' in self.config else 'json'
+
+    def _object_kinds(self):
+        # kind in the registry: (directory of the objects, their base class)
+        return {
+            'datasets': (self.datasets_path, Dataset),
+            'pron_dicts': (self.pron_dicts_path, PronDict),
+            'models': (self.models_path, Model),
+            'transcriptions': (self.transcriptions_path, Transcription),
+        }
+
+    def _register_stores(self):
+        store = self.state_stores[self.state_store](self.path)
+        self.registry = Registry(self.path.joinpath('registry'), store)
+        for kind, (path, _) in self._object_kinds().items():
+            register_store(path, store)
+            register_registry(path, self.registry, kind)
+        if not self.registry.exists():
+            # State made before the registry existed.
+            self.rebuild_registry()
+
+    def rebuild_registry(self):
+        """
+        Recreate the registry from the configs of all the objects, for
+        example after object directories were removed by hand.
+        """
+        for kind, (path, object_class) in self._object_kinds().items():
+            configs = store_for(path).list_configs(f'{path}', object_class._config_file)
+            self.registry.replace(kind, [{key: config.get(key) for key in object_class._summary_keys}
+                                         for config in configs])
+
+    def _loaded_object(self, loaded: Dict[str, FSObject], object_class, path: Path):
+        """
+        The proxy of the object at path, loaded on first use. Objects are
+        loaded without the objects they link to, those are only loaded when
+        the link attribute (model.dataset, ...) is first used.
+        """
+        with self._loaded_lock:
+            obj = loaded.get(path.name)
+            # The engine may have changed since a model was loaded.
+            if type(obj) is not object_class:
+                obj = self._remember(loaded, object_class.load(path))
+            return obj
+
+    def _remember(self, loaded: Dict[str, FSObject], obj: FSObject):
+        obj._link_resolver = self._resolve_link
+        if isinstance(obj, Dataset):
+            obj.blob_store = self.blob_store
+            obj.resample_cache = self.resample_cache
+        with self._loaded_lock:
+            loaded[obj.hash] = obj
+        return obj
+
+    def _resolve_link(self, kind: str, name: str) -> FSObject:
+        getters = {
+            'dataset': self.get_dataset,
+            'pron_dict': self.get_pron_dict,
+            'model': self.get_model,
+        }
+        return getters[kind](name)
+
     def new_logger(self, default=False):
         logger = Logger(self.loggers_path)
-        self.config['loggers'] += [logger.hash]
+        with self.config.batch():
+            self.config['loggers'] += [logger.hash]
         if default:
             self.logger = logger
         return logger
@@ -146,17 +251,18 @@ class Interface(FSObject):
                 f'Tried adding \'{dsname}\' which is already in {existing_names} with hash {self.config["datasets"][dsname]}.',
                 human_message=f'Dataset with name "{dsname}" already exists'
             )
-        ds = Dataset(parent_path=self.datasets_path, name=dsname)
-        datasets = self.config['datasets']
-        datasets[dsname] = ds.hash
-        self.config['datasets'] = datasets
+        ds = self._remember(self.datasets, Dataset(parent_path=self.datasets_path, name=dsname))
+        with self.config.batch():
+            datasets = self.config['datasets']
+            datasets[dsname] = ds.hash
+            self.config['datasets'] = datasets
         return ds
 
     def get_dataset(self, dsname):
         if dsname not in self.list_datasets():
             raise InterfaceError(f'Tried to load a dataset called "{dsname}" that does not exist')
         hash_dir = self.config['datasets'][dsname]
-        return Dataset.load(self.datasets_path.joinpath(hash_dir))
+        return self._loaded_object(self.datasets, Dataset, self.datasets_path.joinpath(hash_dir))
 
     def list_datasets(self):
         names = [name for name in self.config['datasets'].keys()]
@@ -169,31 +275,26 @@ class Interface(FSObject):
                 f'Tried adding \'{pdname}\' which is already in {existing_names} with hash {self.config["pron_dicts"][pdname]}.',
                 human_message=f'Pronunciation dictionary with name "{pdname}" already exists'
             )
-        pd = PronDict(parent_path=self.pron_dicts_path, name=pdname)
-        pron_dicts = self.config['pron_dicts']
-        pron_dicts[pdname] = pd.hash
-        self.config['pron_dicts'] = pron_dicts
+        pd = self._remember(self.pron_dicts, PronDict(parent_path=self.pron_dicts_path, name=pdname))
+        with self.config.batch():
+            pron_dicts = self.config['pron_dicts']
+            pron_dicts[pdname] = pd.hash
+            self.config['pron_dicts'] = pron_dicts
         return pd
 
     def get_pron_dict(self, pdname):
         if pdname not in self.list_pron_dicts():
             raise InterfaceError(f'Tried to load a pron dict called "{pdname}" that does not exist')
         hash_dir = self.config['pron_dicts'][pdname]
-        pd = PronDict.load(self.pron_dicts_path.joinpath(hash_dir))
-        pd.dataset = self.get_dataset(pd.config['dataset_name'])
-        return pd
+        return self._loaded_object(self.pron_dicts, PronDict, self.pron_dicts_path.joinpath(hash_dir))
 
     def list_pron_dicts(self):
         names = [name for name in self.config['pron_dicts'].keys()]
         return names
 
     def list_pron_dicts_verbose(self):
-        pron_dicts = []
-        names = [name for name in self.config['pron_dicts'].keys()]
-        for name in names:
-            pd = self.get_pron_dict(name)
-            pron_dicts.append({"name": name, "dataset_name": pd.dataset.name})
-        return pron_dicts
+        return [{"name": pron_dict['name'], "dataset_name": pron_dict['dataset_name']}
+                for pron_dict in self.registry.list('pron_dicts')]
 
     def new_model(self, mname):
         if self.engine is None:
@@ -204,10 +305,11 @@ class Interface(FSObject):
                 f'Tried adding \'{mname}\' which is already in {existing_names} with hash {self.config["models"][mname]}.',
                 human_message=f'Model with name "{mname}" already exists'
             )
-        m = self.engine.model(parent_path=self.models_path, name=mname)
-        models = self.config['models']
-        models[mname] = m.hash
-        self.config['models'] = models
+        m = self._remember(self.models, self.engine.model(parent_path=self.models_path, name=mname))
+        with self.config.batch():
+            models = self.config['models']
+            models[mname] = m.hash
+            self.config['models'] = models
         return m
 
     def get_model(self, mname):
@@ -216,71 +318,48 @@ class Interface(FSObject):
         if mname not in self.list_models():
             raise InterfaceError(f'Tried to load a model called "{mname}" that does not exist')
         hash_dir = self.config['models'][mname]
-        m = self.engine.model.load(self.models_path.joinpath(hash_dir))
-        m.dataset = self.get_dataset(m.config['dataset_name'])
-        if m.config['pron_dict_name'] is not None:
-            m.pron_dict = self.get_pron_dict(m.config['pron_dict_name'])
-        return m
+        return self._loaded_object(self.models, self.engine.model, self.models_path.joinpath(hash_dir))
 
     def list_models(self):
-        models = []
-        for hash_dir in os.listdir(f'{self.models_path}'):
-            if not hash_dir.startswith('.'):
-                with self.models_path.joinpath(hash_dir, "model.json").open() as fin:
-                    name = json.load(fin)['name']
-                    models.append(name)
-        return models
+        return [model['name'] for model in self.registry.list('models')]
 
     def list_models_verbose(self):
         models = []
-        for hash_dir in os.listdir(f'{self.models_path}'):
-            if not hash_dir.startswith('.'):
-                config_file_path = self.models_path.joinpath(hash_dir, "model.json")
-                if os.path.isfile(config_file_path):
-                    with config_file_path.open() as model_config_file:
-                        model = json.load(model_config_file)
-                        model_info = {
-                            'name': model['name'],
-                            'dataset_name': model['dataset_name'],
-                            'engine_name': model['engine_name'],
-                            'pron_dict_name': model['pron_dict_name'],
-                            'status': model['status'],
-                            'results': model['results']
-                        }
-                        models.append(model_info)
+        for model in self.registry.list('models'):
+            model_info = {
+                'name': model['name'],
+                'dataset_name': model['dataset_name'],
+                'engine_name': model['engine_name'],
+                'pron_dict_name': model['pron_dict_name'],
+                'status': model['status'],
+                'results': model['results']
+            }
+            models.append(model_info)
         return models
 
     def new_transcription(self, tname):
         if self.engine is None:
             raise RuntimeError("Engine must be set prior to transcription")
         print("{}".format(self.engine))
-        t = self.engine.transcription(parent_path=self.transcriptions_path, name=tname)
-        transcriptions = self.config['transcriptions']
-        transcriptions[tname] = t.hash
-        self.config['transcriptions'] = transcriptions
+        t = self._remember(self.transcriptions,
+                           self.engine.transcription(parent_path=self.transcriptions_path, name=tname))
+        with self.config.batch():
+            transcriptions = self.config['transcriptions']
+            transcriptions[tname] = t.hash
+            self.config['transcriptions'] = transcriptions
         return t
 
     def get_transcription(self, tname):
         if tname not in self.list_transcriptions():
             raise InterfaceError(f'Tried to load a transcription called "{tname}" that does not exist')
         hash_dir = self.config['transcriptions'][tname]
-        t = self.engine.transcription.load(self.transcriptions_path.joinpath(hash_dir))
-        t.model = self.get_model(t.config['model_name'])
-        return t
+        return self._loaded_object(self.transcriptions, self.engine.transcription,
+                                   self.transcriptions_path.joinpath(hash_dir))
 
     def list_transcriptions(self):
         if self.engine is None:
             raise RuntimeError("Engine must be set to list transcriptions")
-        names = []
-        if not Path(f'{self.transcriptions_path}').exists():
-            return names # no directory -> no items in list
-        for hash_dir in os.listdir(f'{self.transcriptions_path}'):
-            if not hash_dir.startswith('.'):
-                with self.transcriptions_path.joinpath(
-                        hash_dir, self.engine.transcription._config_file).open() as fin:
-                    name = json.load(fin)['name']
-                    names.append(name)
-        return names
+        return [transcription['name'] for transcription in self.registry.list('transcriptions')]
 
     def set_engine(self, engine):
         self.engine = engine
@@ -1,8 +1,9 @@
 from pathlib import Path
 from typing import Optional, Tuple, Dict
 
+from elpis.engines.common.input.resample import RESAMPLE_FORMAT
 from elpis.engines.common.objects.dataset import Dataset
-from elpis.engines.common.objects.fsobject import FSObject
+from elpis.engines.common.objects.fsobject import FSObject, LinkedObject
 from elpis.engines.common.objects.path_structure import PathStructure
 
 
@@ -10,26 +11,23 @@ class ModelFiles(object):
     def __init__(self, basepath: Path):
         self.kaldi = PathStructure(basepath)
 
-class Model(FSObject):  # TODO not thread safe
+class Model(FSObject):
     _config_file = 'model.json'
     _links = {**FSObject._links, **{"dataset": Dataset}}
+    _summary_keys = (*FSObject._summary_keys,
+                     'dataset_name', 'engine_name', 'pron_dict_name', 'status', 'results')
+    dataset = LinkedObject('dataset_name', 'dataset')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.dataset: Optional[Dataset] = None
-        self.config['dataset_name'] = None  # dataset hash has not been linked
-        self.config['status'] = 'untrained'
-        self.config['stage_status'] = {}
-        # TODO check if this is used, all the other things here are config settings
-        self.status = 'untrained'
-        self.config['engine_name'] = None  # use this to set engine if loading a model later
-        self.config['results'] = None
-
-    @classmethod
-    def load(cls, base_path: Path):
-        self = super().load(base_path)
-        self.dataset = None
-        return self
+        with self.config.batch():
+            self.config['dataset_name'] = None  # dataset hash has not been linked
+            self.config['status'] = 'untrained'
+            self.config['stage_status'] = {}
+            # TODO check if this is used, all the other things here are config settings
+            self.status = 'untrained'
+            self.config['engine_name'] = None  # use this to set engine if loading a model later
+            self.config['results'] = None
 
     @property
     def status(self):
@@ -58,26 +56,52 @@ class Model(FSObject):  # TODO not thread safe
     @stage_status.setter
     def stage_status(self, status_info: Tuple[str, str, str, str]):
         stage, status, message, log = status_info
-        stage_status = self.config['stage_status']
-        stage_status[stage]['status'] = status
-        stage_status[stage]['message'] = message
-        stage_status[stage]['log'] = log
-        self.config['stage_status'] = stage_status
+        with self.config.batch():
+            stage_status = self.config['stage_status']
+            stage_status[stage]['status'] = status
+            stage_status[stage]['message'] = message
+            stage_status[stage]['log'] = log
+            self.config['stage_status'] = stage_status
 
     @results.setter
     def results(self, value: str):
         self.config['results'] = value
 
     def build_stage_status(self, stage_names: Dict[str, str]):
-        for stage_file, stage_name in stage_names.items():
-            stage_status = self.config['stage_status']
-            stage_status.update({stage_file: {
-                'name': stage_name,
-                'status': 'ready',
-                'message': '',
-                'log': ''
-            }})
-            self.config['stage_status'] = stage_status
+        with self.config.batch():
+            for stage_file, stage_name in stage_names.items():
+                stage_status = self.config['stage_status']
+                stage_status.update({stage_file: {
+                    'name': stage_name,
+                    'status': 'ready',
+                    'message': '',
+                    'log': ''
+                }})
+                self.config['stage_status'] = stage_status
+
+    @property
+    def audio_format(self) -> Dict[str, int]:
+        """
+        Bits per sample, channels and sample rate of the audio the model is
+        trained on, which audio to transcribe is resampled to.
+        """
+        if 'audio_format' in self.config:
+            return self.config['audio_format']
+        # models trained before the format could be chosen
+        return dict(RESAMPLE_FORMAT)
+
+    def _use_dataset_audio_format(self):
+        """
+        Train on the audio format of the dataset.
+
+        :raises:
+            RuntimeError: if the audio format of the dataset changed since it
+                was processed, so its audio is not in that format yet.
+        """
+        if self.dataset.processed_audio_format != self.dataset.audio_format:
+            raise RuntimeError(f'dataset audio is resampled to {self.dataset.processed_audio_format}, '
+                               f'process the dataset again to resample it to {self.dataset.audio_format}')
+        self.config['audio_format'] = self.dataset.processed_audio_format
 
     def link_dataset(self, dataset: Dataset):
         self.dataset = dataset
@@ -3,7 +3,7 @@ from pathlib import Path
 from io import BufferedIOBase
 
 from elpis.engines.common.objects.dataset import Dataset
-from elpis.engines.common.objects.fsobject import FSObject
+from elpis.engines.common.objects.fsobject import FSObject, LinkedObject
 from elpis.engines.common.input.make_prn_dict import generate_pronunciation_dictionary
 
 
@@ -11,22 +11,23 @@ class PronDict(FSObject):
     # The configuration settings stored in the file below.
     _config_file = 'pron_dict.json'
     _links = {**FSObject._links, **{"dataset": Dataset}}
+    _summary_keys = (*FSObject._summary_keys, 'dataset_name')
+    dataset = LinkedObject('dataset_name', 'dataset')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.dataset: Dataset = None
-        self.config['dataset'] = None  # dataset hash has not been linked # TODO: change 'dataset' to 'dataset_name'
         self.l2s_path = self.path.joinpath('l2s.txt')
         self.lexicon_txt_path = self.path.joinpath('lexicon.txt') #TODO change to lexicon_txt_path
-        self.config['l2s'] = False  # file has not been uploaded
-        self.config['lexicon'] = False  # file has not been generated
+        with self.config.batch():
+            self.config['dataset'] = None  # dataset hash has not been linked # TODO: change 'dataset' to 'dataset_name'
+            self.config['l2s'] = False  # file has not been uploaded
+            self.config['lexicon'] = False  # file has not been generated
 
     @classmethod
     def load(cls, base_path: Path):
         self = super().load(base_path)
         self.l2s_path = self.path.joinpath('l2s.txt')
         self.lexicon_txt_path = self.path.joinpath('lexicon.txt')
-        self.dataset = None
         return self
 
     @property
@@ -49,8 +50,9 @@ class PronDict(FSObject):
 
     def link(self, dataset: Dataset):
         self.dataset = dataset
-        self.config['dataset'] = dataset.name
-        self.config['dataset_name'] = dataset.name
+        with self.config.batch():
+            self.config['dataset'] = dataset.name
+            self.config['dataset_name'] = dataset.name
 
     def set_l2s_path(self, path: Path):
         path = Path(path)
@@ -0,0 +1,124 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from elpis.engines.common.objects.config_store import ConfigStore
+
+
+# Object registry
+# ===============
+# The registry is a single document listing a summary (name, hash, links,
+# status, ...) of every object of an interface, grouped by kind ('datasets',
+# 'models', ...), so that listing objects is one read instead of one read per
+# object. FSObjects record their summary whenever their config is saved (see
+# FSObject._summary_keys), the registry is only written when a summary
+# actually changed. It is kept in the interface's config store, in its own
+# directory so that locking it never contends with locking the interface
+# config.
+
+
+class Registry(object):
+    """
+    Summaries of the objects of one interface, kept by a config store.
+    """
+    _file_name = 'registry.json'
+
+    def __init__(self, path: Union[str, Path], store: ConfigStore):
+        self.path = f'{path}'
+        self.store = store
+        os.makedirs(self.path, exist_ok=True)
+        self._data: Optional[Dict[str, Dict[str, dict]]] = None
+        self._stamp = None
+        self._lock = threading.RLock()
+
+    def exists(self) -> bool:
+        return self.store.exists(self.path, self._file_name)
+
+    def _current(self) -> Dict[str, Dict[str, dict]]:
+        # The shared cached registry, re-read when another process changed it.
+        with self._lock:
+            try:
+                stamp = self.store.stamp(self.path, self._file_name)
+            except FileNotFoundError:
+                self._data, self._stamp = {}, None
+                return self._data
+            if self._data is None or stamp != self._stamp:
+                with self.store.lock(self.path, shared=True):
+                    self._stamp = self.store.stamp(self.path, self._file_name)
+                    self._data = self.store.read(self.path, self._file_name)
+            return self._data
+
+    def _update(self, change):
+        # Read-modify-write under the store lock so no update is lost. Read
+        # the store directly, _current() would ask for a shared lock.
+        with self._lock, self.store.lock(self.path):
+            try:
+                data = self.store.read(self.path, self._file_name)
+            except FileNotFoundError:
+                data = {}
+            change(data)
+            self._stamp = self.store.write(self.path, self._file_name, data)
+            self._data = data
+
+    def record(self, kind: str, summary: dict):
+        """
+        Add or update the summary of an object, identified by its hash.
+        """
+        with self._lock:
+            if self._current().get(kind, {}).get(summary['hash']) == summary:
+                return
+
+            def change(data):
+                data.setdefault(kind, {})[summary['hash']] = summary
+            self._update(change)
+
+    def remove(self, kind: str, hash: str):
+        with self._lock:
+            if hash not in self._current().get(kind, {}):
+                return
+
+            def change(data):
+                data.get(kind, {}).pop(hash, None)
+            self._update(change)
+
+    def replace(self, kind: str, summaries: List[dict]):
+        """
+        Set all the summaries of a kind at once, for rebuilding the registry.
+        """
+        def change(data):
+            data[kind] = {summary['hash']: summary for summary in summaries}
+        self._update(change)
+
+    def list(self, kind: str, **match) -> List[dict]:
+        """
+        Summaries of the objects of a kind, oldest first.
+
+        :param match: only list objects with these values, for example
+            ``status='trained'``.
+        """
+        with self._lock:
+            summaries = [dict(summary) for summary in self._current().get(kind, {}).values()
+                         if all(summary.get(key) == value for key, value in match.items())]
+        # date is a str(time.time())
+        return sorted(summaries, key=lambda summary: float(summary.get('date') or 0))
+
+
+_registries: Dict[str, Tuple[Registry, str]] = {}
+_registries_lock = threading.Lock()
+
+
+def register_registry(parent_path: Union[str, Path], registry: Registry, kind: str):
+    """
+    Record the summaries of the objects in parent_path as kind in registry.
+    """
+    with _registries_lock:
+        _registries[os.path.abspath(f'{parent_path}')] = (registry, kind)
+
+
+def registry_for(path: Union[str, Path]) -> Optional[Tuple[Registry, str]]:
+    """
+    The registry (and kind) the object at path belongs to, if any.
+    """
+    with _registries_lock:
+        return _registries.get(os.path.dirname(os.path.abspath(f'{path}')))
@@ -0,0 +1,117 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from elpis.engines.common.utilities import link_or_copy
+
+
+# Size the cache is trimmed to after files are added, in bytes. Can be set
+# with the ELPIS_RESAMPLE_CACHE_SIZE environment variable.
+RESAMPLE_CACHE_SIZE = int(os.environ.get('ELPIS_RESAMPLE_CACHE_SIZE', 20 * 1024 ** 3))
+
+
+class ResampleCache(object):
+    """
+    Cache of resampled audio shared by all the datasets of an interface, so
+    that a recording is only resampled once to each format, however many
+    datasets use it and however often they are processed.
+
+    Entries are keyed by the SHA-256 digest of the source audio and the
+    target format. They are hard linked (or copied) into the resampled
+    directories of datasets, so evicting an entry does not break the datasets
+    using it. When the cache grows over max_size, the least recently used
+    entries are evicted.
+
+    The size of the cache is kept as a running total, counted once and then
+    updated as entries are added, so that adding an entry does not list the
+    whole cache. Entries added by other processes are only counted at the
+    next eviction, which recounts the cache.
+    """
+    def __init__(self, path: Union[str, Path], max_size: int = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = RESAMPLE_CACHE_SIZE if max_size is None else max_size
+        self._size: Optional[int] = None
+        self._size_lock = threading.Lock()
+
+    @staticmethod
+    def key(digest: str, audio_format: Dict[str, int]) -> str:
+        return f"{digest}-{audio_format['bits']}b{audio_format['channels']}c{audio_format['rate']}"
+
+    def entry_path(self, key: str) -> Path:
+        return self.path.joinpath(key[:2], f'{key}.wav')
+
+    def get(self, key: str, destination: Union[str, Path]) -> bool:
+        """
+        Link the entry for key to destination, if there is one.
+
+        :return: True if the entry was in the cache.
+        """
+        entry_path = self.entry_path(key)
+        try:
+            # The modification time is when the entry was last used.
+            os.utime(entry_path)
+            link_or_copy(entry_path, destination)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, file_path: Union[str, Path], destination: Union[str, Path]):
+        """
+        Move the resampled file at file_path into the cache under key and
+        link it to destination, then evict entries if the cache is too big.
+        """
+        entry_path = self.entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        try:
+            replaced = entry_path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        added = os.stat(file_path).st_size
+        link_or_copy(file_path, entry_path)
+        link_or_copy(entry_path, destination)
+        os.unlink(file_path)
+        with self._size_lock:
+            if self._size is None:
+                self._size = self._entries_size()
+            else:
+                self._size += added - replaced
+            over = self._size > self.max_size
+        if over:
+            self.evict()
+
+    def _entries_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for entry_path in self.path.glob('*/*.wav'):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Delete the least recently used entries until the cache is no bigger
+        than max_size.
+
+        :return: the number of bytes freed.
+        """
+        entries = self._entries()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        freed = 0
+        for _, entry_size, entry_path in sorted(entries):
+            if size - freed <= self.max_size:
+                break
+            try:
+                entry_path.unlink()
+            except FileNotFoundError:
+                continue
+            freed += entry_size
+        with self._size_lock:
+            self._size = size - freed
+        return freed
@@ -1,29 +1,29 @@
 from abc import abstractmethod
 from pathlib import Path
 from elpis.engines.common.objects.model import Model
-from elpis.engines.common.objects.fsobject import FSObject
+from elpis.engines.common.objects.fsobject import FSObject, LinkedObject
 from typing import Callable, Dict, Tuple
 
 class Transcription(FSObject):
     _config_file = "transcription.json"
+    _summary_keys = (*FSObject._summary_keys, 'model_name', 'status')
+    model = LinkedObject('model_name', 'model')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.model = None
-        self.config["model_name"] = None
-        self.config["status"] = "ready"
         self.type = None
         self._exporter = None
-        self.config['exporter'] = None
-        self.config['has_been_transcribed'] = False
-        self.config['stage_status'] = {}
+        with self.config.batch():
+            self.config["model_name"] = None
+            self.config["status"] = "ready"
+            self.config['exporter'] = None
+            self.config['has_been_transcribed'] = False
+            self.config['stage_status'] = {}
         self.audio_filename = None
 
     @classmethod
     def load(cls, base_path: Path):
         self = super().load(base_path)
-        self.model = None
-
         self._exporter = self.config['exporter']
         if self._exporter != None:
             exporter_name = self._exporter['name']
@@ -49,10 +49,11 @@ class Transcription(FSObject):
     @stage_status.setter
     def stage_status(self, vals: Tuple[str, str, str]):
         stage, status, message = vals
-        stage_status = self.config['stage_status']
-        stage_status[stage]['status'] = status
-        stage_status[stage]['message'] = message
-        self.config['stage_status'] = stage_status
+        with self.config.batch():
+            stage_status = self.config['stage_status']
+            stage_status[stage]['status'] = status
+            stage_status[stage]['message'] = message
+            self.config['stage_status'] = stage_status
     
     @property
     def state(self):
@@ -74,10 +75,11 @@ class Transcription(FSObject):
         return self._exporter
 
     def build_stage_status(self, stage_names: Dict[str, str]):
-        for stage_file, stage_name in stage_names.items():
-            stage_status = self.config['stage_status']
-            stage_status.update({stage_file: {'name': stage_name, 'status': 'ready', 'message': ''}})
-            self.config['stage_status'] = stage_status
+        with self.config.batch():
+            for stage_file, stage_name in stage_names.items():
+                stage_status = self.config['stage_status']
+                stage_status.update({stage_file: {'name': stage_name, 'status': 'ready', 'message': ''}})
+                self.config['stage_status'] = stage_status
 
     @abstractmethod
     def transcribe(self, *args, **kwargs):
@@ -1,3 +1,5 @@
 from .file_utilities import *
 from .json_utilities import *
 from .globals import *
+from .system_utilities import *
+from .annotation_utilities import *
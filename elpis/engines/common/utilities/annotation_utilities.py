@@ -0,0 +1,130 @@
+"""
+Collection of utilities for writing and reading the annotations of a dataset.
+
+Annotations are stored as JSON Lines, one utterance per line, so that they
+can be written as they are produced and read one at a time, whatever the
+size of the corpus. Next to the annotations, an index of the offset of each
+line (a .idx file of 64 bit integers) allows to count the annotations and
+read any one of them without reading the others.
+
+Files holding a single JSON list (annotations.json, from older versions) can
+still be read, but are loaded whole.
+"""
+
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Union
+
+
+def _index_path(file_path: Union[str, Path]) -> str:
+    return f'{file_path}.idx'
+
+
+class AnnotationWriter(object):
+    """
+    Writes annotations to a JSON Lines file and its offset index. The files
+    are written next to their destination and only replace it when the
+    writer is closed without error, so readers never see a partial file.
+
+    Use as a context manager:
+        with AnnotationWriter(path) as writer:
+            writer.write(annotation)
+    """
+    def __init__(self, file_path: Union[str, Path]):
+        self.file_path = f'{file_path}'
+        self._temporary_path = f'{file_path}.{os.getpid()}.tmp'
+        self._file = open(self._temporary_path, mode='w', encoding='utf-8')
+        self._offsets = array('Q')
+        self._offset = 0
+
+    def write(self, annotation: Dict):
+        line = json.dumps(annotation, ensure_ascii=False) + '\n'
+        self._offsets.append(self._offset)
+        self._file.write(line)
+        self._offset += len(line.encode('utf-8'))
+
+    def write_all(self, annotations: Iterable[Dict]):
+        for annotation in annotations:
+            self.write(annotation)
+
+    def close(self):
+        self._file.close()
+        with open(f'{self._temporary_path}.idx', mode='wb') as fout:
+            self._offsets.tofile(fout)
+        os.replace(f'{self._temporary_path}.idx', _index_path(self.file_path))
+        os.replace(self._temporary_path, self.file_path)
+
+    def abort(self):
+        self._file.close()
+        os.unlink(self._temporary_path)
+
+    def __enter__(self) -> 'AnnotationWriter':
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_annotations(file_path: Union[str, Path], annotations: Iterable[Dict]) -> None:
+    """
+    Write the annotations to file_path (as JSON Lines) and its offset index.
+    """
+    with AnnotationWriter(file_path) as writer:
+        writer.write_all(annotations)
+
+
+def iter_annotations(file_path: Union[str, Path]) -> Iterator[Dict]:
+    """
+    Read the annotations in file_path one at a time. A missing or empty file
+    has no annotations.
+    """
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return
+    with open(file_path, mode='r', encoding='utf-8') as fin:
+        first = fin.read(1)
+        while first.isspace():
+            first = fin.read(1)
+        fin.seek(0)
+        if first == '[':
+            # a JSON list, as written by older versions
+            yield from json.load(fin)
+            return
+        for line in fin:
+            if line.strip():
+                yield json.loads(line)
+
+
+def count_annotations(file_path: Union[str, Path]) -> int:
+    """
+    Number of annotations in file_path, from its index if it has one.
+    """
+    index_path = _index_path(file_path)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(file_path):
+        return os.path.getsize(index_path) // array('Q').itemsize
+    return sum(1 for _ in iter_annotations(file_path))
+
+
+def read_annotation(file_path: Union[str, Path], position: int) -> Dict:
+    """
+    Read the annotation at position (counting from 0) in file_path, using
+    its offset index.
+
+    :raises:
+        IndexError: if there is no annotation at that position.
+    """
+    if position < 0:
+        raise IndexError(f'no annotation at position {position} in {file_path}')
+    offsets = array('Q')
+    with open(_index_path(file_path), mode='rb') as fin:
+        fin.seek(position * offsets.itemsize)
+        offsets.frombytes(fin.read(offsets.itemsize))
+    if len(offsets) == 0:
+        raise IndexError(f'no annotation at position {position} in {file_path}')
+    with open(file_path, mode='rb') as fin:
+        fin.seek(offsets[0])
+        return json.loads(fin.readline().decode('utf-8'))
@@ -6,9 +6,22 @@ Contributors:
              Nicholas Lambourne - (University of Queensland, 2018)
 """
 
+import errno
 import glob
+import hashlib
+import io
 import os
-from typing import Set, List
+import shutil
+import stat
+import threading
+import time
+from typing import BinaryIO, List, NamedTuple, Optional, Set
+
+
+# Size of the chunks files are copied in, which bounds the memory used to copy
+# a file whatever its size. Can be set (in bytes) with the
+# ELPIS_COPY_BUFFER_SIZE environment variable.
+COPY_BUFFER_SIZE = int(os.environ.get('ELPIS_COPY_BUFFER_SIZE', 1024 * 1024))
 
 
 def find_files_by_extensions(set_of_all_files: Set[str], extensions: Set[str]) -> Set[str]:
@@ -52,3 +65,131 @@ def find_all_files_in_dir_by_extensions(directory_path: str, extensions: Set[str
     path = str(os.path.join(directory_path, "**"))
     all_files_in_dir: Set[str] = set(glob.glob(path, recursive=True))
     return find_files_by_extensions(all_files_in_dir, extensions)
+
+
+class CopyResult(NamedTuple):
+    size: int  # bytes copied
+    seconds: float
+    digest: Optional[str]  # SHA-256 of the bytes copied, as hex
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.size / self.seconds if self.seconds > 0 else float('inf')
+
+    def __str__(self):
+        return f'{self.size} bytes in {self.seconds:.2f}s ({self.bytes_per_second / 1e6:.1f} MB/s)'
+
+
+def copy_stream(fin: BinaryIO, fout: BinaryIO, digest: bool = True,
+                buffer_size: int = None) -> CopyResult:
+    """
+    Copy the rest of fin to fout in chunks of buffer_size bytes, so memory use
+    does not depend on the size of the file.
+
+    :param fin: binary file object to read from, from its current position.
+    :param fout: binary file object to write to.
+    :param digest: compute the SHA-256 of the content while copying. Without
+        it, copies between real files are done by the kernel
+        (copy_file_range or sendfile) where possible.
+    :param buffer_size: size of the chunks, COPY_BUFFER_SIZE by default.
+    :return: how much was copied, how long it took and the digest (or None).
+    """
+    buffer_size = buffer_size or COPY_BUFFER_SIZE
+    start = time.perf_counter()
+    size = None
+    if not digest:
+        size = _copy_between_files(fin, fout, buffer_size)
+    sha = hashlib.sha256() if digest else None
+    if size is None:
+        size = 0
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        readinto = getattr(fin, 'readinto', None)
+        while True:
+            if readinto is not None:
+                count = readinto(buffer) or 0
+                chunk = view[:count]
+            else:
+                chunk = fin.read(buffer_size)
+                count = len(chunk)
+            if count == 0:
+                break
+            if sha is not None:
+                sha.update(chunk)
+            fout.write(chunk)
+            size += count
+    return CopyResult(size=size,
+                      seconds=time.perf_counter() - start,
+                      digest=sha.hexdigest() if sha is not None else None)
+
+
+def _copy_between_files(fin: BinaryIO, fout: BinaryIO, buffer_size: int) -> Optional[int]:
+    """
+    Copy fin to fout without going through user space, if both are real
+    files. Returns None (having copied nothing) when this is not possible.
+    """
+    try:
+        in_fd = fin.fileno()
+        out_fd = fout.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(os.fstat(in_fd).st_mode):
+        return None
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    fout.flush()
+    offset = fin.tell()
+    size = 0
+    while True:
+        try:
+            if copy_file_range is not None:
+                count = copy_file_range(in_fd, out_fd, buffer_size, offset)
+            else:
+                count = os.sendfile(out_fd, in_fd, offset, buffer_size)
+        except OSError as error:
+            if size == 0 and error.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                             errno.EOPNOTSUPP, errno.EBADF):
+                return None
+            raise
+        if count == 0:
+            break
+        offset += count
+        size += count
+    fin.seek(offset)
+    return size
+
+
+def file_digest(file_path: str, buffer_size: int = None) -> str:
+    """
+    SHA-256 digest of the content of the file at file_path, as hex.
+    """
+    buffer_size = buffer_size or COPY_BUFFER_SIZE
+    sha = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(file_path, mode='rb', buffering=0) as fin:
+        while True:
+            count = fin.readinto(buffer)
+            if not count:
+                break
+            sha.update(view[:count])
+    return sha.hexdigest()
+
+
+def link_or_copy(source: str, destination: str):
+    """
+    Make destination a hard link to source, or a copy of it if the two are on
+    different file systems. An existing file at destination is replaced
+    atomically, and never written through.
+    """
+    directory, name = os.path.split(f'{destination}')
+    temporary_path = os.path.join(directory, f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        try:
+            os.link(source, temporary_path)
+        except OSError:
+            shutil.copyfile(source, temporary_path)
+        os.replace(temporary_path, destination)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
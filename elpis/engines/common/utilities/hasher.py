@@ -1,7 +1,45 @@
-from hashlib import md5
-from time import time
+import os
+import threading
+from time import time_ns
 
+# Ids are UUID version 7 (RFC 9562) written as 32 lowercase hex digits, which
+# keeps them valid as hex numbers (FSObject.__hash__) and as directory names:
+#   48 bits  Unix time in milliseconds
+#    4 bits  version (7)
+#   12 bits  counter, incremented for ids made in the same millisecond
+#    2 bits  variant (0b10)
+#   62 bits  random
+# Ids made by one process sort in the order they were made, ids made by
+# different processes differ in their random bits.
 
-def new():
-    # Meant to give a unique hash. TODO: fix to ensure it does.
-    return md5(bytes(str(time()), 'utf-8')).hexdigest()
+_lock = threading.Lock()
+_last_millis = 0
+_counter = 0
+
+
+def new() -> str:
+    """
+    Make a new unique id. Ids sort (as strings) in creation order, so
+    listing object directories by name lists them oldest first.
+
+    :return: the id as 32 lowercase hex digits.
+    """
+    global _last_millis, _counter
+    with _lock:
+        millis = time_ns() // 1_000_000
+        if millis > _last_millis:
+            _last_millis = millis
+            # Random start in the lower half leaves room to count up.
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+        else:
+            # Same millisecond, or the clock went back: keep counting from
+            # the last id so that ids still increase.
+            _counter += 1
+            if _counter > 0xfff:
+                _last_millis += 1
+                _counter = 0
+            millis = _last_millis
+        counter = _counter
+    random = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (millis << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random
+    return f'{value:032x}'
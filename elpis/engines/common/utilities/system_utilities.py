@@ -0,0 +1,47 @@
+"""
+Collection of utilities for finding out about the system Elpis runs on.
+"""
+
+import os
+from typing import Optional
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """
+    Number of CPUs the cgroup of this process may use, if it is limited.
+    """
+    try:
+        # cgroup v2: "<quota> <period>", quota is "max" if unlimited
+        with open('/sys/fs/cgroup/cpu.max') as fin:
+            quota, period = fin.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota is -1 if unlimited
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as fin:
+            quota = int(fin.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as fin:
+            period = int(fin.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """
+    Number of CPUs this process can use, taking CPU affinity and container
+    (cgroup) CPU limits into account, which os.cpu_count() does not.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, int(limit)))
+    return max(1, cpus)
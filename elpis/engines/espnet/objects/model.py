@@ -75,6 +75,7 @@ class EspnetModel(BaseModel):
 
     def build_structure(self):
         print("BUILD STRUCTURE")
+        self._use_dataset_audio_format()
         # NOTE Since the ESPnet data is similar to Kaldi in terms of formatting requirements,
         # code is unfortunately being duplicated from KaldiModel.
         # I'm not sure the best way to get around this, but calling create_kaldi_structure()
@@ -90,7 +91,7 @@ class EspnetModel(BaseModel):
         if dataset_corpus_txt.exists():
             shutil.copy(f'{dataset_corpus_txt}', f'{model_corpus_txt}')
         create_kaldi_structure(
-            input_json=f'{self.dataset.pathto.annotation_json}',
+            input_json=f'{self.dataset.annotations_path}',
             output_folder=f'{output_path}',
             silence_markers=False,
             corpus_txt=f'{model_corpus_txt}'
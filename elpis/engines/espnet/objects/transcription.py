@@ -2,6 +2,7 @@ from pathlib import Path
 from elpis.engines.common.input.resample import resample
 from elpis.engines.common.input.vad import get_chunks
 from elpis.engines.common.objects.transcription import Transcription as BaseTranscription
+from elpis.engines.common.utilities import copy_stream
 from elpis.engines.common.output.raw_to_elan import convert_raw_to_elan
 import subprocess
 from typing import Callable, Iterable, Tuple
@@ -62,9 +63,10 @@ class EspnetTranscription(BaseTranscription):
         #     shutil.copy(f'{audio}', f'{tmp_file_path}')
         # elif isinstance(audio, BufferedIOBase):
         with tmp_file_path.open(mode='wb') as fout:
-            fout.write(audio.read())
+            copy_stream(audio, fout, digest=False)
         # resample the audio file
-        resample(tmp_file_path, self.path.joinpath('audio.wav'))
+        # to the format the model was trained on
+        resample(tmp_file_path, self.path.joinpath('audio.wav'), self.model.audio_format)
 
     def _generate_inference_files(self, utt_duration=10.0):
         """ Prepare the files we need for inference, based on the audio we receive.
@@ -19,10 +19,11 @@ Contributors:
 """
 
 import argparse
-import json
 import os
 import uuid
-from typing import Dict, List, TextIO
+from typing import Dict, Iterable, List, TextIO
+
+from elpis.engines.common.utilities import iter_annotations
 
 
 class KaldiInput:
@@ -177,12 +178,10 @@ def create_kaldi_structure(input_json: str,
     testing_input = KaldiInput(output_folder=f"{output_folder}/testing")
     training_input = KaldiInput(output_folder=f"{output_folder}/training")
 
-    try:
-        with open(input_json, "r") as input_file:
-            json_transcripts: str = json.loads(input_file.read())
-    except FileNotFoundError:
+    if not os.path.exists(input_json):
         print(f"JSON file could not be found: {input_json}")
         return
+    json_transcripts: Iterable[dict] = iter_annotations(input_json)
 
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
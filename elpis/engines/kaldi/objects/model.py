@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import Callable, Dict, Tuple
 import threading
 from elpis.engines.common.objects.command import run
+from elpis.engines.common.objects.fsobject import LinkedObject
 from elpis.engines.common.objects.model import Model as BaseModel
 from elpis.engines.common.objects.dataset import Dataset
 from elpis.engines.common.objects.pron_dict import PronDict
@@ -15,15 +16,12 @@ from subprocess import CalledProcessError
 from jinja2 import Template
 
 
-class KaldiModel(BaseModel):  # TODO not thread safe
+class KaldiModel(BaseModel):
     # _links = {**Model._links, **{"pron_dict": PronDict}}
+    pron_dict = LinkedObject('pron_dict_name', 'pron_dict')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.pron_dict: PronDict = None
-        self.config['pron_dict_name'] = None  # pron_dict hash has not been linked
-        self.config['ngram'] = 1  # default to 1 to make playing quicker
-        self.config['engine_name'] = 'kaldi'
         stage_names = {
             "0_setup.sh": "setup",
             "1_prep_acoustic.sh": "acousticPreparation",
@@ -33,15 +31,13 @@ class KaldiModel(BaseModel):  # TODO not thread safe
             "5_mono.sh": "monophoneTraining",
             "6_tri1.sh": "triphoneTraining"
         }
-        super().build_stage_status(stage_names)
-        self.config['stage_count'] = 0
-        self.config['current_stage'] = None
-
-    @classmethod
-    def load(cls, base_path: Path):
-        self = super().load(base_path)
-        self.pron_dict = None
-        return self
+        with self.config.batch():
+            self.config['pron_dict_name'] = None  # pron_dict hash has not been linked
+            self.config['ngram'] = 1  # default to 1 to make playing quicker
+            self.config['engine_name'] = 'kaldi'
+            super().build_stage_status(stage_names)
+            self.config['stage_count'] = 0
+            self.config['current_stage'] = None
 
     def link_pron_dict(self, pron_dict: PronDict):
         self.pron_dict = pron_dict
@@ -69,6 +65,7 @@ class KaldiModel(BaseModel):  # TODO not thread safe
         return self.config['stage_status']
 
     def build_structure(self):
+        self._use_dataset_audio_format()
         # task json-to-kaldi
         output_path = self.path.joinpath('output')
         output_path.mkdir(parents=True, exist_ok=True)
@@ -79,7 +76,7 @@ class KaldiModel(BaseModel):  # TODO not thread safe
         if dataset_corpus_txt.exists():
             shutil.copy(f"{dataset_corpus_txt}", f"{model_corpus_txt}")
         create_kaldi_structure(
-            input_json=f'{self.dataset.pathto.annotation_json}',
+            input_json=f'{self.dataset.annotations_path}',
             output_folder=f'{output_path}',
             silence_markers=False,
             corpus_txt=f'{model_corpus_txt}'
@@ -153,10 +150,10 @@ class KaldiModel(BaseModel):  # TODO not thread safe
                 with mfcc_resource.open() as fin:
                     content = Template(fin.read()).render(
                         {
-                            'MFCC_SAMPLE_FREQUENCY': '44100',
+                            'MFCC_SAMPLE_FREQUENCY': f"{self.audio_format['rate']}",
                             'MFCC_FRAME_LENGTH': '25',
                             'MFCC_LOW_FREQ': '20',
-                            'MFCC_HIGH_FREQ': '22050',
+                            'MFCC_HIGH_FREQ': f"{self.audio_format['rate'] // 2}",
                             'MFCC_NUM_CEPS': '7',
                         }
                     )
@@ -233,8 +230,9 @@ class KaldiModel(BaseModel):  # TODO not thread safe
 
             for stage in sorted(stages):
                 print(f"Stage {stage} starting")
-                self.stage_status = (stage, 'in-progress', '', 'starting')
-                self.config['current_stage'] = stage
+                with self.config.batch():
+                    self.stage_status = (stage, 'in-progress', '', 'starting')
+                    self.config['current_stage'] = stage
 
                 # Create log file
                 stage_log_path = train_log_dir.joinpath(f"stage_{self.config['stage_count']}.log")
@@ -258,8 +256,9 @@ class KaldiModel(BaseModel):  # TODO not thread safe
                     with open(stage_log_path, 'r') as file:
                         stage_log = file.read()
                     print(f"Stage {stage} log", stage_log)
-                    self.stage_status = (stage, 'complete', '', stage_log)
-                    self.config['stage_count'] = self.config['stage_count'] + 1
+                    with self.config.batch():
+                        self.stage_status = (stage, 'complete', '', stage_log)
+                        self.config['stage_count'] = self.config['stage_count'] + 1
                 except CalledProcessError as error:
                     with open(stage_log_path, 'a+') as file:
                         print('stderr', error.stderr, file=file)
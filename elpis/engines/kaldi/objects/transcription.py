@@ -2,6 +2,7 @@ from pathlib import Path
 from elpis.engines.common.input.resample import resample
 from elpis.engines.common.objects.command import run
 from elpis.engines.common.objects.transcription import Transcription as BaseTranscription
+from elpis.engines.common.utilities import copy_stream
 import subprocess
 from typing import Callable, Dict
 import os
@@ -61,9 +62,10 @@ class KaldiTranscription(BaseTranscription):
         tmp_path.mkdir(parents=True, exist_ok=True)
         tmp_file_path = tmp_path.joinpath(audio.filename)
         with tmp_file_path.open(mode='wb') as fout:
-            fout.write(audio.read())
+            copy_stream(audio, fout, digest=False)
         # resample the audio file
-        resample(tmp_file_path, self.path.joinpath(audio.filename))
+        # to the format the model was trained on
+        resample(tmp_file_path, self.path.joinpath(audio.filename), self.model.audio_format)
         self.audio_filename = audio.filename
         self.audio_file_path = self.path.joinpath(self.audio_filename)
         self.audio_duration = librosa.get_duration(filename=tmp_file_path)
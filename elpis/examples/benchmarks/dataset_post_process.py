@@ -0,0 +1,89 @@
+"""
+Compare the post-processing of Dataset.process before and after it was fused
+into a single pass over the annotations.
+
+A synthetic annotations file and text corpus are generated. The old way builds
+the word list with generate_word_list (which reads the annotations and re-reads
+the corpus just written) and then reads the annotations again for the word
+counts; the fused way gathers the word list, word counts and stats in one pass.
+
+python elpis/examples/benchmarks/dataset_post_process.py [--utterances 100000]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from elpis.engines.common.input.clean_json import extract_additional_corpora
+from elpis.engines.common.input.dataset_summary import AnnotationSummary, read_words
+from elpis.engines.common.input.make_wordlist import generate_word_list
+from elpis.engines.common.utilities import iter_annotations, write_annotations
+
+
+def make_data(directory: Path, utterances: int):
+    generator = random.Random(0)
+    vocabulary = [f'word{index}' for index in range(20000)]
+
+    def sentence():
+        return ' '.join(generator.choices(vocabulary, k=generator.randint(3, 15)))
+
+    write_annotations(directory.joinpath('annotations.jsonl'), (
+        {'audio_file_name': f'{index // 50}.wav', 'speaker_id': f'S{index % 7}', 'transcript': sentence(),
+         'start_ms': 0, 'stop_ms': 2000}
+        for index in range(utterances)))
+    with directory.joinpath('text_corpus.txt').open('w') as fout:
+        fout.writelines(f'{sentence()}\n' for _ in range(utterances // 10))
+    directory.joinpath('additional_word_list.txt').write_text('extra words\n')
+
+
+def separate(directory: Path):
+    corpus_txt = directory.joinpath('corpus.txt')
+    if corpus_txt.exists():
+        corpus_txt.unlink()
+    extract_additional_corpora(f'{directory.joinpath("text_corpus.txt")}', f'{corpus_txt}')
+    generate_word_list(transcription_file=f'{directory.joinpath("annotations.jsonl")}',
+                       output_file=f'{directory.joinpath("word_list.txt")}',
+                       additional_word_list_file=f'{directory.joinpath("additional_word_list.txt")}',
+                       additional_corpus_txt=f'{corpus_txt}')
+    word_counts = Counter()
+    for annotation in iter_annotations(directory.joinpath('annotations.jsonl')):
+        word_counts.update(annotation['transcript'].split())
+    with directory.joinpath('word_count.json').open('w') as fout:
+        json.dump(word_counts, fout)
+
+
+def fused(directory: Path):
+    corpus_txt = directory.joinpath('corpus.txt')
+    if corpus_txt.exists():
+        corpus_txt.unlink()
+    words = read_words(directory.joinpath('additional_word_list.txt'))
+    words |= extract_additional_corpora(f'{directory.joinpath("text_corpus.txt")}', f'{corpus_txt}')
+    summary = AnnotationSummary().add_all(iter_annotations(directory.joinpath('annotations.jsonl')))
+    summary.write_word_list(directory.joinpath('word_list.txt'), words)
+    summary.write_word_counts(directory.joinpath('word_count.json'))
+    with directory.joinpath('stats.json').open('w') as fout:
+        json.dump(summary.stats(), fout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--utterances', type=int, default=100000)
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = Path(temporary_directory)
+        make_data(directory, arguments.utterances)
+        for name, post_process in (('separate passes', separate), ('single pass', fused)):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                post_process(directory)
+            print(f'{name:>16}: {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare reading the transcription tier of eaf files with pympi (the whole
+file as a model) and with the streaming reader of the Elan importer.
+
+Synthetic eaf files are generated with several tiers of hours of two second
+segments each. Both readers read the first tier of each file, and their
+results are checked to be the same.
+
+python elpis/examples/benchmarks/eaf_reader.py [--files 4] [--hours 3] [--tiers 6]
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from pympi.Elan import Eaf, to_eaf
+
+from elpis.transformer.elan import read_eaf_tier
+
+
+def make_eaf(path: Path, hours: float, tiers: int):
+    eaf = Eaf()
+    eaf.remove_tier('default')
+    eaf.add_linguistic_type('phrase-lt')
+    for tier in range(tiers):
+        eaf.add_tier(f'tier {tier}', ling='phrase-lt', part=f'speaker {tier}')
+        for start in range(0, int(hours * 3600 * 1000), 2000):
+            eaf.add_annotation(f'tier {tier}', start, start + 1800, f'segment {start} of tier {tier}')
+    to_eaf(f'{path}', eaf)
+
+
+def read_with_pympi(path: Path):
+    input_eaf = Eaf(f'{path}')
+    tier_name = list(input_eaf.get_tier_names())[0]
+    participant = input_eaf.get_parameters_for_tier(tier_name).get('PARTICIPANT', '')
+    return tier_name, sorted((start, stop, value, participant) for start, stop, value
+                             in input_eaf.get_annotation_data_for_tier(tier_name))
+
+
+def read_streaming(path: Path):
+    tier_name, annotations = read_eaf_tier(path, tier_order=0)
+    return tier_name, sorted(annotations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--hours', type=float, default=3)
+    parser.add_argument('--tiers', type=int, default=6)
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        paths = [Path(temporary_directory).joinpath(f'{index}.eaf') for index in range(arguments.files)]
+        for path in paths:
+            make_eaf(path, arguments.hours, arguments.tiers)
+        results = {}
+        for name, read in (('pympi', read_with_pympi), ('streaming', read_streaming)):
+            start = time.perf_counter()
+            results[name] = [read(path) for path in paths]
+            elapsed = time.perf_counter() - start
+            # again for the memory use, which tracing slows down
+            tracemalloc.start()
+            read(paths[0])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{name:>10}: {elapsed:.2f}s, peak memory per file {peak / 2 ** 20:.0f} MiB')
+        assert results['pympi'] == results['streaming'], 'the readers give different annotations'
+
+
+if __name__ == '__main__':
+    main()
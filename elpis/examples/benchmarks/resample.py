@@ -0,0 +1,74 @@
+"""
+Compare the throughput of the audio resampler backends.
+
+Two synthetic corpora are generated (48 kHz stereo WAV): many short clips,
+where starting a sox process per file dominates, and a few long recordings,
+where the resampling itself does. Each backend resamples each corpus with as
+many workers as the default resampler uses.
+
+python elpis/examples/benchmarks/resample.py [--clips 500] [--recordings 4]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from multiprocessing.dummy import Pool
+from pathlib import Path
+
+import numpy
+import soundfile
+
+from elpis.engines.common.input.resample import RESAMPLE_FORMAT, RESAMPLERS
+from elpis.engines.common.utilities import available_cpus
+from elpis.engines.common.utilities.globals import SOX_PATH
+
+
+def make_corpus(directory: Path, count: int, seconds: float, rate: int = 48000):
+    directory.mkdir()
+    generator = numpy.random.default_rng(0)
+    for index in range(count):
+        audio = 0.1 * generator.standard_normal((int(seconds * rate), 2)).astype('float32')
+        soundfile.write(f'{directory.joinpath(f"{index}.wav")}', audio, rate, subtype='PCM_16')
+
+
+def benchmark(backend: str, corpus: Path, output: Path, workers: int) -> float:
+    output.mkdir()
+    resampler = RESAMPLERS[backend]
+
+    def resample(path: Path):
+        resampler(path, output.joinpath(path.name), RESAMPLE_FORMAT)
+
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for _ in pool.imap_unordered(resample, sorted(corpus.iterdir())):
+            pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clips', type=int, default=500, help='number of 2 second clips')
+    parser.add_argument('--recordings', type=int, default=4, help='number of 10 minute recordings')
+    parser.add_argument('--workers', type=int, default=available_cpus())
+    args = parser.parse_args()
+
+    backends = [backend for backend in RESAMPLERS if backend != 'sox' or Path(SOX_PATH).exists()]
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        corpora = {
+            f'{args.clips} x 2 s clips': (directory.joinpath('clips'), args.clips, 2),
+            f'{args.recordings} x 10 min recordings': (directory.joinpath('recordings'), args.recordings, 600),
+        }
+        for name, (corpus, count, seconds) in corpora.items():
+            make_corpus(corpus, count, seconds)
+            for backend in backends:
+                output = directory.joinpath('output')
+                elapsed = benchmark(backend, corpus, output, args.workers)
+                shutil.rmtree(output)
+                print(f'{name:>28} {backend:>6}: {elapsed:7.2f} s, {count / elapsed:8.1f} files/s, '
+                      f'{count * seconds / elapsed:8.1f} x real time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+FSObject stand-ins shared by the config, store and registry tests.
+"""
+from elpis.engines.common.objects.fsobject import FSObject
+
+
+class A(FSObject):
+    _config_file = 'a.json'
+    _summary_keys = (*FSObject._summary_keys, 'status')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    @property
+    def state(self) -> dict:
+        return {}
+
+
+def increment(path, times):
+    """
+    Add one to the 'counter' key of the object at path, times times, each in
+    its own batch. Used as a thread or process target.
+    """
+    a = A.load(path)
+    for _ in range(times):
+        with a.config.batch():
+            a.config['counter'] = a.config['counter'] + 1
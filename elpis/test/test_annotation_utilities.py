@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from elpis.engines.common.utilities import (AnnotationWriter, count_annotations, iter_annotations,
+                                            read_annotation, write_annotations)
+
+
+def annotation(i: int) -> dict:
+    return {
+        'audio_file_name': f'{i}.wav',
+        'transcript': f'utterance {i} ŋ',
+        'start_ms': i,
+        'stop_ms': i + 1,
+        'speaker_id': 'speaker'
+    }
+
+
+def test_write_and_read(tmpdir):
+    """
+    Annotations are read back in order, counted and looked up from the index.
+    """
+    path = Path(tmpdir).joinpath('annotations.jsonl')
+    write_annotations(path, (annotation(i) for i in range(100)))
+    assert list(iter_annotations(path)) == [annotation(i) for i in range(100)]
+    assert count_annotations(path) == 100
+    assert read_annotation(path, 57) == annotation(57)
+    with pytest.raises(IndexError):
+        read_annotation(path, 100)
+    with pytest.raises(IndexError):
+        read_annotation(path, -1)
+
+
+def test_failed_write_keeps_previous_annotations(tmpdir):
+    """
+    A writer that fails leaves the previous file in place.
+    """
+    path = Path(tmpdir).joinpath('annotations.jsonl')
+    write_annotations(path, [annotation(0)])
+    with pytest.raises(RuntimeError):
+        with AnnotationWriter(path) as writer:
+            writer.write(annotation(1))
+            raise RuntimeError()
+    assert list(iter_annotations(path)) == [annotation(0)]
+    assert sorted(p.name for p in Path(tmpdir).iterdir()) == ['annotations.jsonl', 'annotations.jsonl.idx']
+
+
+def test_read_legacy_list(tmpdir):
+    """
+    Annotations written as a JSON list by older versions can still be read.
+    """
+    path = Path(tmpdir).joinpath('annotations.json')
+    path.write_text(json.dumps([annotation(0), annotation(1)]))
+    assert list(iter_annotations(path)) == [annotation(0), annotation(1)]
+    assert count_annotations(path) == 2
+    assert list(iter_annotations(Path(tmpdir).joinpath('missing.jsonl'))) == []
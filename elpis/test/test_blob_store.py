@@ -0,0 +1,76 @@
+import io
+import os
+from pathlib import Path
+
+from elpis.engines.common.objects.blob_store import BlobStore
+from elpis.engines.common.objects.interface import Interface
+
+
+def test_files_are_stored_once(tmpdir):
+    """
+    A file added to two datasets is stored once and linked into both.
+    """
+    recording = Path(tmpdir).joinpath('recording.wav')
+    recording.write_bytes(b'RIFF' + os.urandom(4096))
+    interface = Interface(Path(tmpdir).joinpath('state'))
+    first = interface.new_dataset('first')
+    second = interface.new_dataset('second')
+    first.add_file(recording)
+    second.add_fp(io.BytesIO(recording.read_bytes()), 'recording.wav')
+    first_copy = first.pathto.original.joinpath('recording.wav')
+    second_copy = second.pathto.original.joinpath('recording.wav')
+    assert first_copy.read_bytes() == recording.read_bytes()
+    assert os.stat(first_copy).st_ino == os.stat(second_copy).st_ino
+    assert len(list(interface.blob_store.path.glob('*/*'))) == 1
+    assert first.files == ['recording.wav']
+
+
+def test_replacing_a_file_keeps_the_blob(tmpdir):
+    """
+    Adding different content under the same name does not change the other
+    datasets linked to the old content.
+    """
+    store = BlobStore(Path(tmpdir).joinpath('blobs'))
+    first = Path(tmpdir).joinpath('first')
+    second = Path(tmpdir).joinpath('second')
+    digest = store.add_fp(io.BytesIO(b'old')).digest
+    store.link(digest, first)
+    store.link(digest, second)
+    store.link(store.add_fp(io.BytesIO(b'new')).digest, first)
+    assert first.read_bytes() == b'new'
+    assert second.read_bytes() == b'old'
+
+
+def test_garbage_collect(tmpdir):
+    """
+    Blobs no dataset links to are deleted.
+    """
+    store = BlobStore(Path(tmpdir).joinpath('blobs'))
+    kept = Path(tmpdir).joinpath('kept')
+    store.link(store.add_fp(io.BytesIO(b'kept')).digest, kept)
+    removed = Path(tmpdir).joinpath('removed')
+    removed_digest = store.add_fp(io.BytesIO(b'removed')).digest
+    store.link(removed_digest, removed)
+    removed.unlink()
+    assert store.garbage_collect() == len(b'removed')
+    assert removed_digest not in store
+    assert kept.read_bytes() == b'kept'
+
+
+def test_removed_files_release_their_blobs(tmpdir):
+    """
+    A blob is deleted when the last dataset using it removes or replaces the
+    file.
+    """
+    interface = Interface(Path(tmpdir).joinpath('state'))
+    first = interface.new_dataset('first')
+    second = interface.new_dataset('second')
+    first.add_fp(io.BytesIO(b'shared'), 'shared.wav')
+    digest = first.config['file_digests']['shared.wav']
+    second.add_fp(io.BytesIO(b'shared'), 'shared.wav')
+    first.remove_file('shared.wav')
+    assert digest in interface.blob_store
+    second.add_fp(io.BytesIO(b'replaced'), 'shared.wav')
+    assert digest not in interface.blob_store
+    second.remove_file('shared.wav')
+    assert list(interface.blob_store.path.glob('*/*')) == []
@@ -0,0 +1,100 @@
+import pytest
+import re
+import string
+from pathlib import Path
+from types import SimpleNamespace
+
+from elpis.engines.common.input import clean_json
+from elpis.engines.common.input.clean_json import Cleaner, clean_json_data, deal_with_punctuation
+from elpis.engines.common.input.english_lexicon import build_lexicon
+
+
+def regex_punctuation(text, punctuation_to_collapse_by, punctuation_to_explode_by):
+    """
+    How deal_with_punctuation used to clean text, with a regex per call.
+    """
+    if punctuation_to_explode_by:
+        text = re.sub(rf"[{re.escape(punctuation_to_explode_by)}]", " ", text)
+    if punctuation_to_collapse_by:
+        text = re.sub(rf"[{re.escape(punctuation_to_collapse_by)}]", "", text)
+    return text
+
+
+def test_punctuation_table():
+    """
+    Translate tables clean punctuation like the regexes did, exploding first.
+    """
+    text = 'a-b, "c" d.e\\f ]g[ h^i  j'
+    for collapse, explode in (('', string.punctuation), ('-', ''), ('.-', '.,'), (' ', '-'), ('"]', '[^\\')):
+        assert deal_with_punctuation(text, collapse, explode) == regex_punctuation(text, collapse, explode)
+
+
+def test_cleaner():
+    """
+    Cleaners drop special cases, leave out utterances with translation tags
+    and clean the punctuation of the other words.
+    """
+    cleaner = Cleaner(punctuation_to_explode_by='-', punctuation_to_collapse_by='!',
+                      special_cases=['<silence>'], translation_tags=['@eng@'])
+    utterances = [{'transcript': 'Hello-World <silence> now!'}, {'transcript': 'this @eng@ not'},
+                  {'transcript': '<silence>'}]
+    assert [utterance['transcript'] for utterance in cleaner.clean_many(utterances)] == ['hello world now', '', '']
+    assert clean_json_data([{'transcript': 'A-B'}], punctuation_to_explode_by='-') == [{'transcript': 'a b'}]
+    cleaner = Cleaner.from_settings({'punctuation_to_collapse_by': '', 'punctuation_to_explode_by': ',',
+                                     'special_cases': 'um\nah', 'translation_tags': ''})
+    assert cleaner.clean_transcript('um yes, ah') == 'yes'
+
+
+def test_english_resources_are_loaded_once(monkeypatch):
+    """
+    English words and the langid model are loaded on first use only, and
+    English is left out of a batch of utterances. nltk is only used when
+    asked for.
+    """
+    clean_json.get_english_words.cache_clear()
+    downloads = []
+    monkeypatch.setattr(clean_json.nltk, 'download', downloads.append)
+    monkeypatch.setattr(clean_json, 'words', SimpleNamespace(words=lambda: ['house', 'weather']))
+    assert clean_json.get_english_words('nltk') is clean_json.get_english_words('nltk') == {'house', 'weather'}
+    assert downloads == ['words']
+    assert clean_json.get_langid_identifier() is clean_json.get_langid_identifier()
+
+    cleaner = Cleaner(remove_english=True, use_langid=True, english_words_source='nltk')
+    utterances = [{'transcript': 'ngayi nyinaya house'}, {'transcript': 'ngayi nyinaya'},
+                  {'transcript': 'the dog is in the garden and it is a nice day today'}]
+    assert [utterance['transcript'] for utterance in cleaner.clean_many(utterances)] == ['', 'ngayi nyinaya', '']
+    assert downloads == ['words']
+    clean_json.get_english_words.cache_clear()
+
+
+def test_english_words_from_lexicon(tmpdir, monkeypatch):
+    """
+    By default English words come from the bundled lexicon, without nltk.
+    """
+    clean_json.get_english_words.cache_clear()
+    monkeypatch.setattr(clean_json.nltk, 'download', None)
+    path = Path(tmpdir).joinpath('english.lexicon')
+    build_lexicon(['house', 'weather'], path)
+    monkeypatch.setattr(clean_json, 'ENGLISH_LEXICON_PATH', path)
+    cleaner = Cleaner(remove_english=True)
+    assert cleaner.clean_transcript('ngayi nyinaya house') == ''
+    assert cleaner.clean_transcript('ngayi nyinaya') == 'ngayi nyinaya'
+    clean_json.get_english_words.cache_clear()
+
+
+def test_english_words_without_lexicon(tmpdir, monkeypatch):
+    """
+    Without the lexicon, English words come from nltk, and the lexicon is
+    built from them for next time.
+    """
+    clean_json.get_english_words.cache_clear()
+    monkeypatch.setattr(clean_json.nltk, 'download', lambda corpus: None)
+    monkeypatch.setattr(clean_json, 'words', SimpleNamespace(words=lambda: ['house', 'weather']))
+    path = Path(tmpdir).joinpath('english.lexicon')
+    monkeypatch.setattr(clean_json, 'ENGLISH_LEXICON_PATH', path)
+    assert clean_json.get_english_words() == {'house', 'weather'}
+    clean_json.get_english_words.cache_clear()
+    lexicon = clean_json.get_english_words()
+    assert isinstance(lexicon, clean_json.Lexicon) and sorted(lexicon) == ['house', 'weather']
+    lexicon.close()
+    clean_json.get_english_words.cache_clear()
@@ -0,0 +1,125 @@
+import multiprocessing
+from pathlib import Path
+
+from elpis.engines.common.objects.config_store import JSONFileStore, SQLiteStore, register_store, store_for
+from elpis.engines.common.objects.interface import Interface
+
+from fsobject_helpers import A, increment
+
+
+def sqlite_store(tmpdir) -> SQLiteStore:
+    store = SQLiteStore(Path(tmpdir).joinpath('state.sqlite3'))
+    register_store(tmpdir, store)
+    return store
+
+
+def test_store_for(tmpdir):
+    """
+    Objects use the store registered for the closest enclosing directory.
+    """
+    store = sqlite_store(Path(tmpdir).joinpath('inner'))
+    assert store_for(Path(tmpdir).joinpath('inner', 'object')) is store
+    assert store_for(Path(tmpdir).joinpath('inner')) is store
+    assert isinstance(store_for(Path(tmpdir).joinpath('inner-sibling')), JSONFileStore)
+
+
+def test_json_lock_is_reentrant(tmpdir):
+    """
+    Nested locks on the same directory in one thread do not wait for
+    themselves.
+    """
+    store = JSONFileStore()
+    with store.lock(f'{tmpdir}'):
+        with store.lock(f'{tmpdir}', shared=True):
+            with store.lock(f'{tmpdir}'):
+                pass
+
+
+def test_sqlite_config(tmpdir):
+    """
+    With a SQLite store the config is in the database, not in the directory.
+    """
+    store = sqlite_store(tmpdir)
+    a = A(parent_path=tmpdir, name='a')
+    a.config['value'] = 1
+    assert list(a.path.iterdir()) == []
+    assert store.read(f'{a.path}', 'a.json')['value'] == 1
+    assert A.load(a.path).config['value'] == 1
+
+
+def test_sqlite_external_change_is_detected(tmpdir):
+    """
+    Changes made through another connection are picked up on the next read.
+    """
+    sqlite_store(tmpdir)
+    a = A(parent_path=tmpdir, name='a')
+    assert a.name == 'a'
+    other = SQLiteStore(Path(tmpdir).joinpath('state.sqlite3'))
+    config = other.read(f'{a.path}', 'a.json')
+    config['name'] = 'changed elsewhere'
+    other.write(f'{a.path}', 'a.json', config)
+    assert a.name == 'changed elsewhere'
+
+
+def test_sqlite_batch_rollback(tmpdir):
+    """
+    Changes made in a batch that raises are not saved.
+    """
+    store = sqlite_store(tmpdir)
+    a = A(parent_path=tmpdir, name='a')
+    a.config['value'] = 'before'
+    try:
+        with a.config.batch():
+            a.config['value'] = 'during'
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert a.config['value'] == 'before'
+    assert store.read(f'{a.path}', 'a.json')['value'] == 'before'
+
+
+def test_list_configs(tmpdir):
+    """
+    Both stores list the configs in a directory and filter on indexed keys.
+    """
+    for store, parent_path in ((JSONFileStore(), Path(tmpdir).joinpath('json')),
+                               (sqlite_store(Path(tmpdir).joinpath('sqlite')), Path(tmpdir).joinpath('sqlite'))):
+        for name, status in (('one', 'ready'), ('two', 'trained'), ('three', 'trained')):
+            a = A(parent_path=parent_path, name=name)
+            a.config['status'] = status
+        configs = store.list_configs(f'{parent_path}', 'a.json')
+        assert sorted(config['name'] for config in configs) == ['one', 'three', 'two']
+        configs = store.list_configs(f'{parent_path}', 'a.json', status='trained')
+        assert sorted(config['name'] for config in configs) == ['three', 'two']
+        assert store.list_configs(f'{parent_path}', 'other.json') == []
+
+
+def test_sqlite_concurrent_processes(tmpdir):
+    """
+    Read-modify-write batches from several processes do not lose updates.
+    """
+    store = sqlite_store(tmpdir)
+    a = A(parent_path=tmpdir, name='a')
+    a.config['counter'] = 0
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=increment, args=(a.path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert store.read(f'{a.path}', 'a.json')['counter'] == 100
+    assert a.config['counter'] == 100
+
+
+def test_interface_state_store(tmpdir):
+    """
+    An interface keeps the state store it was created with.
+    """
+    path = Path(tmpdir).joinpath('state')
+    interface = Interface(path, state_store='sqlite')
+    dataset = interface.new_dataset('ds')
+    assert path.joinpath('state.sqlite3').is_file()
+    assert not dataset.path.joinpath(dataset._config_file).exists()
+    interface = Interface(path, use_existing=True)
+    assert interface.state_store == 'sqlite'
+    assert interface.get_dataset('ds').name == 'ds'
@@ -454,7 +454,7 @@ def test_process(tmpdir):
     assert ds.state["has_been_processed"] == True
 
     # Whitebox tests
-    annotations_path = Path(f'{ds.path}/annotations.json')
+    annotations_path = Path(f'{ds.path}/annotations.jsonl')
     assert annotations_path.is_file()
     word_list_path = Path(f'{ds.path}/word_list.txt')
     assert word_list_path.is_file()
@@ -0,0 +1,20 @@
+from pathlib import Path
+
+from elpis.engines.common.objects.dataset import Dataset
+
+
+def test_importer_is_built_on_first_use(tmpdir):
+    """
+    Loading a dataset does not build its importer, using it does, with the
+    settings saved in the config.
+    """
+    dataset = Dataset(parent_path=tmpdir, name='ds')
+    dataset.select_importer('Elan')
+    dataset.importer.set_setting('tier_name', 'Phrase')
+    loaded = Dataset.load(dataset.path)
+    assert loaded._importer is None
+    assert loaded.name == 'ds'
+    assert loaded._importer is None
+    assert loaded.importer.get_name() == 'Elan'
+    assert loaded.importer.get_settings()['tier_name'] == 'Phrase'
+    assert loaded.config['importer'] == dataset.config['importer']
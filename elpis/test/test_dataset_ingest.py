@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pytest
+
+from elpis.engines.common.objects.dataset import Dataset
+
+
+def make_files(directory: Path, count: int) -> Path:
+    directory.mkdir()
+    for i in range(count):
+        directory.joinpath(f'{i}.wav').write_bytes(bytes([i]) * 1000)
+    directory.joinpath('notes.txt').write_text('not a recording')
+    directory.joinpath('sub').mkdir()
+    return directory
+
+
+def test_add_directory(tmpdir):
+    """
+    All files with the given extensions are copied and recorded.
+    """
+    source = make_files(Path(tmpdir).joinpath('source'), 20)
+    dataset = Dataset(parent_path=Path(tmpdir).joinpath('datasets'), name='ds')
+    dataset.add_directory(source, extensions=['wav'])
+    assert sorted(dataset.config['files']) == sorted(f'{i}.wav' for i in range(20))
+    assert len(dataset.config['file_digests']) == 20
+    assert dataset.pathto.original.joinpath('7.wav').read_bytes() == bytes([7]) * 1000
+    assert not dataset.pathto.ingest_manifest.exists()
+
+
+def test_add_directory_resumes(tmpdir, monkeypatch):
+    """
+    Adding the files again after an interrupted import only copies the files
+    that were not copied yet.
+    """
+    source = make_files(Path(tmpdir).joinpath('source'), 10)
+    dataset = Dataset(parent_path=Path(tmpdir).joinpath('datasets'), name='ds')
+    copy_in = Dataset._copy_in
+    copied = []
+
+    def failing_copy_in(self, file_path):
+        if file_path.name == '3.wav':
+            raise OSError('interrupted')
+        copied.append(file_path.name)
+        return copy_in(self, file_path)
+
+    monkeypatch.setattr(Dataset, '_copy_in', failing_copy_in)
+    with pytest.raises(OSError):
+        dataset.add_directory(source, extensions=['wav'])
+    assert dataset.config['files'] == []
+    assert dataset.pathto.ingest_manifest.exists()
+
+    done = set(copied)
+    copied.clear()
+    monkeypatch.setattr(Dataset, '_copy_in', lambda self, file_path: copied.append(file_path.name) or copy_in(self, file_path))
+    dataset.add_directory(source, extensions=['wav'])
+    assert '3.wav' in copied
+    assert not done & set(copied)
+    assert sorted(dataset.config['files']) == sorted(f'{i}.wav' for i in range(10))
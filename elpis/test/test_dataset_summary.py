@@ -0,0 +1,50 @@
+import contextlib
+import wave
+from pathlib import Path
+
+from elpis.engines.common.input.dataset_summary import AnnotationSummary, read_words
+
+
+def test_summary(tmpdir):
+    """
+    One pass gives the word list, word counts and per speaker and file stats.
+    """
+    annotations = [
+        {'audio_file_name': 'a.wav', 'speaker_id': 'S1', 'transcript': 'one two', 'start_ms': 0, 'stop_ms': 1000},
+        {'audio_file_name': 'a.wav', 'speaker_id': 'S2', 'transcript': 'two', 'start_ms': 1000, 'stop_ms': 1500},
+        {'audio_file_name': 'b.wav', 'speaker_id': 'S1', 'transcript': 'three', 'start_ms': 0, 'stop_ms': 250},
+    ]
+    summary = AnnotationSummary().add_all(annotations)
+    assert summary.word_counts == {'one': 1, 'two': 2, 'three': 1}
+    assert summary.speakers['S1'] == {'utterances': 2, 'tokens': 3, 'duration_ms': 1250}
+    assert summary.files['a.wav'] == {'utterances': 2, 'tokens': 3, 'duration_ms': 1500}
+
+    extra = tmpdir.join('extra.txt')
+    extra.write('zero  one\n')
+    word_list = tmpdir.join('word_list.txt')
+    summary.write_word_list(word_list, read_words(extra))
+    assert word_list.read().split('\n') == ['one', 'three', 'two', 'zero', '']
+    assert read_words(tmpdir.join('missing.txt')) == set()
+
+
+def test_stats(tmpdir):
+    """
+    The stats index has totals, audio lengths, the OOV rate and histograms.
+    """
+    with contextlib.closing(wave.open(f'{tmpdir.join("a.wav")}', 'wb')) as fout:
+        fout.setnchannels(1)
+        fout.setsampwidth(2)
+        fout.setframerate(16000)
+        fout.writeframes(b'\0\0' * 32000)
+    annotations = [
+        {'audio_file_name': 'a.wav', 'speaker_id': 'S1', 'transcript': 'one two', 'start_ms': 0, 'stop_ms': 1500},
+        {'audio_file_name': 'a.wav', 'speaker_id': 'S2', 'transcript': 'two', 'start_ms': 1500, 'stop_ms': 2000},
+    ]
+    stats = AnnotationSummary().add_all(annotations).stats(Path(tmpdir), vocabulary={'one', 'zero'})
+    assert stats['totals'] == {'files': 1, 'speakers': 2, 'utterances': 2, 'tokens': 3, 'types': 2,
+                               'duration_ms': 2000, 'audio_ms': 2000, 'mean_segment_ms': 1000,
+                               'oov_rate': 2 / 3}
+    assert stats['files']['a.wav']['audio_ms'] == 2000
+    assert stats['segment_duration_ms']['counts'] == [1, 1, 0, 0, 0, 0, 0]
+    assert stats['segment_tokens']['counts'] == [0, 1, 1, 0, 0, 0, 0]
+    assert AnnotationSummary().add_all(annotations).stats()['totals']['oov_rate'] is None
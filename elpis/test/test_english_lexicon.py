@@ -0,0 +1,22 @@
+from elpis.engines.common.input.english_lexicon import Lexicon, build_lexicon
+
+
+def test_lexicon(tmpdir):
+    """
+    A lexicon holds the same words as the set it is built from.
+    """
+    words = ['zebra', 'apple', 'Apple', 'naïve', 'a', 'apple', 'mango']
+    path = tmpdir.join('words.lexicon')
+    assert build_lexicon(words, path) == 6
+    lexicon = Lexicon(path)
+    assert len(lexicon) == 6
+    for word in words + ['', 'b', 'zebras', 'app', 'naive', 'zzz']:
+        assert (word in lexicon) == (word in set(words))
+    assert sorted(lexicon) == sorted(set(words))
+    lexicon.close()
+
+
+def test_empty_lexicon(tmpdir):
+    path = tmpdir.join('empty.lexicon')
+    build_lexicon([], path)
+    assert 'a' not in Lexicon(path)
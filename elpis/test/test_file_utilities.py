@@ -0,0 +1,49 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+
+from elpis.engines.common.objects.dataset import Dataset
+from elpis.engines.common.utilities import copy_stream, file_digest
+
+
+def test_copy_stream_in_chunks():
+    """
+    Copies in chunks smaller than the content and hashes it on the way.
+    """
+    content = os.urandom(10000)
+    fout = io.BytesIO()
+    copied = copy_stream(io.BytesIO(content), fout, buffer_size=1024)
+    assert fout.getvalue() == content
+    assert copied.size == len(content)
+    assert copied.digest == hashlib.sha256(content).hexdigest()
+
+
+def test_copy_stream_between_files(tmpdir):
+    """
+    Copies between real files from the current position, without a digest.
+    """
+    content = os.urandom(10000)
+    source = Path(tmpdir).joinpath('source')
+    source.write_bytes(content)
+    destination = Path(tmpdir).joinpath('destination')
+    with source.open(mode='rb') as fin, destination.open(mode='wb') as fout:
+        fin.read(100)
+        copied = copy_stream(fin, fout, digest=False, buffer_size=1024)
+        assert fin.tell() == len(content)
+    assert destination.read_bytes() == content[100:]
+    assert copied.size == len(content) - 100
+    assert copied.digest is None
+    assert file_digest(source, buffer_size=1024) == hashlib.sha256(content).hexdigest()
+
+
+def test_add_fp_records_digest(tmpdir):
+    """
+    Datasets keep the digest of the files added to them.
+    """
+    dataset = Dataset(parent_path=tmpdir, name='ds')
+    dataset.add_fp(io.BytesIO(b'content'), 'a.wav')
+    assert dataset.pathto.original.joinpath('a.wav').read_bytes() == b'content'
+    assert dataset.config['file_digests'] == {'a.wav': hashlib.sha256(b'content').hexdigest()}
+    dataset.remove_file('a.wav')
+    assert dataset.config['file_digests'] == {}
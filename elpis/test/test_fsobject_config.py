@@ -0,0 +1,152 @@
+import json
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+
+from fsobject_helpers import A, increment
+
+
+def read_config_file(obj):
+    with obj.path.joinpath(obj._config_file).open() as fin:
+        return json.load(fin)
+
+
+def test_reads_are_copies(tmpdir):
+    """
+    Mutating a value read from the config must not change the config.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    a.config['items'] = {'x': 1}
+    items = a.config['items']
+    items['y'] = 2
+    assert a.config['items'] == {'x': 1}
+    assert read_config_file(a)['items'] == {'x': 1}
+
+
+def test_proxies_share_cache(tmpdir):
+    """
+    A write through one proxy is seen by another proxy of the same object.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    b = A.load(a.path)
+    a.config['value'] = 'first'
+    assert b.config['value'] == 'first'
+    b.config['value'] = 'second'
+    assert a.config['value'] == 'second'
+
+
+def test_external_change_is_detected(tmpdir):
+    """
+    Changes made to the file by another process are picked up on the next read.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    assert a.name == 'a'
+    config = read_config_file(a)
+    config['name'] = 'changed elsewhere'
+    config_path = a.path.joinpath(a._config_file)
+    with config_path.open(mode='w') as fout:
+        json.dump(config, fout)
+    # Make sure the stamp differs even on filesystems with coarse timestamps.
+    stat = os.stat(config_path)
+    os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert a.name == 'changed elsewhere'
+
+
+def test_write_back_block(tmpdir):
+    """
+    Writes inside a ``with obj.config:`` block are only saved when the
+    outermost block ends.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    with a.config:
+        a.config['one'] = 1
+        with a.config:
+            a.config['two'] = 2
+        assert a.config['two'] == 2
+        assert 'two' not in read_config_file(a)
+    config = read_config_file(a)
+    assert config['one'] == 1
+    assert config['two'] == 2
+
+
+def test_flush(tmpdir):
+    """
+    flush() saves pending writes without leaving the block.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    with a.config:
+        a.config['one'] = 1
+        a.config.flush()
+        assert read_config_file(a)['one'] == 1
+
+
+def test_batch_rollback(tmpdir):
+    """
+    Changes made in a batch that raises are discarded.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    a.config['value'] = 'before'
+    try:
+        with a.config.batch():
+            a.config['value'] = 'during'
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert a.config['value'] == 'before'
+    assert read_config_file(a)['value'] == 'before'
+
+
+def test_no_temporary_files_left(tmpdir):
+    """
+    Atomic writes do not leave temporary files in the object directory.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    with a.config.batch():
+        a.config['one'] = 1
+    a.config['two'] = 2
+    assert [path.name for path in a.path.iterdir()] == ['a.json']
+
+
+def test_concurrent_threads(tmpdir):
+    """
+    Read-modify-write batches from several threads do not lose updates.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    a.config['counter'] = 0
+    threads = [threading.Thread(target=increment, args=(a.path, 50)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert a.config['counter'] == 200
+
+
+def test_concurrent_processes(tmpdir):
+    """
+    Read-modify-write batches from several processes do not lose updates.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    a.config['counter'] = 0
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=increment, args=(a.path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert read_config_file(a)['counter'] == 100
+    assert a.config['counter'] == 100
+
+
+def test_relative_and_absolute_proxies(tmpdir, monkeypatch):
+    """
+    Proxies made from a relative and an absolute path share one cache entry,
+    so a write through one inside a batch of the other does not block.
+    """
+    a = A(parent_path=tmpdir, name='a')
+    monkeypatch.chdir(tmpdir)
+    b = A.load(Path(a.path.name))
+    with a.config.batch():
+        b.config['value'] = 1
+        assert a.config['value'] == 1
+    assert read_config_file(a)['value'] == 1
@@ -0,0 +1,44 @@
+import threading
+import uuid
+
+from elpis.engines.common.utilities import hasher
+
+
+def test_ids_are_uuid7_hex():
+    """
+    Ids are UUID version 7, written as 32 hex digits.
+    """
+    id = hasher.new()
+    assert len(id) == 32
+    assert int(id, 16) >= 0
+    parsed = uuid.UUID(hex=id)
+    assert parsed.version == 7
+    assert parsed.variant == uuid.RFC_4122
+
+
+def test_ids_are_unique_and_ordered():
+    """
+    Ids made in a tight loop (many per millisecond) are unique and sort in
+    the order they were made.
+    """
+    ids = [hasher.new() for _ in range(10000)]
+    assert len(set(ids)) == len(ids)
+    assert sorted(ids) == ids
+
+
+def test_ids_are_unique_across_threads():
+    """
+    Ids made concurrently by several threads do not collide.
+    """
+    ids = []
+
+    def make_ids():
+        made = [hasher.new() for _ in range(2000)]
+        ids.extend(made)
+
+    threads = [threading.Thread(target=make_ids) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 8000
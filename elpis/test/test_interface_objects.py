@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from elpis.engines import ENGINES
+from elpis.engines.common.objects.interface import Interface
+
+
+def test_one_proxy_per_object(tmpdir):
+    """
+    Getting an object twice gives the same proxy, also through links.
+    """
+    interface = Interface(Path(tmpdir).joinpath('state'))
+    dataset = interface.new_dataset('ds')
+    pron_dict = interface.new_pron_dict('pd')
+    pron_dict.link(dataset)
+    assert interface.get_dataset('ds') is dataset
+    assert interface.get_pron_dict('pd') is pron_dict
+    assert interface.get_pron_dict('pd').dataset is dataset
+
+
+def test_links_resolve_lazily(tmpdir):
+    """
+    Loading a model does not load the objects it links to until they are used.
+    """
+    path = Path(tmpdir).joinpath('state')
+    interface = Interface(path)
+    interface.set_engine(ENGINES['kaldi'])
+    dataset = interface.new_dataset('ds')
+    pron_dict = interface.new_pron_dict('pd')
+    pron_dict.link(dataset)
+    model = interface.new_model('m')
+    model.link_dataset(dataset)
+    model.link_pron_dict(pron_dict)
+
+    interface = Interface(path, use_existing=True)
+    interface.set_engine(ENGINES['kaldi'])
+    model = interface.get_model('m')
+    assert interface.datasets == {} and interface.pron_dicts == {}
+    assert model.pron_dict.name == 'pd'
+    assert model.dataset is model.pron_dict.dataset
+    assert list(interface.datasets) == [dataset.hash]
+
+
+def test_proxies_see_files_added_elsewhere(tmpdir):
+    """
+    A dataset proxy works on the current file list, not the one it loaded,
+    so removing a file keeps the files another interface added.
+    """
+    path = Path(tmpdir).joinpath('state')
+    interface_a = Interface(path)
+    interface_a.new_dataset('ds')
+    interface_b = Interface(path, use_existing=True)
+    dataset_a = interface_a.get_dataset('ds')
+    dataset_b = interface_b.get_dataset('ds')
+    for name, dataset in [('x.txt', dataset_a), ('y.txt', dataset_b)]:
+        source = Path(tmpdir).joinpath(name)
+        source.write_text(name)
+        dataset.add_file(source)
+    dataset_a.remove_file('x.txt')
+    assert dataset_a.files == ['y.txt']
+    assert dataset_b.files == ['y.txt']
+    assert dataset_a.pathto.original.joinpath('y.txt').exists()
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from elpis.engines.common.objects.config_store import JSONFileStore
+from elpis.engines.common.objects.interface import Interface
+from elpis.engines.common.objects.registry import Registry, register_registry
+
+from fsobject_helpers import A
+
+
+def test_summaries_follow_config(tmpdir):
+    """
+    Saving a config updates the summary of the object in the registry.
+    """
+    registry = Registry(Path(tmpdir).joinpath('registry'), JSONFileStore())
+    objects_path = Path(tmpdir).joinpath('as')
+    register_registry(objects_path, registry, 'as')
+    a = A(parent_path=objects_path, name='a')
+    assert registry.list('as') == [{'name': 'a', 'hash': a.hash, 'date': a.date, 'status': None}]
+    with a.config.batch():
+        a.config['status'] = 'ready'
+        a.config['other'] = 'not in the summary'
+    assert registry.list('as')[0]['status'] == 'ready'
+    b = A(parent_path=objects_path, name='b')
+    b.config['status'] = 'trained'
+    assert [summary['name'] for summary in registry.list('as')] == ['a', 'b']
+    assert [summary['name'] for summary in registry.list('as', status='trained')] == ['b']
+    registry.remove('as', a.hash)
+    assert [summary['name'] for summary in registry.list('as')] == ['b']
+
+
+def test_registry_is_shared(tmpdir):
+    """
+    Another registry on the same store sees the changes.
+    """
+    path = Path(tmpdir).joinpath('registry')
+    registry = Registry(path, JSONFileStore())
+    other = Registry(path, JSONFileStore())
+    assert other.list('as') == []
+    registry.record('as', {'name': 'a', 'hash': '1'})
+    assert other.list('as') == [{'name': 'a', 'hash': '1'}]
+
+
+def test_interface_listing(tmpdir):
+    """
+    Interface lists objects from the registry, which is rebuilt if missing.
+    """
+    path = Path(tmpdir).joinpath('state')
+    interface = Interface(path)
+    dataset = interface.new_dataset('ds')
+    pron_dict = interface.new_pron_dict('pd')
+    pron_dict.link(dataset)
+    assert interface.list_pron_dicts_verbose() == [{'name': 'pd', 'dataset_name': 'ds'}]
+    path.joinpath('registry', 'registry.json').unlink()
+    interface = Interface(path, use_existing=True)
+    assert interface.list_pron_dicts_verbose() == [{'name': 'pd', 'dataset_name': 'ds'}]
+    assert [summary['name'] for summary in interface.registry.list('datasets')] == ['ds']
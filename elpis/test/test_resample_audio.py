@@ -0,0 +1,138 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from elpis.engines.common.errors import ResampleError
+from elpis.engines.common.input import resample
+from elpis.transformer import _default_audio_resampler
+
+
+@pytest.fixture
+def fake_sox(tmpdir, monkeypatch):
+    """
+    A sox that copies its input, and fails on files with "bad" in their name.
+    """
+    sox = Path(tmpdir).joinpath('sox')
+    sox.write_text('#!/bin/sh\n'
+                   'case "$1" in *bad*) echo "cannot read $1" >&2; exit 2;; esac\n'
+                   'for last; do :; done\n'
+                   'cp "$1" "$last"\n')
+    sox.chmod(0o755)
+    monkeypatch.setattr(resample, 'SOX_PATH', f'{sox}')
+
+
+def test_failures_are_raised_after_the_other_files(tmpdir, fake_sox):
+    """
+    A file sox fails on is reported, the other files are still resampled and
+    progress is reported for every file.
+    """
+    source = Path(tmpdir).joinpath('source')
+    source.mkdir()
+    audio_paths = []
+    for name in ('a', 'b', 'bad', 'c'):
+        source.joinpath(f'{name}.mp3').write_bytes(name.encode())
+        audio_paths.append(f'{source.joinpath(f"{name}.mp3")}')
+    temporary = Path(tmpdir).joinpath('temporary')
+    temporary.mkdir()
+    added, progress = {}, []
+    with pytest.raises(ResampleError) as error:
+        _default_audio_resampler(audio_paths, f'{tmpdir}/resampled', lambda id, path: added.update({id: path}),
+                                 f'{temporary}', progress_callback=lambda *report: progress.append(report),
+                                 workers=2)
+    assert list(error.value.failures) == [audio_paths[2]]
+    assert 'cannot read' in error.value.failures[audio_paths[2]]
+    assert sorted(added) == ['a', 'b', 'c']
+    assert Path(added['c']).read_bytes() == b'c'
+    assert [done for done, total, _ in progress] == [0, 1, 2, 3, 4]
+    assert list(temporary.iterdir()) == []
+
+
+def test_in_process_resampling(tmpdir):
+    """
+    Audio soundfile can decode is downmixed and resampled without sox.
+    """
+    numpy = pytest.importorskip('numpy')
+    soundfile = pytest.importorskip('soundfile')
+    time = numpy.arange(48000) / 48000
+    tone = 0.5 * numpy.sin(2 * numpy.pi * 440 * time)
+    source = Path(tmpdir).joinpath('stereo.flac')
+    soundfile.write(f'{source}', numpy.stack([tone, tone], axis=1), 48000)
+    destination = Path(tmpdir).joinpath('mono.wav')
+    resample.resample(source, destination, backend='numpy')
+    info = soundfile.info(f'{destination}')
+    assert (info.samplerate, info.channels, info.subtype) == (44100, 1, 'PCM_16')
+    data, _ = soundfile.read(f'{destination}')
+    assert len(data) == 44100
+    assert abs(numpy.abs(numpy.fft.rfft(data)).argmax() - 440) <= 1
+
+
+def test_undecodable_audio_falls_back_to_sox(tmpdir, fake_sox):
+    """
+    Audio soundfile cannot decode is given to sox.
+    """
+    source = Path(tmpdir).joinpath('recording.mp3')
+    source.write_bytes(b'not audio soundfile knows')
+    destination = Path(tmpdir).joinpath('recording.wav')
+    resample.resample(source, destination, backend='numpy')
+    assert destination.read_bytes() == source.read_bytes()
+
+
+def test_audio_format(tmpdir):
+    """
+    Changing the audio format of a dataset marks it as unprocessed, and
+    models cannot be built from it until it is processed again.
+    """
+    from elpis.engines.common.objects.dataset import Dataset
+    from elpis.engines.common.objects.model import Model
+
+    dataset = Dataset(parent_path=tmpdir, name='ds')
+    assert dataset.audio_format == resample.RESAMPLE_FORMAT
+    with pytest.raises(ValueError):
+        dataset.set_audio_format(bits=12)
+    dataset.set_audio_format(rate=16000)
+    assert dataset.audio_format == {**resample.RESAMPLE_FORMAT, 'rate': 16000}
+    assert dataset.has_been_processed is False
+    model = Model(parent_path=tmpdir, name='m')
+    model.link_dataset(dataset)
+    with pytest.raises(RuntimeError):
+        model._use_dataset_audio_format()
+    dataset.config['processed_audio_format'] = dataset.audio_format
+    model._use_dataset_audio_format()
+    assert model.audio_format['rate'] == 16000
+
+
+def test_in_process_resampling_in_blocks(tmpdir):
+    """
+    Resampling a block at a time gives the same audio as resampling the
+    whole recording at once.
+    """
+    numpy = pytest.importorskip('numpy')
+    soundfile = pytest.importorskip('soundfile')
+    signal = pytest.importorskip('scipy.signal')
+    audio = numpy.random.RandomState(0).uniform(-0.5, 0.5, (48000 + 123, 2)).astype('float32')
+    source = Path(tmpdir).joinpath('noise.wav')
+    soundfile.write(f'{source}', audio, 48000, subtype='FLOAT')
+    destination = Path(tmpdir).joinpath('resampled.wav')
+    audio_format = {'bits': 32, 'channels': 1, 'rate': 44100}
+    resample.resample_in_process(source, destination, audio_format, block_frames=1000)
+    data, _ = soundfile.read(f'{destination}')
+    expected = signal.resample_poly(audio.mean(axis=1), 147, 160)
+    assert len(data) == len(expected)
+    assert numpy.abs(data - expected).max() < 1e-6
+
+
+def test_memory_budget():
+    """
+    Memory is only given out when it is free, and a request for more than
+    the budget gets all of it.
+    """
+    budget = resample.MemoryBudget(100)
+    assert budget.acquire(60) == 60
+    waiting = threading.Thread(target=lambda: budget.release(budget.acquire(50)))
+    waiting.start()
+    waiting.join(0.1)
+    assert waiting.is_alive()
+    budget.release(60)
+    waiting.join()
+    assert budget.acquire(1000) == 100
@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+
+from elpis.engines.common.input.resample import RESAMPLE_FORMAT
+from elpis.engines.common.objects.resample_cache import ResampleCache
+from elpis.engines.common.utilities import file_digest
+from elpis.transformer import _default_audio_resampler
+
+
+def resampled(tmpdir, name: str, content: bytes) -> Path:
+    path = Path(tmpdir).joinpath(name)
+    path.write_bytes(content)
+    return path
+
+
+def test_put_and_get(tmpdir):
+    """
+    Entries are linked into the destination and keyed by format.
+    """
+    cache = ResampleCache(Path(tmpdir).joinpath('cache'))
+    key = cache.key('0' * 64, RESAMPLE_FORMAT)
+    destination = Path(tmpdir).joinpath('a.wav')
+    cache.put(key, resampled(tmpdir, 'out.wav', b'audio'), destination)
+    assert destination.read_bytes() == b'audio'
+    other = Path(tmpdir).joinpath('b.wav')
+    assert cache.get(key, other) and other.read_bytes() == b'audio'
+    assert not cache.get(cache.key('0' * 64, {**RESAMPLE_FORMAT, 'rate': 16000}), other)
+
+
+def test_least_recently_used_are_evicted(tmpdir):
+    """
+    Going over the size limit evicts the entries used longest ago.
+    """
+    cache = ResampleCache(Path(tmpdir).joinpath('cache'), max_size=25)
+    keys = [cache.key(f'{i}' * 64, RESAMPLE_FORMAT) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.put(key, resampled(tmpdir, 'out.wav', b'x' * 10), Path(tmpdir).joinpath(f'{i}.wav'))
+        os.utime(cache.entry_path(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    assert cache.get(keys[0], Path(tmpdir).joinpath('again.wav'))
+    cache.put(keys[2], resampled(tmpdir, 'out.wav', b'x' * 10), Path(tmpdir).joinpath('2.wav'))
+    assert cache.entry_path(keys[0]).exists()
+    assert not cache.entry_path(keys[1]).exists()
+    assert cache.entry_path(keys[2]).exists()
+    # Datasets keep their links to evicted entries
+    assert Path(tmpdir).joinpath('1.wav').read_bytes() == b'x' * 10
+
+
+def test_default_resampler_uses_cache(tmpdir):
+    """
+    Audio resampled for another dataset is not resampled again.
+    """
+    cache = ResampleCache(Path(tmpdir).joinpath('cache'))
+    source = resampled(tmpdir, 'recording.mp3', b'source audio')
+    cache.put(cache.key(file_digest(source), RESAMPLE_FORMAT),
+              resampled(tmpdir, 'out.wav', b'resampled audio'), Path(tmpdir).joinpath('elsewhere.wav'))
+    resampled_dir = Path(tmpdir).joinpath('resampled')
+    added = {}
+    _default_audio_resampler([f'{source}'], f'{resampled_dir}', lambda id, path: added.update({id: path}),
+                             f'{tmpdir}', resample_cache=cache)
+    assert added == {'recording': f'{resampled_dir.joinpath("recording.wav")}'}
+    assert resampled_dir.joinpath('recording.wav').read_bytes() == b'resampled audio'
+
+
+def test_put_does_not_list_the_cache(tmpdir, monkeypatch):
+    """
+    The cache is only listed once to count its size, and again when it is
+    over the limit.
+    """
+    cache = ResampleCache(Path(tmpdir).joinpath('cache'), max_size=95)
+    listed = []
+    entries = ResampleCache._entries
+    monkeypatch.setattr(ResampleCache, '_entries', lambda self: listed.append(1) or entries(self))
+    for i in range(10):
+        cache.put(cache.key(f'{i:064}', RESAMPLE_FORMAT), resampled(tmpdir, 'out.wav', b'x' * 10),
+                  Path(tmpdir).joinpath(f'{i}.wav'))
+    assert len(listed) == 2
+    assert len(list(cache.path.glob('*/*.wav'))) == 9
@@ -7,17 +7,24 @@ Contributors:
 """
 
 import os
+import hashlib
 import importlib
 import json
+import multiprocessing
 import shutil
 import threading
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from inspect import signature
 from multiprocessing.dummy import Pool
-from typing import Callable, Dict, List, Optional, Set, Union
+from typing import Callable, Dict, Iterator, List, Optional, Set, Union
 from pathlib import Path
 
-from elpis.engines.common.input.resample_audio import process_item
+from elpis.engines.common.errors import ResampleError
+from elpis.engines.common.input.resample import RESAMPLE_FORMAT
+from elpis.engines.common.input.resample_audio import RESAMPLE_WORKERS, process_item
+from elpis.engines.common.utilities import available_cpus, file_digest, iter_annotations, write_annotations
 
 # A json_str is the same as a normal string except must always be deserializable into JSON as an invariant.
 json_str = str
@@ -25,12 +32,20 @@ json_str = str
 AnnotationFunction = Callable[[Dict], None]
 AddAudioFunction = Callable[[str, str], None]
 FileImporterType = Callable[[List[str], Dict, AnnotationFunction], None]
+SingleFileImporterType = Callable[[str, Dict, AnnotationFunction, str], None]
+AnnotationStore = Dict[str, List[Dict]]  # id -> annotations
 DirImporterType = Callable[[str, Dict, AnnotationFunction, AddAudioFunction], None]
 AudioProcessingFunction = Callable[[List[str], Dict, AddAudioFunction], None]
 SettingsChangeCallback = Callable[[dict, dict], None]
+ProgressCallback = Callable[[int, int, Dict[str, str]], None]
 PathList = List[str]  # a list of paths to file
 FilteredPathList = Dict[str, PathList]
 
+# Number of transcription files imported at the same time by import_file
+# callbacks, the number of available CPUs if 0. Can be set with the
+# ELPIS_IMPORT_WORKERS environment variable.
+IMPORT_WORKERS = int(os.environ.get('ELPIS_IMPORT_WORKERS', 0))
+
 # WARNING: All other python files in this directory with the exception of this one should be a data transformer.
 
 # Note: An instanciated data transformer can be used for on multiple datasets so a data transformer can be told to clean up it's variables for the next run by calling the clean_up function. can use @dt.on_cleanup to attach anything to this process.
@@ -91,6 +106,9 @@ class DataTransformer:
 
         # annotation_store: collection of (ID -> List[annotation obj]) pairs
         self._annotation_store = {}
+        # annotation_ids: IDs of the annotations imported by process(), when
+        # they were not all kept in the annotation store (see get_annotation_ids)
+        self._annotation_ids = None
         # audio_store: collection of (ID -> audio_file_path) pairs
         self._audio_store = {}
 
@@ -98,6 +116,7 @@ class DataTransformer:
 
         self._validaters = {}
         self._ui_updater = None  # Gets replaced by callback (used on file addition)
+        self._ui_cache_path = None  # Where the ui updater may keep what it read from files
         self._extentions = []
 
     def process(self):
@@ -119,6 +138,14 @@ class DataTransformer:
     def get_settings(self):
         return self._callback_get_config()['settings']
 
+    def get_annotation_ids(self) -> List[str]:
+        """
+        IDs of the annotations imported by the last process().
+        """
+        if self._annotation_ids is not None:
+            return list(self._annotation_ids)
+        return list(self._annotation_store)
+
     def set_setting(self, key, value):
         """
         Ensures the callback is called when the context is modified.
@@ -142,7 +169,10 @@ class DataTransformer:
 
     def refresh_ui(self, file_paths):
         config = self._callback_get_config()
-        ui = self._ui_updater(file_paths, config['ui'])
+        if len(signature(self._ui_updater).parameters) == 3:
+            ui = self._ui_updater(file_paths, config['ui'], self._ui_cache_path)
+        else:
+            ui = self._ui_updater(file_paths, config['ui'])
         config['ui'] = ui
         self._callback_set_config(config)
 
@@ -196,6 +226,7 @@ class DataTransformerAbstractFactory:
 
         # Concrete import/export function collection
         self._import_extension_callbacks: Dict[str, FileImporterType] = {}
+        self._import_file_callbacks: Dict[str, SingleFileImporterType] = {}
         self._import_file_validator_callback: Dict[str, Callable] = {}
         self._import_directory_callback: Callable = None
         self._export_callback: Callable = None
@@ -279,6 +310,8 @@ class DataTransformerAbstractFactory:
             raise RuntimeError('import_directory used, therefore cannot use import_files')
         elif extention in self._import_extension_callbacks:
             raise RuntimeError(f'"{extention}" has already been registered with import_files decorator')
+        elif extention in self._import_file_callbacks:
+            raise RuntimeError(f'"{extention}" has already been registered with import_file decorator')
 
         self._ext_to_factory[extention] = self._name
 
@@ -300,6 +333,65 @@ class DataTransformerAbstractFactory:
             return f
         return decorator
 
+    def import_file(self, extention: str):
+        """
+        Python Decorator with single argument (extention).
+
+        Like import_files, but the decorated function (f) imports one file at
+        a time, so that files can be imported in parallel (in a process pool
+        of IMPORT_WORKERS processes). It should always have four parameters,
+        being:
+            1. The path of a file with the specified extention.
+            2. A dictionary context variable that can be used to access
+                specialised settings.
+            3. A callback to add annotation data to audio files.
+            4. Path to a temporary directory
+
+        f must be picklable (defined at the top level of its module) and must
+        only pass its results through the add_annotation callback, as it may
+        run in another process. The annotations of all files are merged in
+        file path order, whatever order the files are imported in.
+
+        If called directly from the DataTransformer object, only the file
+        path argument should be passed to the function.
+
+        This decorator cannot be used with the import_directory decorator.
+
+        :param extention: extention to map the callback (decorated function) to.
+        :return: a python decorator
+        :raises:
+            RuntimeError: if import_directory is already used.
+            RuntimeError: if the extention is aleady registered.
+            NameError: if the decorated function name is repeated or invalid.
+            RuntimeError: if the decorated function does not have four parameters.
+        """
+        if self._import_directory_callback is not None:
+            raise RuntimeError('import_directory used, therefore cannot use import_file')
+        elif extention in self._import_extension_callbacks:
+            raise RuntimeError(f'"{extention}" has already been registered with import_files decorator')
+        elif extention in self._import_file_callbacks:
+            raise RuntimeError(f'"{extention}" has already been registered with import_file decorator')
+
+        self._ext_to_factory[extention] = self._name
+
+        def decorator(f: Callable):
+            if f.__name__ in self._attributes:
+                raise NameError('bad function name. Already used')
+            if f.__name__ in dir(DataTransformer):
+                raise NameError('bad function name. Name is attribute of DataTransformer')
+
+            sig = signature(f)
+            if len(sig.parameters) != 4:
+                raise RuntimeError(f'import function "{f.__name__}" must have four parameters, currently has {len(sig.parameters)}')
+
+            # Store the closure by file extention
+            self._import_file_callbacks[extention] = f
+            # Store attribute
+            self._attributes[f.__name__] = f
+            self._obj_to_attr_name[f] = f.__name__
+            return f
+        return decorator
+
     def validate_files(self, extention: str):
         # TODO: Docs
         if self._import_directory_callback is not None:
@@ -326,6 +418,16 @@ class DataTransformerAbstractFactory:
         return decorator
 
     def update_ui(self, f):
+        """
+        Python Decorator (no arguments)
+
+        Store the decorated function as the callback that updates the UI
+        (e.g. the options of settings) when files are added or removed. It is
+        given the paths of all the files and the UI, and returns the new UI.
+        If it has a third parameter, it is also given a file path where it may
+        cache what it reads from the files between calls (None if the importer
+        was built without a ui_cache_path).
+        """
         self._update_ui_callback = f
         return f
 
@@ -358,7 +460,7 @@ class DataTransformerAbstractFactory:
         """
         if self._import_directory_callback is not None:
             raise RuntimeError('import_directory already specified')
-        if len(self._import_extension_callbacks) != 0:
+        if len(self._import_extension_callbacks) != 0 or len(self._import_file_callbacks) != 0:
             raise RuntimeError('import_files used, therefore cannot use import_directory')
         if f.__name__ in self._attributes:
             raise NameError('bad function name. Already used')
@@ -536,7 +638,7 @@ class DataTransformerAbstractFactory:
     def is_import_capable(self):
         if self._import_directory_callback is not None:
             return True
-        if len(self._import_extension_callbacks) != 0:
+        if len(self._import_extension_callbacks) != 0 or len(self._import_file_callbacks) != 0:
             return True
         return False
 
@@ -556,8 +658,33 @@ class DataTransformerAbstractFactory:
                        transcription_json_file_path: str,
                        get_config_callback,
                        set_config_callback,
-                       settings_change_callback: SettingsChangeCallback
+                       settings_change_callback: SettingsChangeCallback,
+                       state_file_path: Optional[str] = None,
+                       resample_cache=None,
+                       progress_callback: Optional[ProgressCallback] = None,
+                       audio_format: Optional[Dict[str, int]] = None,
+                       ui_cache_path: Optional[str] = None
                        ) -> DataTransformer:
+        """
+        Build an importer for the collection at collection_path.
+
+        If state_file_path is given, process() keeps the fingerprints of the
+        files it imported (and what it got from them) in that file, and on
+        the next run only resamples and imports the files that are new or
+        have changed since (see _import_incrementally).
+
+        If resample_cache is given (a ResampleCache), the default audio
+        resampler takes resampled audio from it, and puts audio it resamples
+        into it. It reports its progress to progress_callback (if given)
+        each time a file is done, with the number of files done, the total
+        number of files and the files that failed so far (path -> reason).
+
+        The default audio resampler resamples to audio_format (bits, channels
+        and rate), RESAMPLE_FORMAT by default.
+
+        ui_cache_path is given to the update_ui callback (see update_ui).
+        """
+        audio_format = audio_format or RESAMPLE_FORMAT
         # check arguments
         if not Path(collection_path).is_dir():
             raise RuntimeError('path to collection does not exist')
@@ -594,12 +721,7 @@ class DataTransformerAbstractFactory:
 
         def add_annotation(id, obj):
             nonlocal dt
-            # check the object type
-            if type(obj) != dict:
-                raise TypeError('annotation top level variable must be a dictionary')
-            fields = { 'audio_file_name', 'transcript', 'start_ms', 'stop_ms', 'speaker_id'}
-            if set(obj.keys()) != fields:
-                raise TypeError('annotation object contains an incorrect field name')
+            _check_annotation(obj)
             # add the annotation
             if id in dt._annotation_store:
                 dt._annotation_store[id].append(obj)
@@ -651,11 +773,9 @@ class DataTransformerAbstractFactory:
                 callback()
 
                 # save transcription data to file
-                with Path(transcription_json_file_path).open(mode='w') as fout:
-                    annotations = []
-                    for id in dt._annotation_store:
-                        annotations.extend(dt._annotation_store[id])
-                    fout.write(json.dumps(annotations))
+                write_annotations(transcription_json_file_path,
+                                  (annotation for id in dt._annotation_store
+                                   for annotation in dt._annotation_store[id]))
                 return # import_directory_process
             setattr(dt, 'process', import_directory_process) # Override this function
         else:
@@ -680,11 +800,29 @@ class DataTransformerAbstractFactory:
                         temporary_directory_path
                     )
                 setattr(dt, self._obj_to_attr_name[f], wrapper)
+            # make wrapper for import_file (accepts one argument)
+            for _ext, f in self._import_file_callbacks.items():
+
+                def wrapper(file_path: str, f=f):
+                    """
+                    Attribute that is assigned to the DataTransformer. This
+                    Handler must only import the given file.
+                    """
+                    return f(
+                        file_path,
+                        copyJSONable(dt.get_settings()),
+                        add_annotation,
+                        temporary_directory_path
+                    )
+                setattr(dt, self._obj_to_attr_name[f], wrapper)
             # Construct the process function
             audio_processing_callback = self._audio_processing_callback
             if audio_processing_callback is None:
-                audio_processing_callback = _default_audio_resampler
+                audio_processing_callback = partial(_default_audio_resampler, resample_cache=resample_cache,
+                                                    progress_callback=progress_callback,
+                                                    audio_format=audio_format)
             import_extension_callbacks = self._import_extension_callbacks
+            import_file_callbacks = self._import_file_callbacks
             audio_extention = self._audio_extention
 
             def import_files_process():
@@ -701,10 +839,20 @@ class DataTransformerAbstractFactory:
                 nonlocal temporary_directory_path
                 nonlocal audio_processing_callback
                 nonlocal import_extension_callbacks
+                nonlocal import_file_callbacks
                 nonlocal audio_extention
 
                 extention_to_files: FilteredPathList = _filter_files_by_extention(collection_path)
 
+                if state_file_path is not None:
+                    annotations = _import_incrementally(dt, extention_to_files, state_file_path, resampled_path,
+                                                        add_audio, temporary_directory_path,
+                                                        audio_processing_callback, audio_extention,
+                                                        import_extension_callbacks, import_file_callbacks,
+                                                        reset_annotations, add_annotation, audio_format)
+                    write_annotations(transcription_json_file_path, annotations)
+                    return  # import_files_process
+
                 # process audio
                 if audio_extention in extention_to_files: # skip if there are no audio files to process
                     audio_paths: PathList = extention_to_files.pop(audio_extention)
@@ -716,13 +864,18 @@ class DataTransformerAbstractFactory:
                     callback = import_extension_callbacks.get(extention, None)
                     if callback is not None:
                         callback(file_paths, dt.get_settings(), reset_annotations, add_annotation, temporary_directory_path)
+                    file_callback = import_file_callbacks.get(extention, None)
+                    if file_callback is not None:
+                        file_paths = sorted(file_paths)
+                        for annotations in _import_per_file(file_callback, file_paths, dt.get_settings(),
+                                                            temporary_directory_path):
+                            for id, file_annotations in annotations.items():
+                                dt._annotation_store.setdefault(id, []).extend(file_annotations)
 
                 # save transcription data to file
-                with Path(transcription_json_file_path).open(mode='w') as fout:
-                    annotations = []
-                    for id in dt._annotation_store:
-                        annotations.extend(dt._annotation_store[id])
-                    fout.write(json.dumps(annotations))
+                write_annotations(transcription_json_file_path,
+                                  (annotation for id in dt._annotation_store
+                                   for annotation in dt._annotation_store[id]))
                 return  # import_files_process
             setattr(dt, 'process', import_files_process) # Override this function
 
@@ -732,6 +885,7 @@ class DataTransformerAbstractFactory:
 
         # Add ui refresher
         dt._ui_updater = self._update_ui_callback
+        dt._ui_cache_path = ui_cache_path
 
         # Add handable extentions
         dt._extentions = self._import_file_validator_callback.keys()
@@ -779,7 +933,12 @@ def make_importer(name: str,
                   transcription_json_file_path: str,
                   get_config_callback,
                   set_config_callback,
-                  settings_change_callback=_default_settings_change_callback
+                  settings_change_callback=_default_settings_change_callback,
+                  state_file_path: Optional[str] = None,
+                  resample_cache=None,
+                  progress_callback: Optional[ProgressCallback] = None,
+                  audio_format: Optional[Dict[str, int]] = None,
+                  ui_cache_path: Optional[str] = None
                   ) -> DataTransformer:
     if name not in DataTransformerAbstractFactory._transformer_factories:
         raise ValueError(f'data transformer factory with name "{name}" not found')
@@ -793,7 +952,12 @@ def make_importer(name: str,
         transcription_json_file_path,
         get_config_callback,
         set_config_callback,
-        settings_change_callback
+        settings_change_callback,
+        state_file_path=state_file_path,
+        resample_cache=resample_cache,
+        progress_callback=progress_callback,
+        audio_format=audio_format,
+        ui_cache_path=ui_cache_path
     )
     return dt
 
@@ -847,39 +1011,330 @@ def _filter_files_by_extention(dir_path: str) -> Dict[str, List[str]]:
     return extention_to_files
 
 
-def _default_audio_resampler(audio_paths: List[str], resampled_dir_path: str, add_audio: AddAudioFunction, temp_dir_path: str):
+def _default_audio_resampler(audio_paths: List[str], resampled_dir_path: str, add_audio: AddAudioFunction, temp_dir_path: str,
+                             resample_cache=None, progress_callback: Optional[ProgressCallback] = None,
+                             workers: int = None, audio_format: Dict[str, int] = None):
     """
     A default audio resampler that converts any media accepted by sox to a
-    standard format specified in process_item.
+    standard format specified in process_item. Audio already in the
+    resample_cache (if given) is not resampled again.
+
+    Files are resampled by workers threads each running sox (RESAMPLE_WORKERS
+    or the number of available CPUs by default), and moved into place as soon
+    as they are done. A file that sox fails on does not stop the others, the
+    failures are raised together at the end.
     :param audio_paths: list of paths to audio files to resample.
     :param resampled_dir_path: path to a directory to save the resampled files to.
     :param add_audio: callback to register the audio with the importer.
     :param temp_dir_path: path to a temporary directory, will exist before the
         function runs and will be deleted immediately after the function ends.
         Must be the last parameter as this path is prepended on build().
+    :param resample_cache: (Optional) a ResampleCache shared with other datasets.
+    :param progress_callback: (Optional) called each time a file is done, see build_importer.
+    :param workers: (Optional) number of files to resample at the same time.
+    :param audio_format: (Optional) bits, channels and rate to resample to, RESAMPLE_FORMAT by default.
+    :raises:
+        ResampleError: if sox failed on, or timed out on, any of the files.
     """
 
     temp_dir_path = Path(temp_dir_path)
     resampled_dir_path = Path(resampled_dir_path)
 
-    # Empty resampled contents
-    if resampled_dir_path.exists():
-        shutil.rmtree(f'{resampled_dir_path}')
+    # Resampled files of other audio are kept, incremental imports only
+    # resample the audio that changed.
     resampled_dir_path.mkdir(parents=True, exist_ok=True)
 
+    def destination(audio_path: str) -> Path:
+        file_name = Path(audio_path).name
+        id = '.'.join(file_name.split('.')[:-1])
+        return resampled_dir_path.joinpath(f'{id}.wav')
+
+    audio_format = audio_format or RESAMPLE_FORMAT
+    total = len(audio_paths)
+    cache_keys = {}
+    if resample_cache is not None:
+        to_resample = []
+        for audio_path in audio_paths:
+            cache_keys[audio_path] = resample_cache.key(file_digest(audio_path), audio_format)
+            if resample_cache.get(cache_keys[audio_path], destination(audio_path)):
+                add_audio(destination(audio_path).stem, f'{destination(audio_path)}')
+            else:
+                to_resample.append(audio_path)
+        audio_paths = to_resample
+
     process_lock = threading.Lock()
     temporary_directories = set()
-    map_arguments = [(index, audio_path, process_lock, temporary_directories, temp_dir_path)
-                        for index, audio_path in enumerate(audio_paths)]
+
+    def resample(indexed_audio_path):
+        index, audio_path = indexed_audio_path
+        try:
+            audio_file = process_item((index, audio_path, process_lock, temporary_directories, temp_dir_path),
+                                      audio_format)
+        except ResampleError as error:
+            return audio_path, None, f'{error}'
+        return audio_path, audio_file, None
+
+    done = total - len(audio_paths)
+    failures: Dict[str, str] = {}
+    if progress_callback is not None:
+        progress_callback(done, total, failures)
+    if len(audio_paths) == 0:
+        return
     # Multi-Threaded Audio Re-sampling
-    with Pool() as pool:
-        outputs = pool.map(process_item, map_arguments)
-        for audio_file in outputs:
-            shutil.move(audio_file, resampled_dir_path)
-            file_name = Path(audio_file).name
-            id = '.'.join(file_name.split('.')[:-1])
-            resampled_file_path = f'{resampled_dir_path.joinpath(file_name)}'
-            add_audio(id, resampled_file_path)
+    with Pool(workers or RESAMPLE_WORKERS or available_cpus()) as pool:
+        for audio_path, audio_file, failure in pool.imap_unordered(resample, enumerate(audio_paths)):
+            if failure is not None:
+                failures[audio_path] = failure
+            else:
+                resampled_file_path = destination(audio_path)
+                if resample_cache is not None:
+                    resample_cache.put(cache_keys[audio_path], audio_file, resampled_file_path)
+                else:
+                    # The temporary directory may be on another file system
+                    shutil.move(audio_file, resampled_file_path)
+                add_audio(resampled_file_path.stem, f'{resampled_file_path}')
+            done += 1
+            if progress_callback is not None:
+                progress_callback(done, total, failures)
+    if len(failures) != 0:
+        raise ResampleError(f'could not resample {len(failures)} of {total} audio files', failures)
+
+
+def _check_annotation(obj):
+    """
+    :raises:
+        TypeError: if obj is not an annotation dictionary.
+    """
+    if type(obj) != dict:
+        raise TypeError('annotation top level variable must be a dictionary')
+    fields = { 'audio_file_name', 'transcript', 'start_ms', 'stop_ms', 'speaker_id'}
+    if set(obj.keys()) != fields:
+        raise TypeError('annotation object contains an incorrect field name')
+
+
+def _import_one_file(callback: SingleFileImporterType, file_path: str, settings: Dict,
+                     temporary_directory_path: str) -> AnnotationStore:
+    """
+    Import one file with an import_file callback.
+
+    :return: the annotations of the file.
+    """
+    annotations: AnnotationStore = {}
+
+    def add_annotation(id, obj):
+        _check_annotation(obj)
+        annotations.setdefault(id, []).append(obj)
+
+    callback(file_path, settings, add_annotation, temporary_directory_path)
+    return annotations
+
+
+def _import_per_file(callback: SingleFileImporterType, file_paths: PathList, settings: Dict,
+                     temporary_directory_path: str, workers: Optional[int] = None) -> Iterator[AnnotationStore]:
+    """
+    Import the files with an import_file callback, sharing them between
+    workers processes (IMPORT_WORKERS or the number of available CPUs by
+    default). Files are imported in this process if there is only one worker.
+
+    :return: the annotations of each file, in the order of file_paths, as
+        they are imported.
+    """
+    workers = min(workers or IMPORT_WORKERS or available_cpus(), len(file_paths))
+    import_one = partial(_import_one_file, callback, settings=settings,
+                         temporary_directory_path=temporary_directory_path)
+    if workers <= 1:
+        for file_path in file_paths:
+            yield import_one(file_path)
+        return
+    # A few chunks per worker, so that workers given large files are not left behind
+    chunksize = max(1, len(file_paths) // (workers * 4))
+    # Workers are spawned rather than forked, forking the (threaded) server
+    # could copy locks other threads hold into the workers.
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield from executor.map(import_one, file_paths, chunksize=chunksize)
+
+
+def _settings_hash(settings: Dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def _fingerprint(file_path: Path, previous: Optional[Dict]) -> Dict:
+    """
+    Size, modification time and content digest of the file. The content is
+    only hashed again if the size or modification time changed.
+    """
+    stat = file_path.stat()
+    if previous is not None and (previous['size'], previous['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        digest = previous['digest']
+    else:
+        digest = file_digest(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+
+
+def _annotations_directory(state_file_path: Path) -> Path:
+    """
+    Where _import_incrementally keeps the annotations of each file.
+    """
+    return state_file_path.with_name(f'{state_file_path.stem}_annotations')
+
+
+def _write_file_annotations(file_path: Path, annotations: AnnotationStore):
+    """
+    Write the annotations of one file (as JSON Lines, see write_annotations)
+    with their IDs.
+    """
+    write_annotations(file_path, ({'id': id, 'annotation': annotation}
+                                  for id, id_annotations in annotations.items()
+                                  for annotation in id_annotations))
+
+
+def _merge_file_annotations(annotations_directory: Path, entries: List[Dict]) -> Iterator[Dict]:
+    """
+    The annotations of the files of entries (state entries, see
+    _import_incrementally), grouped by ID like the annotation store does,
+    read from their annotation files one at a time. A file is read once for
+    each of its IDs, so once with the usual one ID (audio file) per file.
+    """
+    entries_of_id: Dict[str, List[Dict]] = {}
+    for entry in entries:
+        for id in entry['annotation_ids']:
+            entries_of_id.setdefault(id, []).append(entry)
+    for id, id_entries in entries_of_id.items():
+        for entry in id_entries:
+            single_id = len(entry['annotation_ids']) == 1
+            for line in iter_annotations(annotations_directory.joinpath(entry['annotation_file'])):
+                if single_id or line['id'] == id:
+                    yield line['annotation']
+
+
+def _import_incrementally(dt: DataTransformer,
+                          extention_to_files: FilteredPathList,
+                          state_file_path: str,
+                          resampled_path: str,
+                          add_audio: AddAudioFunction,
+                          temporary_directory_path: str,
+                          audio_processing_callback: Callable,
+                          audio_extention: str,
+                          import_extension_callbacks: Dict[str, FileImporterType],
+                          import_file_callbacks: Dict[str, SingleFileImporterType],
+                          reset_annotations: Callable,
+                          add_annotation: Callable,
+                          audio_format: Dict[str, int]) -> Iterator[Dict]:
+    """
+    Fill the audio store of dt, only resampling and importing the files that
+    are new or changed since the state in state_file_path was saved, and save
+    the new state.
+
+    Audio files are fingerprinted by their content and the format they are
+    resampled to, transcription files by their content and the import
+    settings. Transcription files are imported
+    one at a time (in parallel for import_file callbacks) and their
+    annotations written to a file of their own (in _annotations_directory),
+    which the state points to. The state itself only holds fingerprints.
+
+    :return: the annotations of all the files, merged in file name order and
+        read one at a time from the annotation files. dt.get_annotation_ids()
+        gives their IDs.
+    """
+    state_file_path = Path(state_file_path)
+    annotations_directory = _annotations_directory(state_file_path)
+    annotations_directory.mkdir(exist_ok=True)
+    previous: Dict[str, Dict] = {}
+    if state_file_path.is_file():
+        with state_file_path.open() as fin:
+            previous = json.load(fin)['files']
+    current: Dict[str, Dict] = {}
+    settings = dt.get_settings()
+    # Annotations depend on the importer as well as on its settings
+    settings_hash = _settings_hash([dt.get_name(), settings])
+
+    # process audio
+    dt._audio_store = {}
+    to_resample: PathList = []
+    for audio_path in sorted(extention_to_files.get(audio_extention, [])):
+        name = Path(audio_path).name
+        entry = previous.get(name)
+        fingerprint = _fingerprint(Path(audio_path), entry)
+        if (entry is not None and entry['digest'] == fingerprint['digest'] and entry.get('format') == audio_format
+                and entry.get('resampled') is not None and Path(entry['resampled']).is_file()):
+            fingerprint.update(id=entry['id'], resampled=entry['resampled'], format=audio_format)
+            add_audio(entry['id'], entry['resampled'])
+        else:
+            to_resample.append(audio_path)
+        current[name] = fingerprint
+    if len(to_resample) != 0:
+        audio_store = dt._audio_store
+        dt._audio_store = {}
+        audio_processing_callback(to_resample, resampled_path, add_audio, temporary_directory_path)
+        resampled = dt._audio_store
+        dt._audio_store = {**audio_store, **resampled}
+        for audio_path in to_resample:
+            id = '.'.join(Path(audio_path).name.split('.')[:-1])
+            current[Path(audio_path).name].update(id=id, resampled=resampled.get(id), format=audio_format)
+    # Drop the resampled files of audio that is gone
+    in_use = {entry.get('resampled') for entry in current.values()}
+    for name, entry in previous.items():
+        if name not in current and entry.get('resampled') not in in_use:
+            if entry.get('resampled') is not None and Path(entry['resampled']).is_file():
+                Path(entry['resampled']).unlink()
+
+    # process transcription data
+    for extention, file_paths in extention_to_files.items():
+        # only process the file type collection if a handler exists for it
+        callback = import_extension_callbacks.get(extention, None)
+        file_callback = import_file_callbacks.get(extention, None)
+        if extention == audio_extention or (callback is None and file_callback is None):
+            continue
+        to_import = []
+        for file_path in sorted(file_paths):
+            name = Path(file_path).name
+            entry = previous.get(name)
+            fingerprint = _fingerprint(Path(file_path), entry)
+            fingerprint.update(settings_hash=settings_hash)
+            current[name] = fingerprint
+            if (entry is not None and entry['digest'] == fingerprint['digest']
+                    and entry.get('settings_hash') == settings_hash
+                    and entry.get('annotation_file') is not None
+                    and annotations_directory.joinpath(entry['annotation_file']).is_file()):
+                fingerprint.update(annotation_file=entry['annotation_file'], annotation_ids=entry['annotation_ids'])
+            else:
+                to_import.append(file_path)
+
+        def import_one_at_a_time():
+            for file_path in to_import:
+                dt._annotation_store = {}
+                callback([file_path], settings, reset_annotations, add_annotation, temporary_directory_path)
+                yield dt._annotation_store
+
+        if file_callback is not None:
+            imported = _import_per_file(file_callback, to_import, settings, temporary_directory_path)
+        else:
+            imported = import_one_at_a_time()
+        for file_path, annotations in zip(to_import, imported):
+            fingerprint = current[Path(file_path).name]
+            # Named after what the annotations come from, so that a file that
+            # changes back never gets the annotations of its other content
+            annotation_file = hashlib.sha256(
+                f'{Path(file_path).name}\0{fingerprint["digest"]}\0{settings_hash}'.encode()).hexdigest() + '.jsonl'
+            _write_file_annotations(annotations_directory.joinpath(annotation_file), annotations)
+            fingerprint.update(annotation_file=annotation_file, annotation_ids=list(annotations))
+        dt._annotation_store = {}
+
+    temporary_state_path = state_file_path.with_name(f'.{state_file_path.name}.tmp')
+    with temporary_state_path.open(mode='w') as fout:
+        json.dump({'files': current}, fout)
+    os.replace(temporary_state_path, state_file_path)
+
+    # Drop the annotation files of files that are gone or changed
+    in_use = {entry['annotation_file'] for entry in current.values() if 'annotation_file' in entry}
+    in_use |= {f'{annotation_file}.idx' for annotation_file in in_use}
+    for annotation_path in annotations_directory.iterdir():
+        if annotation_path.name not in in_use:
+            annotation_path.unlink()
+
+    entries = [current[name] for name in sorted(current) if 'annotation_file' in current[name]]
+    dt._annotation_ids = list(dict.fromkeys(id for entry in entries for id in entry['annotation_ids']))
+    return _merge_file_annotations(annotations_directory, entries)
 
 
 # Add your transformer to import_list.py and it will be loaded globally
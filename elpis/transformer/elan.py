@@ -9,20 +9,23 @@ Contributors:
               Nicholas Buckeridge - (The University of Queensland, 2019)
 """
 
+import json
 import re
 import string
 import sys
 import os
+import tempfile
 import nltk
 import codecs
 from csv import reader
+from xml.etree import ElementTree
 from pympi.Elan import Eaf
 from langid.langid import LanguageIdentifier, model
 from nltk.corpus import words
-from typing import Callable, Dict, List, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 from pathlib import Path
 
-from elpis.engines.common.input.clean_json import clean_json_utterance
+from elpis.engines.common.input.clean_json import Cleaner
 
 from elpis.transformer import DataTransformerAbstractFactory
 
@@ -99,60 +102,270 @@ def elan_validator(file_paths: List[Path]):
     print("validating:", file_paths)
     return None
 
+
+# (start_ms, stop_ms, value, participant) of an annotation, times are None for
+# unaligned time slots.
+EafAnnotation = Tuple[Optional[int], Optional[int], str, str]
+
+
+def _time_value(time_slots: Dict[str, Optional[str]], time_slot_id: str) -> Optional[int]:
+    time_value = time_slots[time_slot_id]
+    return None if time_value is None else int(time_value)
+
+
+def _parse_eaf(eaf_path: Union[str, Path], target):
+    """
+    Feed the eaf file to an XMLParser with the given target, which gets the
+    start and end of each element (and text, if it has a data method) without
+    elements being built.
+
+    :return: the target.
+    """
+    parser = ElementTree.XMLParser(target=target)
+    with open(eaf_path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(1 << 16), b''):
+            parser.feed(chunk)
+    parser.close()
+    return target
+
+
+class _EafTierTarget(object):
+    """
+    XMLParser target keeping the time slots and linguistic types of an eaf
+    file, and the annotations of the tiers that could be selected by
+    tier_order, tier_type or tier_name.
+    """
+    def __init__(self, tier_order: Union[int, str], tier_type: str, tier_name: str):
+        self.tier_order = tier_order
+        self.tier_type = tier_type
+        self.tier_name = tier_name
+        self.time_slots: Dict[str, Optional[str]] = {}
+        self.linguistic_types: Set[str] = set()
+        self.tier_count = 0
+        self.by_order: Optional[str] = None
+        self.by_type: Optional[str] = None
+        # tier id -> [participant, [(time slot 1, time slot 2, value)], has reference annotations]
+        self.candidates: Dict[str, List] = {}
+        self._tier: Optional[List] = None  # the candidate being read
+        self._time_slot_refs: Optional[Tuple[str, str]] = None
+        self._value: Optional[List[str]] = None
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        if tag == 'ANNOTATION_VALUE':
+            if self._time_slot_refs is not None:
+                self._value = []
+        elif tag == 'ALIGNABLE_ANNOTATION':
+            if self._tier is not None:
+                self._time_slot_refs = (attrib['TIME_SLOT_REF1'], attrib['TIME_SLOT_REF2'])
+        elif tag == 'TIME_SLOT':
+            self.time_slots[attrib['TIME_SLOT_ID']] = attrib.get('TIME_VALUE')
+        elif tag == 'REF_ANNOTATION':
+            if self._tier is not None:
+                self._tier[2] = True
+        elif tag == 'TIER':
+            tier_id = attrib['TIER_ID']
+            if isinstance(self.tier_order, int) and self.tier_count == self.tier_order:
+                self.by_order = tier_id
+            if self.by_type is None and attrib.get('LINGUISTIC_TYPE_REF') == self.tier_type:
+                self.by_type = tier_id
+            if tier_id in (self.by_order, self.by_type, self.tier_name):
+                self._tier = self.candidates[tier_id] = [attrib.get('PARTICIPANT', ''), [], False]
+            self.tier_count += 1
+        elif tag == 'LINGUISTIC_TYPE':
+            self.linguistic_types.add(attrib['LINGUISTIC_TYPE_ID'])
+
+    def data(self, data: str):
+        if self._value is not None:
+            self._value.append(data)
+
+    def end(self, tag: str):
+        if tag == 'ANNOTATION_VALUE':
+            if self._value is not None:
+                self._tier[1].append((*self._time_slot_refs, ''.join(self._value)))
+                self._time_slot_refs = self._value = None
+        elif tag == 'TIER':
+            self._tier = None
+
+    def close(self):
+        return self
+
+
+def read_eaf_tier(eaf_path: Union[str, Path],
+                  tier_order: Union[int, str] = '',
+                  tier_type: str = '',
+                  tier_name: str = '') -> Tuple[Optional[str], List[EafAnnotation]]:
+    """
+    Read the annotations of one tier of an eaf file, without building a model
+    of the whole file like pympi does: the file is streamed through an XML
+    parser, only the annotations of the tiers that could be selected are
+    kept, and time slots are only converted for those annotations.
+
+    The tier is selected like the Elan importer settings do: by tier_order if
+    it is an int (by tier_name if there is no tier at that position), else by
+    tier_type if the file has that linguistic type (the first tier of that
+    type), else by tier_name.
+
+    Annotations of reference tiers (which take their times from their
+    parent tiers) are read with pympi.
+
+    :return: the id of the selected tier (None if there is none) and its
+        annotations, in the order they are in the file.
+    """
+    eaf = _parse_eaf(eaf_path, _EafTierTarget(tier_order, tier_type, tier_name))
+    if isinstance(tier_order, int) and eaf.by_order is not None:
+        selected = eaf.by_order
+    elif not isinstance(tier_order, int) and tier_type in eaf.linguistic_types:
+        selected = eaf.by_type
+    elif tier_name in eaf.candidates:
+        selected = tier_name
+    else:
+        selected = None
+    if selected is None:
+        return None, []
+    participant, annotations, has_references = eaf.candidates[selected]
+    if has_references:
+        return selected, [(start, stop, value, participant) for start, stop, value, _
+                          in Eaf(f'{eaf_path}').get_annotation_data_for_tier(selected)]
+    return selected, [(_time_value(eaf.time_slots, time_slot_1), _time_value(eaf.time_slots, time_slot_2),
+                       value, participant)
+                      for time_slot_1, time_slot_2, value in annotations]
+
+
+class _EafTiersTarget(object):
+    """
+    XMLParser target keeping the tiers and linguistic types of an eaf file.
+    """
+    def __init__(self):
+        self.tiers: List[Tuple[str, Optional[str]]] = []  # (tier id, tier type) in file order
+        self.linguistic_types: List[str] = []
+
+    def start(self, tag: str, attrib: Dict[str, str]):
+        if tag == 'TIER':
+            self.tiers.append((attrib['TIER_ID'], attrib.get('LINGUISTIC_TYPE_REF')))
+        elif tag == 'LINGUISTIC_TYPE':
+            self.linguistic_types.append(attrib['LINGUISTIC_TYPE_ID'])
+
+    def end(self, tag: str):
+        pass
+
+    def close(self):
+        return self
+
+
+def read_eaf_tier_metadata(eaf_path: Union[str, Path]) -> Dict:
+    """
+    Read the tiers of an eaf file, skipping over its annotations.
+
+    :return: the tier ids of each tier type ("tier_types") and the number of
+        tiers ("tier_count") of the eaf file.
+    """
+    eaf = _parse_eaf(eaf_path, _EafTiersTarget())
+    tier_types: Dict[str, List[str]] = {tier_type: [] for tier_type in eaf.linguistic_types}
+    for tier_id, tier_type in eaf.tiers:
+        if tier_type in tier_types:
+            tier_types[tier_type].append(tier_id)
+    return {'tier_types': tier_types, 'tier_count': len(eaf.tiers)}
+
+
+class TierMetadataCache(object):
+    """
+    The tier types, tier names and number of tiers of eaf files, kept in a
+    JSON file so that each file is only parsed again when it changes (its
+    modification time or size).
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path is not None else None
+        self._entries: Dict[str, Dict] = {}
+        self._changed = False
+        if self.path is not None and self.path.is_file():
+            try:
+                with self.path.open() as fin:
+                    self._entries = json.load(fin)
+            except ValueError:
+                pass  # unreadable cache, parse the files again
+
+    def get(self, eaf_path) -> Dict:
+        """
+        :return: the tier ids of each tier type ("tier_types") and the number
+            of tiers ("tier_count") of the eaf file.
+        """
+        key = f'{Path(eaf_path).resolve()}'
+        stat = os.stat(eaf_path)
+        entry = self._entries.get(key)
+        if entry is None or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            entry = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                **read_eaf_tier_metadata(eaf_path)
+            }
+            self._entries[key] = entry
+            self._changed = True
+        return entry
+
+    def save(self, keep: Optional[Iterable] = None):
+        """
+        Write the cache if it changed, only keeping the files in keep (if given).
+        """
+        if keep is not None:
+            keep = {f'{Path(eaf_path).resolve()}' for eaf_path in keep}
+            for key in set(self._entries) - keep:
+                del self._entries[key]
+                self._changed = True
+        if self.path is None or not self._changed:
+            return
+        # A temporary file of its own, so that concurrent saves never write
+        # into the same file.
+        with tempfile.NamedTemporaryFile(mode='w', dir=self.path.parent, prefix=f'.{self.path.name}.',
+                                         suffix='.tmp', delete=False) as fout:
+            temporary_path = fout.name
+            try:
+                json.dump(self._entries, fout)
+            except BaseException:
+                fout.close()
+                os.unlink(temporary_path)
+                raise
+        os.replace(temporary_path, self.path)
+        self._changed = False
+
+
 @elan.update_ui
-def update_ui(file_paths: List[Path], ui):
+def update_ui(file_paths: List[Path], ui, cache_path: Optional[str] = None):
     """
     Iterate a dir of elan files and compiles info about all the files' tiers:
-    unique tier types, unique tier names, and the num of tiers
+    unique tier types, unique tier names, and the num of tiers. Only files
+    that are new or changed since the last call are parsed (see
+    TierMetadataCache).
     """
     # Use sets internally for easy uniqueness, conver to lists when done
     _tier_types: Set[str] = set(ui['data']['tier_type']['options'])
     _tier_names: Set[str] = set(ui['data']['tier_name']['options'])
-    tier_max_count = 0
-
-    print('**** ui data')
-    print(ui['data'])
-
-    print('**** _tier_types')
-    print(_tier_types)
 
     eaf_paths = [p for p in file_paths if f'{p}'.endswith('.eaf')]
-    for eaf_path in eaf_paths:
-        input_eaf = Eaf(eaf_path)
-        for tier_type in list(input_eaf.get_linguistic_type_names()):
-            _tier_types.add(tier_type)
-            tier_ids: List[str] = input_eaf.get_tier_ids_for_linguistic_type(
-                tier_type)
-            for tier_id in tier_ids:
-                _tier_names.add(tier_id)
-        # count the number of tiers, use the max from all files
-        tier_count = len(list(input_eaf.get_tier_names()))
-        if tier_count > tier_max_count:
-            tier_max_count = tier_count
+    cache = TierMetadataCache(cache_path)
+    tier_types, tier_names, tier_max_count = get_elan_tier_attributes(eaf_paths, cache)
+    cache.save(keep=eaf_paths)
+    _tier_types.update(tier_types)
+    _tier_names.update(tier_names)
 
     ui['data']['tier_type']['options'] = list(_tier_types)
     ui['data']['tier_name']['options'] = list(_tier_names)
     ui['data']['tier_order']['options'] = [i for i in range(tier_max_count)]
     return ui
 
-@elan.import_files('eaf')
-def import_eaf_file(eaf_paths: List[str],
+@elan.import_file('eaf')
+def import_eaf_file(eaf_path: str,
                     context: Dict[str, str],
-                    reset_annotations: Callable,
                     add_annotation: Callable,
                     tmp_dir):
     """
-    Import handler for processing .eaf files.
+    Import handler for processing an .eaf file. Files are imported one at a
+    time (in parallel), and the annotations of a file only depend on the file
+    and the settings.
 
-    :param eaf_paths: List of string paths to Elan files.
-    :param context: The settings that will be used to process data from the Elan files.
-    :param reset_annotations: Callback to wipe all annotations that have been previously read.
+    :param eaf_path: path to an Elan file.
+    :param context: The settings that will be used to process data from the Elan file.
         Settings such as the tier type/name/order will determine which annotations are read
-        into the dataset _annotation_store. When settings are changed—
-        (Wait, what? Users change their minds?? OMG yes.)
-        —reset_annotations will reset dataset _annotation_store to {}, ready for annotations derived from the new
-        settings to be added. Without this, changing settings will result in annotations derived from application
-        of new settings being appended to previous annotations.
+        into the dataset _annotation_store.
     :param add_annotation: Callback to append an annotation from selected tier
     :param tmp_dir: Honestly, no idea...
     """
@@ -160,101 +373,58 @@ def import_eaf_file(eaf_paths: List[str],
     tier_order = context['tier_order']
     tier_name = context['tier_name']
     tier_type = context['tier_type']
-    punctuation_to_collapse_by = context['punctuation_to_collapse_by']
-    punctuation_to_explode_by = context['punctuation_to_explode_by']
-    special_cases = set(context['special_cases'].splitlines())
-    translation_tags = set(context['translation_tags'].splitlines())
-
-    reset_annotations()
-
-    for input_elan_file in eaf_paths:
-        # Get paths to files
-        input_directory, full_file_name = os.path.split(input_elan_file)
-        file_name, extension = os.path.splitext(full_file_name)
-
-        input_eaf = Eaf(input_elan_file)
-        tier_types: List[str] = list(input_eaf.get_linguistic_type_names())
-        tier_names: List[str] = list(input_eaf.get_tier_names())
-
-        # Get annotations and parameters (things like speaker id) on the target tier
-        annotations: List[Tuple[str, str, str]] = []
-        annotation_data: List[dict] = []
-
-        # Try using tier_order. Watch out for mixed type, empty str if not selected, int if selected
-        if isinstance(tier_order, int):
-            try:
-                tier_name = tier_names[tier_order]
-                print(f"using tier order {tier_order} to get tier name {tier_name}")
-            except IndexError:
-                print("couldn't find a tier")
-                pass
-        else:
-            # else use tier type to get a tier name
-            if tier_type in tier_types:
-                print(f"found tier type {tier_type}")
-                tier_names = input_eaf.get_tier_ids_for_linguistic_type(tier_type)
-                tier_name = tier_names[0]
-                if tier_name:
-                    print(f"found tier name {tier_name}")
-            else:
-                print("tier type not found in this file")
-
-        if tier_name in tier_names:
-            print(f"using tier name {tier_name}")
-            annotations = input_eaf.get_annotation_data_for_tier(tier_name)
-        else:
-            pass  # TODO: Alert user of a skip due to missing tier_name in file
-
-        if annotations:
-            annotations = sorted(annotations)
-            parameters: Dict[str,str] = input_eaf.get_parameters_for_tier(tier_name)
-            speaker_id: str = parameters.get("PARTICIPANT", "")
-
-        for annotation in annotations:
-            start = annotation[0]
-            end = annotation[1]
-            annotation = annotation[2]
-
-            utterance = {
-                "audio_file_name": f"{file_name}.wav",
-                "transcript": annotation,
-                "start_ms": start,
-                "stop_ms": end,
-                "speaker_id": speaker_id
-            }
-
-            utterance_cleaned = clean_json_utterance(utterance=utterance,
-                                                     punctuation_to_collapse_by=punctuation_to_collapse_by,
-                                                     punctuation_to_explode_by=punctuation_to_explode_by,
-                                                     special_cases=special_cases,
-                                                     translation_tags=translation_tags,
-                                                     remove_english=False,
-                                                     use_langid=False)
-            add_annotation(file_name, utterance_cleaned)
-
-
-def get_elan_tier_attributes(input_eafs_files):
+    cleaner = Cleaner.from_settings(context)
+
+    input_directory, full_file_name = os.path.split(eaf_path)
+    file_name, extension = os.path.splitext(full_file_name)
+
+    # Get annotations and parameters (things like speaker id) on the target tier.
+    # Watch out for mixed type tier_order, empty str if not selected, int if selected
+    tier_name, annotations = read_eaf_tier(eaf_path, tier_order=tier_order, tier_type=tier_type,
+                                           tier_name=tier_name)
+    if tier_name is None:
+        print(f"couldn't find a tier in {full_file_name}")  # TODO: Alert user of a skip due to missing tier
+    else:
+        print(f"using tier name {tier_name}")
+    annotations = sorted(annotations)
+
+    utterances = [{
+        "audio_file_name": f"{file_name}.wav",
+        "transcript": annotation,
+        "start_ms": start,
+        "stop_ms": end,
+        "speaker_id": speaker_id
+    } for start, end, annotation, speaker_id in annotations]
+
+    for utterance_cleaned in cleaner.clean_many(utterances):
+        add_annotation(file_name, utterance_cleaned)
+
+
+def get_elan_tier_attributes(input_eafs_files, cache: Optional[TierMetadataCache] = None):
     """
     Iterate a dir of elan files and compiles info about all the files' tiers:
     unique tier types, unique tier names, and the num of tiers
+
+    :param cache: where to look up (and keep) the tiers of the files, an
+        in-memory TierMetadataCache by default.
     """
+    if cache is None:
+        cache = TierMetadataCache()
     # Use sets internally for easy uniqueness, conver to lists when done
     _tier_types: Set[str] = set()
     _tier_names: Set[str] = set()
     _tier_max_count: int = 0
     for file_ in input_eafs_files:
-        input_eaf = Eaf(file_)
-        for tier_type in list(input_eaf.get_linguistic_type_names()):
+        metadata = cache.get(file_)
+        for tier_type, tier_ids in metadata['tier_types'].items():
             _tier_types.add(tier_type)
-            tier_ids: List[str] = input_eaf.get_tier_ids_for_linguistic_type(
-                tier_type)
             for tier_id in tier_ids:
                 _tier_names.add(tier_id)
         # count the number of tiers, use the max from all files
-        tier_count = len(list(input_eaf.get_tier_names()))
+        tier_count = metadata['tier_count']
         if tier_count > _tier_max_count:
             _tier_max_count = tier_count
     tier_types = list(_tier_types)
     tier_names = list(_tier_names)
     tier_max_count = _tier_max_count
-    return (tier_types, tier_names, tier_max_count)
\ No newline at end of file
+    return (tier_types, tier_names, tier_max_count)
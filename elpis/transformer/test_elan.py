@@ -0,0 +1,119 @@
+import json
+import threading
+import pytest
+from pathlib import Path
+
+from pympi.Elan import Eaf, to_eaf
+
+from . import elan
+
+
+def write_eaf(path: Path, tiers, tier_type: str = 'default-lt'):
+    """
+    Write an eaf file with the given tiers, a mapping from tier id to a list
+    of (start_ms, stop_ms, value) annotations.
+    """
+    eaf = Eaf()
+    eaf.remove_tier('default')
+    eaf.add_linguistic_type(tier_type)
+    for tier_id, annotations in tiers.items():
+        eaf.add_tier(tier_id, ling=tier_type, part=f'{tier_id} speaker')
+        for start, stop, value in annotations:
+            eaf.add_annotation(tier_id, start, stop, value)
+    to_eaf(f'{path}', eaf)
+
+
+def test_tier_metadata_cache(tmpdir, monkeypatch):
+    """
+    Tiers of eaf files are only read again when the files change.
+    """
+    paths = [Path(tmpdir).joinpath(f'{name}.eaf') for name in ('a', 'b')]
+    write_eaf(paths[0], {'Phrase': [(0, 1000, 'one')]})
+    write_eaf(paths[1], {'Phrase': [(0, 1000, 'two')], 'Words': []})
+    cache_path = f'{tmpdir.join("cache.json")}'
+    parsed = []
+    read_eaf_tier_metadata = elan.read_eaf_tier_metadata
+    monkeypatch.setattr(elan, 'read_eaf_tier_metadata',
+                        lambda path: parsed.append(Path(path).name) or read_eaf_tier_metadata(path))
+
+    cache = elan.TierMetadataCache(cache_path)
+    tier_types, tier_names, tier_max_count = elan.get_elan_tier_attributes(paths, cache)
+    cache.save()
+    assert sorted(tier_names) == ['Phrase', 'Words'] and tier_max_count == 2
+    assert sorted(parsed) == ['a.eaf', 'b.eaf']
+
+    parsed.clear()
+    write_eaf(paths[0], {'Phrase': [(0, 1000, 'one')], 'Other': []})
+    cache = elan.TierMetadataCache(cache_path)
+    tier_types, tier_names, tier_max_count = elan.get_elan_tier_attributes(paths, cache)
+    assert sorted(tier_names) == ['Other', 'Phrase', 'Words']
+    assert parsed == ['a.eaf']
+
+
+def test_tier_metadata_cache_concurrent_saves(tmpdir):
+    """
+    Caches saved at the same time each write their own temporary file, so the
+    saved cache is always one of them, whole.
+    """
+    paths = [Path(tmpdir).joinpath(f'{index}.eaf') for index in range(20)]
+    for path in paths:
+        write_eaf(path, {'Phrase': [(0, 1000, 'one')]})
+    cache_path = f'{tmpdir.join("cache.json")}'
+    caches = [elan.TierMetadataCache(cache_path) for _ in range(8)]
+    for index, cache in enumerate(caches):
+        elan.get_elan_tier_attributes(paths[:index + 10], cache)
+    threads = [threading.Thread(target=cache.save) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    saved = json.loads(Path(cache_path).read_text())
+    assert 10 <= len(saved) <= 17
+    assert [path.name for path in Path(tmpdir).iterdir() if path.name.endswith('.tmp')] == []
+
+
+def pympi_tier(eaf_path, tier_order, tier_type, tier_name):
+    """
+    The tier the Elan importer selected with pympi, and its sorted annotations.
+    """
+    input_eaf = Eaf(f'{eaf_path}')
+    tier_names = list(input_eaf.get_tier_names())
+    if isinstance(tier_order, int):
+        if tier_order < len(tier_names):
+            tier_name = tier_names[tier_order]
+    elif tier_type in input_eaf.get_linguistic_type_names():
+        tier_names = input_eaf.get_tier_ids_for_linguistic_type(tier_type)
+        tier_name = tier_names[0]
+    if tier_name not in tier_names:
+        return None, []
+    participant = input_eaf.get_parameters_for_tier(tier_name).get('PARTICIPANT', '')
+    return tier_name, sorted((start, stop, value, participant) for start, stop, value, *_
+                             in input_eaf.get_annotation_data_for_tier(tier_name))
+
+
+@pytest.mark.parametrize('selection', [
+    (0, '', ''), (2, '', ''), (7, '', 'Words'), ('', 'words-lt', ''), ('', 'missing-lt', 'Phrase'),
+    ('', '', 'Phrase'), ('', '', 'Translation'), ('', '', 'Missing')
+])
+def test_read_eaf_tier(tmpdir, selection):
+    """
+    The streaming reader selects the same tier and gives the same annotations
+    as pympi.
+    """
+    path = Path(tmpdir).joinpath('a.eaf')
+    eaf = Eaf()
+    eaf.remove_tier('default')
+    eaf.add_linguistic_type('phrase-lt')
+    eaf.add_linguistic_type('words-lt')
+    eaf.add_linguistic_type('translation-lt', constraints='Symbolic_Association', timealignable=False)
+    eaf.add_tier('Phrase', ling='phrase-lt', part='Speaker A')
+    eaf.add_tier('Words', ling='words-lt', part='Speaker B')
+    eaf.add_tier('Translation', ling='translation-lt', parent='Phrase')
+    for index in range(20, 0, -1):
+        eaf.add_annotation('Phrase', index * 1000, index * 1000 + 900, f'phrase {index}')
+        eaf.add_annotation('Words', index * 1000, index * 1000 + 400, '' if index % 3 else f'word {index}')
+        eaf.add_ref_annotation('Translation', 'Phrase', index * 1000 + 10, f'translation {index}')
+    to_eaf(f'{path}', eaf)
+
+    tier_name, annotations = elan.read_eaf_tier(path, *selection)
+    assert (tier_name, sorted(annotations)) == pympi_tier(path, *selection)
@@ -1554,4 +1554,137 @@ def test_dt_add_annotaion_wrong_type(tdtaf, tmpdir):
 #     """
 #     Check that the default audio resampler produces new audio files.
 #     """
-#     pass
\ No newline at end of file
+#     pass
+
+from elpis.engines.common.utilities import iter_annotations
+
+
+def test_dt_incremental_process(tdtaf, tmpdir):
+    """
+    With a state file, process() only resamples and imports the files that
+    are new or changed, and keeps the annotations of the others.
+    """
+    resampled, imported = [], []
+
+    @tdtaf.replace_reprocess_audio
+    def resample(audio_paths, resampled_path, add_audio, temp_dir):
+        for audio_path in audio_paths:
+            resampled.append(Path(audio_path).name)
+            output_path = Path(resampled_path).joinpath(Path(audio_path).name)
+            shutil.copyfile(audio_path, output_path)
+            add_audio(Path(audio_path).stem, f'{output_path}')
+
+    @tdtaf.import_files('txt')
+    def import_txt(file_paths, ctx, reset_annotations, add_annotation, temp_dir):
+        reset_annotations()
+        for file_path in file_paths:
+            imported.append(Path(file_path).name)
+            add_annotation(Path(file_path).stem, {
+                'audio_file_name': f'{Path(file_path).stem}.wav',
+                'transcript': Path(file_path).read_text() + ctx['suffix'],
+                'start_ms': 0,
+                'stop_ms': 1000,
+                'speaker_id': ''
+            })
+    tdtaf.import_setting('suffix', default='')
+
+    collection = Path(tmpdir.mkdir('collection'))
+    for name in ('a', 'b'):
+        collection.joinpath(f'{name}.wav').write_bytes(name.encode())
+        collection.joinpath(f'{name}.txt').write_text(name)
+    config = {}
+    dt = make_importer(
+        TEST_FACTORY_TDTAF,
+        f'{collection}',
+        str(tmpdir.mkdir('resampled')),
+        str(tmpdir.mkdir('temporary')),
+        str(tmpdir.join('annotations.jsonl')),
+        lambda: config['importer'],
+        lambda importer_config: config.update(importer=importer_config),
+        state_file_path=str(tmpdir.join('import_state.json'))
+    )
+    dt.process()
+    assert sorted(resampled) == ['a.wav', 'b.wav'] and sorted(imported) == ['a.txt', 'b.txt']
+
+    resampled.clear(), imported.clear()
+    collection.joinpath('c.wav').write_bytes(b'c')
+    collection.joinpath('c.txt').write_text('c')
+    collection.joinpath('a.txt').write_text('changed')
+    dt.process()
+    assert resampled == ['c.wav'] and sorted(imported) == ['a.txt', 'c.txt']
+    assert sorted(dt._audio_store) == ['a', 'b', 'c']
+    annotations = list(iter_annotations(tmpdir.join('annotations.jsonl')))
+    assert [annotation['transcript'] for annotation in annotations] == ['changed', 'b', 'c']
+
+    assert sorted(dt.get_annotation_ids()) == ['a', 'b', 'c']
+    # The state only points to the annotations of each file
+    state = json.loads(tmpdir.join('import_state.json').read())
+    assert all('annotations' not in entry for entry in state['files'].values())
+    assert len(list(Path(tmpdir.join('import_state_annotations')).glob('*.jsonl'))) == 3
+
+    resampled.clear(), imported.clear()
+    dt.set_setting('suffix', '!')
+    collection.joinpath('b.txt').unlink()
+    dt.process()
+    assert resampled == [] and sorted(imported) == ['a.txt', 'c.txt']
+    annotations = list(iter_annotations(tmpdir.join('annotations.jsonl')))
+    assert [annotation['transcript'] for annotation in annotations] == ['changed!', 'c!']
+    assert len(list(Path(tmpdir.join('import_state_annotations')).glob('*.jsonl'))) == 2
+
+
+def import_txt_file(file_path, ctx, add_annotation, temp_dir):
+    """
+    An import_file callback, at the top level so that it can run in a worker
+    process.
+    """
+    for line in Path(file_path).read_text().splitlines():
+        add_annotation(Path(file_path).stem, {
+            'audio_file_name': f'{Path(file_path).stem}.wav',
+            'transcript': line,
+            'start_ms': 0,
+            'stop_ms': 1000,
+            'speaker_id': ''
+        })
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_dt_import_file_in_parallel(tdtaf, tmpdir, monkeypatch, incremental):
+    """
+    Files of import_file callbacks are imported in worker processes, and their
+    annotations merged in file name order.
+    """
+    from elpis import transformer
+    monkeypatch.setattr(transformer, 'IMPORT_WORKERS', 3)
+    tdtaf.import_file('txt')(import_txt_file)
+
+    collection = Path(tmpdir.mkdir('collection'))
+    for index in range(10):
+        collection.joinpath(f'{index}.txt').write_text(f'{index} one\n{index} two\n')
+    config = {}
+    dt = make_importer(
+        TEST_FACTORY_TDTAF,
+        f'{collection}',
+        str(tmpdir.mkdir('resampled')),
+        str(tmpdir.mkdir('temporary')),
+        str(tmpdir.join('annotations.jsonl')),
+        lambda: config['importer'],
+        lambda importer_config: config.update(importer=importer_config),
+        state_file_path=str(tmpdir.join('import_state.json')) if incremental else None
+    )
+    dt.process()
+    annotations = list(iter_annotations(tmpdir.join('annotations.jsonl')))
+    assert [annotation['transcript'] for annotation in annotations] == [
+        f'{index} {number}' for index in range(10) for number in ('one', 'two')]
+
+
+def test_factory_import_file_import_files(tdtaf):
+    """
+    An extention can only be registered with one of import_files and
+    import_file.
+    """
+    tdtaf.import_file('txt')(import_txt_file)
+    with pytest.raises(RuntimeError):
+        @tdtaf.import_files('txt')
+        def import_txt_files(file_paths, ctx, reset_annotations, add_annotation, temp_dir): # pylint: disable=unused-variable
+            pass
+    assert tdtaf.is_import_capable()